@@ -11,33 +11,35 @@ NOTE: MOVE MAF OUTPUT AND FORMATTER TO cBioPortal_utils.MafWriter !! DO NOT ADD
 -----
 """
 import sys
-import csv
-from cBioPortal_utils import MafReader
+
+# relative imports, from CLI and from parent project
+# NOTE: check the package instead of __name__ so that this also works when imported by another script; see maf_pipeline.py
+if __package__:
+    from .cBioPortal_utils import MafStage, run_maf_stages
+
+if not __package__:
+    from cBioPortal_utils import MafStage, run_maf_stages
+
+class AddAfStage(MafStage):
+    """
+    Add the t_af column to each row
+    """
+    columns = ['t_alt_count', 't_depth']
+
+    def get_fieldnames(self, fieldnames):
+        # add the AF column label
+        return(fieldnames + ['t_af'])
+
+    def transform(self, row):
+        # NOTE: In Python 2, division of two ints produces an int. In Python 3, it produces a float.
+        row['t_af'] = float(int(row['t_alt_count']) / int(row['t_depth']))
+        return(row)
 
 def main(input_file, output_file):
     """
     Main control function for the script
     """
-    maf_reader = MafReader(input_file)
-    fieldnames = maf_reader.get_fieldnames()
-    comment_lines = maf_reader.comment_lines
-
-    # add the AF column label
-    fieldnames.append('t_af')
-
-    with open(output_file, "w") as fout:
-        # write out the input comments
-        fout.writelines(comment_lines)
-
-        # ignore fields not in fieldnames
-        writer = csv.DictWriter(fout, delimiter = '\t', fieldnames = fieldnames, extrasaction = 'ignore', lineterminator='\n')
-        writer.writeheader()
-
-        # write out the input rows
-        for row in maf_reader.read():
-            # NOTE: In Python 2, division of two ints produces an int. In Python 3, it produces a float.
-            row['t_af'] = float(int(row['t_alt_count']) / int(row['t_depth']))
-            writer.writerow(row)
+    run_maf_stages(input_file, output_file, stages = [ AddAfStage() ])
 
 def parse():
     """
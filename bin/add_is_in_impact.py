@@ -4,8 +4,15 @@
 NOTE: MOVE MAF OUTPUT AND FORMATTER TO cBioPortal_utils.MafWriter !! DO NOT ADD MORE ONE-OFF MAF FORMATTING MODULES AND METHODS !!
 -----
 """
-import argparse,csv
-from cBioPortal_utils import MafReader
+import argparse
+
+# relative imports, from CLI and from parent project
+# NOTE: check the package instead of __name__ so that this also works when imported by another script; see maf_pipeline.py
+if __package__:
+    from .cBioPortal_utils import MafStage, run_maf_stages
+
+if not __package__:
+    from cBioPortal_utils import MafStage, run_maf_stages
 
 def load_IMPACT_data(filename, delimiter = '\t'):
     """
@@ -52,6 +59,29 @@ def is_in_IMPACT(gene, IMPACT_genes_l, NA_str = '.'):
         assays = ','.join(sorted(IMPACT_genes_l[gene])) # comma-delimited string of all the assays for the gene
     return(present_in_set, assays)
 
+class AddIsInImpactStage(MafStage):
+    """
+    Add the is_in_impact column, and optionally the impact_assays column, to each row
+    """
+    columns = ['Hugo_Symbol']
+
+    def __init__(self, IMPACT_genes_l, include_assay = False):
+        self.IMPACT_genes_l = IMPACT_genes_l
+        self.include_assay = include_assay
+
+    def get_fieldnames(self, fieldnames):
+        # add the new columns labels for output
+        fieldnames = fieldnames + ['is_in_impact']
+        if self.include_assay:
+            fieldnames.append('impact_assays')
+        return(fieldnames)
+
+    def transform(self, row):
+        present_in_set, assays = is_in_IMPACT(row['Hugo_Symbol'], self.IMPACT_genes_l)
+        row['is_in_impact'] = present_in_set
+        if self.include_assay:
+            row['impact_assays'] = assays
+        return(row)
 
 def parse_CLI_args():
     """
@@ -78,42 +108,8 @@ def main():
 
     IMPACT_genes_l=load_IMPACT_data(args.IMPACT_genes_files)
 
-    is_in_impact_added_output=[]
-
-    # parser for the input maf file
-    maf_reader = MafReader(args.input_file)
-
-    # write analysis files
-    with open(args.output_file,'w') as fout:
-
-        # load comments and columns labels from the input maf
-        comment_lines = maf_reader.comment_lines
-        fieldnames = maf_reader.get_fieldnames()
-
-        # add the new columns labels for output
-        fieldnames.append('is_in_impact')
-        if include_assay:
-            fieldnames.append('impact_assays')
-
-            # is_in_impact_added_output.append(row)
-
-        # write the comments back to the output
-        fout.writelines(comment_lines)
-
-        # start output csv parser
-        # ignore fields not in fieldnames
-        # NOTE: csv writer includes carriage returns that we dont want
-        # https://stackoverflow.com/questions/3191528/csv-in-python-adding-an-extra-carriage-return-on-windows
-        writer = csv.DictWriter(fout, delimiter = '\t', fieldnames = fieldnames, extrasaction = 'ignore', lineterminator='\n')
-        writer.writeheader()
-
-        # update each input row and write it to output
-        for row in maf_reader.read():
-            present_in_set, assays = is_in_IMPACT(row['Hugo_Symbol'],IMPACT_genes_l)
-            row['is_in_impact'] = present_in_set
-            if include_assay:
-                row['impact_assays'] = assays
-            writer.writerow(row)
+    stage = AddIsInImpactStage(IMPACT_genes_l, include_assay = include_assay)
+    run_maf_stages(args.input_file, args.output_file, stages = [ stage ])
 
 if __name__ == '__main__':
     main()
@@ -9,8 +9,15 @@ python3 bin/add_msi_status.py -i input_file.tsv -o output_file.tsv --header my_h
 NOTE: MOVE MAF OUTPUT AND FORMATTER TO cBioPortal_utils.MafWriter !! DO NOT ADD MORE ONE-OFF MAF FORMATTING MODULES AND METHODS !!
 -----
 """
-import os,sys,csv,argparse
-from cBioPortal_utils import MafReader
+import os,sys,argparse
+
+# relative imports, from CLI and from parent project
+# NOTE: check the package instead of __name__ so that this also works when imported by another script; see maf_pipeline.py
+if __package__:
+    from .cBioPortal_utils import MafStage, run_maf_stages
+
+if not __package__:
+    from cBioPortal_utils import MafStage, run_maf_stages
 
 def calc_msi(msi_score):
     msi_score = float(msi_score)
@@ -23,6 +30,24 @@ def calc_msi(msi_score):
         msi_type = 'Instable'
     return msi_type
 
+class AddMsiStatusStage(MafStage):
+    """
+    Add a column with the msi status for the MSI_SCORE of each row
+    """
+    # input comments are not written to the output table
+    keep_comments = False
+    columns = ['MSI_SCORE']
+
+    def __init__(self, header):
+        self.header = header
+
+    def get_fieldnames(self, fieldnames):
+        # add the new columns labels for output
+        return(fieldnames + [self.header])
+
+    def transform(self, row):
+        row[self.header] = calc_msi(row['MSI_SCORE'])
+        return(row)
 
 def main(**kwargs):
     """
@@ -33,43 +58,7 @@ def main(**kwargs):
     delim = kwargs.pop('delim', '\t')
     header = kwargs.pop('header', None)
 
-    if input_file:
-        fin = open(input_file)
-    else:
-        fin = sys.stdin
-
-    if output_file:
-        fout = open(output_file, "w")
-    else:
-        fout = sys.stdout
-
-    if header:
-        old_header = next(fin).strip()
-        new_header = old_header + delim + header + '\n'
-        fout.write(new_header)
-
-
-    maf_reader = MafReader(input_file)
-
-    # write analysis files
-    with open(output_file,'w') as fout:
-        fieldnames = maf_reader.get_fieldnames()
-
-        # add the new columns labels for output
-        fieldnames.append(header)
-
-        # start output csv parser
-        # ignore fields not in fieldnames
-        # NOTE: csv writer includes carriage returns that we dont want
-        # https://stackoverflow.com/questions/3191528/csv-in-python-adding-an-extra-carriage-return-on-windows
-        writer = csv.DictWriter(fout, delimiter = '\t', fieldnames = fieldnames, extrasaction = 'ignore', lineterminator='\n')
-        writer.writeheader()
-
-        # update each input row and write it to output
-        for row in maf_reader.read():
-            msi_status = calc_msi(row['MSI_SCORE'])
-            row[header] = msi_status
-            writer.writerow(row)
+    run_maf_stages(input_file, output_file, stages = [ AddMsiStatusStage(header) ])
 
 
 def parse():
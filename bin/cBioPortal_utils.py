@@ -12,9 +12,20 @@ pluto.tools.MafWriter
 https://github.com/mskcc/pluto/blob/e10fd75b9f384b8d13ff84f6c955e08b2c354b4f/tools.py#L687
 -----
 """
+import os
+import sys
 import csv
+import re
+import heapq
+import pickle
+import shutil
+import tempfile
 from collections import OrderedDict
-from typing import TextIO, List, Dict, Tuple
+from collections.abc import MutableMapping
+from operator import itemgetter
+from contextlib import ExitStack, contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import TextIO, List, Dict, Tuple, Iterable, Iterator, Union
 
 
 #
@@ -32,6 +43,11 @@ facets_data_keep_cols_map = { # old:new
 # remove these columns from data_clinical_sample.txt data while updating it with Facets Suite data
 sample_data_remove_cols = ["purity", "ploidy", "facets_version"]
 
+# cache files for the parsed Facets Suite .txt files are saved next to them with this suffix;
+# caches with a different version are rebuilt
+facets_cache_suffix = ".hisens.pkl"
+facets_cache_version = 2
+
 # for each of the given header columns in the original data clinical file,
 # need to add the following lines to the file
 # preceeding the header line
@@ -327,6 +343,8 @@ def create_file_lines(
     Create the lines in the file based on the provided clinical data
     First gets the header lines for the file, then generates each remaining line in the file
 
+    NOTE: use ClinicalWriter instead to write the rows straight to the file without holding all of the lines in memory
+
     Parameters
     ----------
     clinical_data: list
@@ -370,6 +388,70 @@ def create_file_lines(
         lines.append(line + '\n')
     return(lines)
 
+class ClinicalWriter(object):
+    """
+    Class for writing out a cBioPortal clinical data file, such as data_clinical_sample.txt and data_clinical_patient.txt
+
+    The four cBioPortal header lines and the column header are written when the writer is created,
+    then each row is written straight to the file handle; same output format as create_file_lines
+
+    The columns need to be known up front; if they are not, use get_fieldnames to scan the rows for them first
+
+    Examples:
+
+        with open(output_file, "w") as fout:
+            writer = ClinicalWriter(fout = fout, fieldnames = ['SAMPLE_ID', 'PATIENT_ID'])
+            for row in rows:
+                writer.writerow(row)
+
+        rows = [ {'SAMPLE_ID': 'Sample1'}, {'SAMPLE_ID': 'Sample2', 'PATIENT_ID': 'Patient2'} ]
+        with open(output_file, "w") as fout:
+            writer = ClinicalWriter(fout = fout, fieldnames = ClinicalWriter.get_fieldnames(rows))
+            writer.writerows(rows)
+    """
+    def __init__(self,
+            fout: TextIO, # an open text-based file handle
+            fieldnames: Iterable[str], # list of column headers, in output order
+            delimiter: str = '\t',
+            na_str: str = 'NA', # value for missing columns and None values in the rows
+            header_lines_map: Dict = header_lines_map
+            ) -> None:
+        self.fout = fout
+        self.fieldnames = [ f for f in fieldnames ]
+        self.delimiter = delimiter
+        self.na_str = na_str
+
+        # write the cBioPortal header lines and the column header
+        fout.writelines(generate_header_lines(self.fieldnames, delimiter = delimiter, header_lines_map = header_lines_map))
+        fout.write(delimiter.join(self.fieldnames) + '\n')
+
+    def writerow(self, row: Dict) -> None:
+        """
+        Write out a single row; columns that are missing from the row or have a None value are filled in with na_str
+        """
+        na_str = self.na_str
+        values = [ row.get(key) for key in self.fieldnames ]
+        # None values come from blank empty cells at the end of rows in the input files
+        self.fout.write(self.delimiter.join([ na_str if value is None else value for value in values ]) + '\n')
+
+    def writerows(self, rows: Iterable[Dict]) -> None:
+        """
+        Write out all the rows
+        """
+        for row in rows:
+            self.writerow(row)
+
+    @staticmethod
+    def get_fieldnames(rows: Iterable[Dict]) -> List[str]:
+        """
+        Get all the keys in all the rows, in the order that they are first seen; same column order as create_file_lines
+        """
+        fieldnames = {} # dicts keep insertion order
+        for row in rows:
+            for key in row.keys():
+                fieldnames[key] = None
+        return(list(fieldnames))
+
 
 def update_sample_data(sample_data: Dict, facets_data: Dict) -> Dict:
     """
@@ -389,11 +471,12 @@ def update_sample_data(sample_data: Dict, facets_data: Dict) -> Dict:
     dict
         an updted copy of the `sample_data` dict with matching values from the `facets_data` dict
     """
-    d = { k:v for k, v in sample_data.items() }
+    # NOTE: use copy() so that compact TableRow records only copy their updated values
+    d = sample_data.copy()
     sample_id = d['SAMPLE_ID']
     # add matching facets data
     if sample_id in facets_data:
-        d = { **d, **facets_data[sample_id] }
+        d.update(facets_data[sample_id])
     else:
         # add NA for the facets columns instead
         for k,v in facets_data_keep_cols_map.items():
@@ -405,7 +488,7 @@ def update_sample_data(sample_data: Dict, facets_data: Dict) -> Dict:
             d.pop(key)
     return(d)
 
-def parse_facets_data(rows: List[Dict]) -> Dict:
+def parse_facets_data(rows: Iterable[Dict]) -> Dict:
     """
     Need to dig through the data output by Facets Suite .txt files in order to return a dict of per sample info
     that has only the desired info from "hisens" rows
@@ -439,21 +522,106 @@ def parse_facets_data(rows: List[Dict]) -> Dict:
             data[sample_id] = d
     return(data)
 
-def load_facets_data(files: List[str]) -> Dict:
+def get_source_stamp(source_file: str) -> Tuple[str, float, int]:
+    """
+    Identify the exact version of a file that a cache was built from, by its path, modification time, and size
+    """
+    stat = os.stat(source_file)
+    return((os.path.abspath(source_file), stat.st_mtime, stat.st_size))
+
+def load_pickle_cache(cache_file: str, source_file: str, version: int):
+    """
+    Load the data from a cache file written by save_pickle_cache
+
+    Returns None if the cache file does not exist, was written with a different version of the cache format,
+    or was built from a different file than source_file, or from an older or newer copy of it
+    """
+    if not os.path.exists(cache_file):
+        return(None)
+    with open(cache_file, "rb") as fin:
+        cache = pickle.load(fin)
+    if cache.get('version') != version or cache.get('source') != get_source_stamp(source_file):
+        return(None)
+    return(cache['data'])
+
+def save_pickle_cache(data, cache_file: str, source_file: str, version: int) -> None:
+    """
+    Save data parsed from source_file to a cache file, along with the version of the cache format and the source file it was built from
+
+    NOTE: the cache is written to a temp file and then moved into place so that other processes never load a partial cache;
+    the temp file is removed if writing the cache fails
+    """
+    fd, tmp_file = tempfile.mkstemp(dir = os.path.dirname(os.path.abspath(cache_file)))
+    try:
+        with os.fdopen(fd, "wb") as fout:
+            pickle.dump({'version': version, 'source': get_source_stamp(source_file), 'data': data}, fout)
+        os.replace(tmp_file, cache_file)
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+
+def load_facets_file(filename: str, use_cache: bool = False) -> Dict:
+    """
+    Load the per sample data from the "hisens" rows of a single Facets Suite .txt file
+
+    The rows are streamed from the file into parse_facets_data, so the whole file is not held in memory
+
+    Parameters
+    ----------
+    filename: str
+        path to the Facets Suite .txt file
+    use_cache: bool
+        save the parsed data to a cache file next to the input file, and load it from there instead of parsing the file again
+        as long as the input file has not changed; if the cache file cannot be written, the data is still returned
+
+    Returns
+    -------
+    dict
+        a dict of facets hisens entries per sample, same as parse_facets_data
+    """
+    cache_file = filename + facets_cache_suffix
+    if use_cache:
+        data = load_pickle_cache(cache_file, filename, version = facets_cache_version)
+        if data is not None:
+            return(data)
+
+    with open(filename) as fin:
+        reader = csv.DictReader(fin, delimiter = '\t')
+        data = parse_facets_data(reader)
+
+    if use_cache:
+        try:
+            save_pickle_cache(data, cache_file, filename, version = facets_cache_version)
+        except OSError:
+            # the input file is probably in a read-only location
+            pass
+    return(data)
+
+def load_facets_data(files: List[str], threads: int = 1, use_cache: bool = False) -> Dict:
     """
     Load the data from all Facets Suite .txt files in the files list
+
+    If a sample is in more than one file, the data from the last file in the list is used
+
+    Parameters
+    ----------
+    files: list
+        paths to the Facets Suite .txt files
+    threads: int
+        number of files to load at the same time
+    use_cache: bool
+        cache the parsed data for each file; see load_facets_file
     """
     all_data = {}
-    for file in files:
-        all_facets_data = []
-        with open(file) as fin:
-            reader = csv.DictReader(fin, delimiter = '\t')
-            for row in reader:
-                all_facets_data.append(row)
-
-        # clean up the facets data to remove stuff we dont want and recalculate things
-        parsed_facets_data = parse_facets_data(all_facets_data)
-        all_data = {**all_data, **parsed_facets_data}
+    if threads > 1 and len(files) > 1:
+        with ThreadPoolExecutor(max_workers = threads) as executor:
+            # map keeps the results in the same order as the files
+            for parsed_facets_data in executor.map(lambda file: load_facets_file(file, use_cache = use_cache), files):
+                all_data.update(parsed_facets_data)
+    else:
+        for file in files:
+            all_data.update(load_facets_file(file, use_cache = use_cache))
     return(all_data)
 
 def parse_header_comments(filename: str, comment_char: str = '#') -> Tuple[List[str], int]:
@@ -469,18 +637,138 @@ def parse_header_comments(filename: str, comment_char: str = '#') -> Tuple[List[
             start_line -= 1
         reader = csv.DictReader(fin, delimiter = '\t') # header_line = next(fin)
         portal_lines = [ row for row in reader ]
+
+    NOTE: stops reading at the first non-comment line, the rest of the file is not scanned
     """
     comments = []
     start_line = 0
     # find the first line without comments
     with open(filename) as fin:
-        for i, line in enumerate(fin):
-            if line.startswith(comment_char):
-                comments.append(line.strip())
-                start_line += 1
+        for line in fin:
+            if not line.startswith(comment_char):
+                break
+            comments.append(line.strip())
+            start_line += 1
     return(comments, start_line)
 
+def parse_table_header(
+        fin: TextIO,
+        comment_char: str = '#',
+        delimiter: str = '\t') -> Tuple[List[str], List[str], int]:
+    """
+    Read the leading comment lines and the header line from an open table file handle in a single pass
+
+    Reading stops immediately after the header line, so the table rows are never scanned.
+    The returned offset is the position of the first data row, and can be passed to `fin.seek()`
+    in order to go straight to the table rows without re-reading the comments
+
+    NOTE: uses fin.readline() instead of iterating over fin because fin.tell() is not available during text file iteration
+
+    Parameters
+    ----------
+    fin: TextIO
+        an open text-based file handle positioned at the start of the file
+    comment_char: str
+        character that comment lines start with
+    delimiter: str
+        the table delimiter
+
+    Returns
+    -------
+    list
+        a list of the comment strings (stripped of whitespace)
+    list | None
+        a list of the column headers; None if the file has no header line
+    int | None
+        the file offset for the first data row after the header; None if fin is not seekable
+    """
+    comments = []
+    fieldnames = None
+    while True:
+        line = fin.readline()
+        if not line: # end of file
+            break
+        if line.startswith(comment_char):
+            comments.append(line.strip())
+            continue
+        header = next(csv.reader([line], delimiter = delimiter))
+        if header: # skip blank lines preceeding the header, same as csv.DictReader
+            fieldnames = header
+            break
+    # streams like stdin do not have a position; None in that case
+    offset = None
+    if fin.seekable():
+        offset = fin.tell()
+    return(comments, fieldnames, offset)
+
+def find_data_offset(fin, comment_char: str = '#') -> int:
+    """
+    Move a binary file handle past the comment lines and the header line of a table, and return the byte offset of the first data row
+
+    NOTE: use this instead of TableReader.data_offset when the byte position is needed;
+    text file tell() positions are not guaranteed to be byte offsets
+    """
+    comment_bytes = comment_char.encode()
+    while True:
+        line = fin.readline()
+        if not line:
+            break
+        if line.startswith(comment_bytes):
+            continue
+        if line.strip(b'\r\n'): # skip blank lines preceeding the header, same as csv.DictReader
+            break
+    return(fin.tell())
 
+# matches the line ends that are followed by an empty line
+blank_line_regex = re.compile(b'\n(?=\r?\n)')
+
+def count_table_lines(filename: str, offset: int = 0, block_size: int = 1024 * 1024) -> int:
+    """
+    Count the number of non-empty lines in a file after the given byte offset by counting the newline characters;
+    use find_data_offset to get the offset of the table rows
+
+    The file is read in large binary blocks that are extended to the end of the next line,
+    so that the counting is limited by the file read speed instead of line parsing
+
+    NOTE: quoted values can contain newlines so lines cannot be counted this way if the file has quotes;
+    returns None if a quote character is found so that the caller can fall back to a csv reader
+
+    Parameters
+    ----------
+    filename: str
+        path to the file
+    offset: int
+        the byte offset to start counting from
+    block_size: int
+        number of bytes to read at a time
+
+    Returns
+    -------
+    int | None
+        the number of non-empty lines, or None if the file has quote characters
+    """
+    num_lines = 0
+    with open(filename, 'rb') as fin:
+        fin.seek(offset)
+        while True:
+            # always end the block on a line boundary so each block starts at the start of a line
+            block = fin.read(block_size)
+            if not block:
+                break
+            if not block.endswith(b'\n'):
+                block += fin.readline()
+            if b'"' in block:
+                return(None)
+            num_lines += block.count(b'\n')
+            # the last line in the file might not end with a newline
+            if not block.endswith(b'\n') and block[block.rfind(b'\n') + 1:].strip(b'\r'):
+                num_lines += 1
+            # empty lines are skipped by csv.DictReader so do not count them
+            if block.startswith(b'\n') or block.startswith(b'\r\n'):
+                num_lines -= 1
+            if b'\n\n' in block or b'\n\r\n' in block:
+                num_lines -= len(blank_line_regex.findall(block))
+    return(num_lines)
 
 def is_TERT_promoter(
     mut: Dict,
@@ -513,14 +801,127 @@ def is_TERT_promoter(
 #
 
 
+class TableSchema(object):
+    """
+    The column layout of a table, shared by all of the TableRow records read from the table
+
+    Usage
+    -----
+    schema = TableSchema(fieldnames)
+    for row in schema.make_rows(csv.reader(fin, delimiter = '\t')):
+        print(row['Hugo_Symbol'])
+    """
+    __slots__ = ('fieldnames', 'index')
+
+    def __init__(self, fieldnames: List[str]) -> None:
+        self.fieldnames = tuple(fieldnames)
+        # NOTE: if there are duplicate column names, the last one wins; same as csv.DictReader
+        self.index = { name: i for i, name in enumerate(self.fieldnames) }
+
+    def make_rows(self, reader: Iterable[List[str]]) -> Iterator['TableRow']:
+        """
+        Make a TableRow for each list of values from a csv.reader
+
+        Empty lines are skipped and extra values are saved under the None key, same as csv.DictReader
+        """
+        num_fields = len(self.fieldnames)
+        for values in reader:
+            if not values:
+                continue
+            updates = None
+            if len(values) > num_fields:
+                updates = { None: values[num_fields:] }
+            yield(TableRow(self, values, updates))
+
+class TableRow(MutableMapping):
+    """
+    A compact, dict-like record for a table row
+
+    Rows keep the list of values from csv.reader and look up the column index from a TableSchema
+    that is shared by every row in the table, instead of storing a copy of all the column names in each row like csv.DictReader
+
+    Updates to the row are saved in a separate small dict on top of the original values,
+    so copy() only needs to copy the updates and not the whole row
+
+    NOTE: this is not a dict subclass; use dict(row) if a real dict is needed, such as for json.dumps
+    """
+    __slots__ = ('schema', '_values', '_updates')
+    # placeholder for columns that were deleted from the row
+    _deleted = object()
+
+    def __init__(self, schema: TableSchema, values: List[str], updates: Dict = None) -> None:
+        self.schema = schema
+        self._values = values
+        self._updates = updates
+
+    def __getitem__(self, key):
+        if self._updates is not None and key in self._updates:
+            value = self._updates[key]
+            if value is TableRow._deleted:
+                raise KeyError(key)
+            return(value)
+        i = self.schema.index[key]
+        if i < len(self._values):
+            return(self._values[i])
+        # missing values at the end of short rows are None, same as csv.DictReader
+        return(None)
+
+    def __setitem__(self, key, value):
+        if self._updates is None:
+            self._updates = {}
+        self._updates[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        if key in self.schema.index:
+            self[key] = TableRow._deleted
+        else:
+            del self._updates[key]
+
+    def __contains__(self, key):
+        if self._updates is not None and key in self._updates:
+            return(self._updates[key] is not TableRow._deleted)
+        return(key in self.schema.index)
+
+    def __iter__(self):
+        # original columns first, then new columns in the order they were added
+        for key in self.schema.index:
+            if key in self:
+                yield(key)
+        if self._updates is not None:
+            for key, value in self._updates.items():
+                if key not in self.schema.index and value is not TableRow._deleted:
+                    yield(key)
+
+    def __len__(self):
+        return(sum(1 for _ in self))
+
+    def __repr__(self):
+        return('{}({})'.format(self.__class__.__name__, dict(self)))
+
+    def copy(self) -> 'TableRow':
+        """
+        Return a copy of the row; the original values are shared with the copy, only the updates are copied
+        """
+        updates = None
+        if self._updates is not None:
+            updates = dict(self._updates)
+        return(TableRow(self.schema, self._values, updates))
+
 class TableReader(object):
     """
     Handler for reading a table with comments
 
     Allows for parsing file attributes and rows without loading the whole file into memory
 
+    The comments and header are found in a single pass that stops at the header line,
+    and the offset of the first data row is cached so that each call to read() seeks straight to the table rows
+
     NOTE: Input file must have column headers!
 
+    Use '-' as the filename to read the table from stdin; the rows can only be read once in that case
+
     Usage
     -----
     table_reader = TableReader(input_maf_file)
@@ -539,46 +940,172 @@ class TableReader(object):
         self.filename = filename
         self.comment_char = comment_char
         self.delimiter = delimiter
-        # get the comments from the file and find the beginning of the table header
-        self.comments, self.start_line = parse_header_comments(filename, comment_char = self.comment_char)
+        # get the comments, the table header, and the offset of the first row in one pass over the start of the file
+        with self.open_table() as fin:
+            self.comments, self.fieldnames, self.data_offset = parse_table_header(fin,
+                comment_char = self.comment_char,
+                delimiter = self.delimiter)
+        self.start_line = len(self.comments)
         self.comment_lines = [ c + '\n' for c in self.comments ]
 
+    def is_stdin(self) -> bool:
+        """
+        whether the table is read from stdin instead of a file
+        """
+        return(self.filename == '-')
+
+    @contextmanager
+    def open_table(self):
+        """
+        open the table file for reading; stdin is not closed afterwards
+        """
+        if self.is_stdin():
+            yield(sys.stdin)
+        else:
+            with open(self.filename,'r') as fin:
+                yield(fin)
+
     def get_reader(self, fin):
         """
-        returns the csv.DictReader for the table rows, skipping the comments
+        returns the csv.DictReader for the table rows, skipping the comments and header line
+
+        NOTE: fin must be a seekable handle opened on self.filename, or stdin right after the header was parsed
         """
-        start_line = self.start_line
-        # skip comment lines
-        while start_line > 0:
-            next(fin)
-            start_line -= 1
-        reader = csv.DictReader(fin, delimiter = self.delimiter)
+        # go straight to the first data row, the header was already parsed
+        if self.data_offset is not None:
+            fin.seek(self.data_offset)
+        reader = csv.DictReader(fin, delimiter = self.delimiter, fieldnames = self.get_fieldnames())
         return(reader)
 
     def get_fieldnames(self):
         """
         returns the list of fieldnames for the table
+
+        NOTE: returns a new copy of the list each time because callers often append extra output columns to it
         """
-        with open(self.filename,'r') as fin:
-            reader = self.get_reader(fin)
-            return(reader.fieldnames)
+        if self.fieldnames is None:
+            return(None)
+        return([ f for f in self.fieldnames ])
 
-    def read(self):
+    def read(self, compact: bool = False, columns: List[str] = None, include_lines: bool = False):
         """
         iterable to get the record rows from the table, skipping the comments
+
+        Parameters
+        ----------
+        compact: bool
+            return TableRow records that share the column names between all rows, instead of a dict for each row;
+            use this to cut down on memory and allocations for wide tables
+        columns: list
+            only include these columns in each row; requested columns that are not in the table are left out of the rows
+        include_lines: bool
+            return a tuple of (row, line) for each row, with the original text line from the file; requires columns
         """
-        with open(self.filename,'r') as fin:
-            reader = self.get_reader(fin)
+        if include_lines and columns is None:
+            raise ValueError("columns must be passed in order to include the lines")
+        # no header means there cannot be any rows either
+        if self.fieldnames is None:
+            return
+        with self.open_table() as fin:
+            if columns is not None:
+                if self.data_offset is not None:
+                    fin.seek(self.data_offset)
+                reader = self.read_columns(fin, columns = columns, include_lines = include_lines)
+            elif compact:
+                if self.data_offset is not None:
+                    fin.seek(self.data_offset)
+                reader = TableSchema(self.fieldnames).make_rows(csv.reader(fin, delimiter = self.delimiter))
+            else:
+                reader = self.get_reader(fin)
             for row in reader:
                 yield(row)
 
+    def read_values(self):
+        """
+        iterable to get the list of values from csv.reader for each record row in the table, skipping the comments and blank lines
+
+        The values are the same as they are in the file; short rows are not padded and extra values at the end of long rows are kept
+        """
+        # no header means there cannot be any rows either
+        if self.fieldnames is None:
+            return
+        with self.open_table() as fin:
+            if self.data_offset is not None:
+                fin.seek(self.data_offset)
+            for values in csv.reader(fin, delimiter = self.delimiter):
+                if values:
+                    yield(values)
+
+    def read_columns(self, fin: TextIO, columns: List[str], include_lines: bool = False):
+        """
+        iterable to get rows with only the requested columns from the table lines in fin
+
+        Lines are split on the delimiter directly instead of going through csv.DictReader,
+        so only the requested values are copied into each row
+
+        NOTE: lines with quote characters are parsed with csv.reader instead, same as the other read methods,
+        since quoted values can include delimiters and newlines
+        """
+        num_fields = len(self.fieldnames)
+        index = { name: i for i, name in enumerate(self.fieldnames) }
+        names = [ name for name in columns if name in index ]
+        indexes = [ index[name] for name in names ]
+        # NOTE: itemgetter returns a single value instead of a tuple when there is only one index
+        if len(indexes) == 1:
+            get_values = lambda values: (values[indexes[0]],)
+        elif indexes:
+            get_values = itemgetter(*indexes)
+        else:
+            get_values = lambda values: ()
+        for line in fin:
+            if '"' in line:
+                lines = [ line ]
+                values = next(csv.reader(self._continue_lines(line, fin, lines), delimiter = self.delimiter))
+                line = ''.join(lines)
+            else:
+                values = line.rstrip('\r\n').split(self.delimiter)
+                # empty lines are skipped, same as csv.DictReader
+                if values == ['']:
+                    values = []
+            if not values:
+                continue
+            # missing values at the end of short rows are None, same as csv.DictReader
+            if len(values) < num_fields:
+                values.extend([ None ] * (num_fields - len(values)))
+            row = dict(zip(names, get_values(values)))
+            if include_lines:
+                yield((row, line))
+            else:
+                yield(row)
+
+    @staticmethod
+    def _continue_lines(line: str, fin: TextIO, lines: List[str]) -> Iterator[str]:
+        """
+        yield the line, then any following lines from fin that csv.reader needs to finish the record, saving them in lines
+        """
+        yield(line)
+        for next_line in fin:
+            lines.append(next_line)
+            yield(next_line)
+
     def count(self):
         """
         Return the total number of records in the table
         """
-        num_records = 0
-        for _ in self.read():
-            num_records += 1
+        # no header means there cannot be any rows either
+        if self.fieldnames is None:
+            return(0)
+        if self.is_stdin():
+            return(sum(1 for _ in self.read(columns = [])))
+        with open(self.filename, 'rb') as fin:
+            offset = find_data_offset(fin, comment_char = self.comment_char)
+        num_records = count_table_lines(self.filename, offset = offset)
+        if num_records is None:
+            # the file has quotes; let csv handle quoted values that might span multiple lines
+            num_records = 0
+            # dont need any of the values in order to count the rows
+            for _ in self.read(columns = []):
+                num_records += 1
         return(num_records)
 
 class MafReader(TableReader):
@@ -588,6 +1115,64 @@ class MafReader(TableReader):
     def __init__(self, filename: str, comment_char: str = '#', delimiter: str = '\t') -> None:
         super().__init__(filename, comment_char, delimiter)
 
+class TableCollator(object):
+    """
+    Reader for the rows of several tables that share the same header, in the order of the files given
+
+    Replaces combining the files on disk with grep and head before reading them;
+    only the comments and header line of each file are read up front, then the rows of each file are streamed in turn.
+    Files without a header line have no rows and are skipped
+
+    NOTE: the comments of the individual files are not kept, since they usually differ between files
+
+    Usage
+    -----
+    collator = TableCollator(glob.glob("maf/*.muts.maf"))
+    fieldnames = collator.get_fieldnames()
+    records = [ rec for rec in collator.read() ]
+    """
+    def __init__(self, filenames: List[str], comment_char: str = '#', delimiter: str = '\t') -> None:
+        if not filenames:
+            raise ValueError("No input files to collate")
+        self.filenames = filenames
+        self.comments = []
+        self.comment_lines = []
+        self.readers = []
+        self.fieldnames = None
+        for filename in filenames:
+            reader = TableReader(filename, comment_char = comment_char, delimiter = delimiter)
+            if reader.fieldnames is None:
+                continue
+            if self.fieldnames is None:
+                self.fieldnames = reader.fieldnames
+            elif reader.fieldnames != self.fieldnames:
+                raise ValueError("Header of file {} does not match the header of file {}".format(filename, self.readers[0].filename))
+            self.readers.append(reader)
+
+    def get_fieldnames(self):
+        """
+        returns a new copy of the list of fieldnames shared by the tables
+        """
+        if self.fieldnames is None:
+            return(None)
+        return([ f for f in self.fieldnames ])
+
+    def read(self, compact: bool = False):
+        """
+        iterable to get the record rows from each table in turn; see TableReader.read
+        """
+        for reader in self.readers:
+            for row in reader.read(compact = compact):
+                yield(row)
+
+    def read_values(self):
+        """
+        iterable to get the list of values for the record rows from each table in turn; see TableReader.read_values
+        """
+        for reader in self.readers:
+            for values in reader.read_values():
+                yield(values)
+
 class MafWriter(object):
     """
     Class for writing out a .maf format file
@@ -723,3 +1308,260 @@ class MafWriter(object):
         # remove any extraneous fieldnames
         portal_fieldnames = [ f for f in portal_fieldnames if f in maf_filter_portal_file_cols_to_keep ]
         return(portal_fieldnames)
+
+class MafStage(object):
+    """
+    Base class for a streaming transformation applied to the rows of a maf file
+
+    Stages are chained together with run_maf_stages so that several updates can be applied
+    to a maf file with a single read and write of the file
+
+    Subclasses should override get_fieldnames to add or remove columns,
+    and transform to update each row; return None from transform to drop the row from the output
+
+    Examples:
+
+        class AddFooStage(MafStage):
+            def get_fieldnames(self, fieldnames):
+                return(fieldnames + ['foo'])
+            def transform(self, row):
+                row['foo'] = 'bar'
+                return(row)
+
+        run_maf_stages(input_file, output_file, stages = [ AddFooStage() ])
+    """
+    # whether the input file comments should be written to the output file
+    keep_comments = True
+    # the input columns used by the stage, so that the other columns do not need to be parsed;
+    # None if the stage needs the whole row
+    # NOTE: only set this for stages that do not change the values of any of the input columns
+    columns = None
+
+    def get_fieldnames(self, fieldnames: List[str]) -> List[str]:
+        """
+        Return the output fieldnames for the stage based on the fieldnames of the rows passed in
+        """
+        return(fieldnames)
+
+    def transform(self, row: Dict) -> Dict:
+        """
+        Update a single row; return None if the row should not be included in the output
+        """
+        return(row)
+
+    def process(self, rows: Iterable[Dict]) -> Iterator[Dict]:
+        """
+        Apply the stage to each row
+        """
+        for row in rows:
+            row = self.transform(row)
+            if row is not None:
+                yield(row)
+
+def run_maf_stages(input_file: str, output_file: str, stages: List[MafStage]) -> None:
+    """
+    Read the input maf file, pass its rows through each stage in order, and write the output maf file
+
+    The input comments are included in the output unless any of the stages has keep_comments = False
+
+    If all of the stages list the columns they use, only those columns and the input columns needed for the output
+    are parsed from each line. If the output also keeps all of the input columns in their original order,
+    the original lines are written back out with only the new column values appended to them
+
+    Parameters
+    ----------
+    input_file: str
+        path to the input maf file
+    output_file: str
+        path to the output maf file
+    stages: list
+        a list of MafStage objects to apply to the rows, in order
+
+    Use '-' for input_file or output_file to read from stdin or write to stdout, so that scripts can be piped together
+    """
+    maf_reader = MafReader(input_file)
+    input_fieldnames = maf_reader.get_fieldnames()
+    comment_lines = maf_reader.comment_lines
+    if not all([ stage.keep_comments for stage in stages ]):
+        comment_lines = []
+
+    fieldnames = input_fieldnames
+    for stage in stages:
+        fieldnames = stage.get_fieldnames(fieldnames)
+
+    # find the input columns that the stages need, if the stages listed them
+    columns = None
+    passthrough = False
+    if input_fieldnames is not None and all([ stage.columns is not None for stage in stages ]):
+        input_fieldnames_set = set(input_fieldnames)
+        new_fieldnames = fieldnames[len(input_fieldnames):]
+        passthrough = all([
+            fieldnames[:len(input_fieldnames)] == input_fieldnames,
+            len(input_fieldnames_set) == len(input_fieldnames), # duplicate column names would all get the value of the last one
+            not input_fieldnames_set.intersection(new_fieldnames)
+            ])
+        columns = [ c for stage in stages for c in stage.columns ]
+        if not passthrough:
+            # also need the input columns that get written to the output
+            columns.extend([ f for f in fieldnames if f in input_fieldnames_set ])
+
+    with ExitStack() as stack:
+        if output_file == '-':
+            fout = sys.stdout
+        else:
+            fout = stack.enter_context(open(output_file, "w"))
+        writer = MafWriter(fout = fout, fieldnames = fieldnames, comments_lines = comment_lines)
+        # writer for the new values that get appended to the original lines
+        line_writer = csv.writer(fout, delimiter = maf_reader.delimiter, lineterminator = '\n')
+        if passthrough:
+            rows = maf_reader.read(columns = columns, include_lines = True)
+        else:
+            rows = ( (row, None) for row in maf_reader.read(columns = columns) )
+
+        for row, line in rows:
+            # each row goes through all of the stages before the next row is read
+            for stage in stages:
+                row = stage.transform(row)
+                if row is None:
+                    break
+            if row is None:
+                continue
+            if passthrough:
+                write_passthrough_line(fout, line, row,
+                    input_fieldnames = input_fieldnames,
+                    new_fieldnames = new_fieldnames,
+                    writer = writer,
+                    line_writer = line_writer,
+                    delimiter = maf_reader.delimiter)
+            else:
+                writer.writerow(row)
+
+def write_passthrough_line(
+        fout: TextIO,
+        line: str,
+        row: Dict,
+        input_fieldnames: List[str],
+        new_fieldnames: List[str],
+        writer: 'MafWriter',
+        line_writer: 'csv.writer',
+        delimiter: str = '\t') -> None:
+    """
+    Write out an input table line with the values of the new columns from the row appended to it
+
+    Falls back to writing the full row with the writer if the line has quotes or the wrong number of values,
+    so that the output is the same as writing a row from csv.DictReader
+
+    Parameters
+    ----------
+    fout: TextIO
+        the output file handle
+    line: str
+        the original line from the input table
+    row: dict
+        the row for the line, with values for the new columns
+    input_fieldnames: list
+        the columns in the input table
+    new_fieldnames: list
+        the columns to append to the line
+    writer: MafWriter
+        the writer for the full output row
+    line_writer: csv.writer
+        the writer used to format the new values
+    """
+    stripped_line = line.rstrip('\r\n')
+    if '"' in line or stripped_line.count(delimiter) != len(input_fieldnames) - 1:
+        values = next(csv.reader(line.splitlines(True), delimiter = delimiter))
+        # missing values at the end of short rows are None, same as csv.DictReader
+        values.extend([ None ] * (len(input_fieldnames) - len(values)))
+        full_row = dict(zip(input_fieldnames, values))
+        for key in new_fieldnames:
+            full_row[key] = row.get(key)
+        writer.writerow(full_row)
+        return
+    if not new_fieldnames:
+        fout.write(stripped_line + '\n')
+        return
+    fout.write(stripped_line)
+    # NOTE: start the new values with an empty field so that the delimiter gets written after the original line,
+    # and so that a single empty value does not get written as "" by csv
+    line_writer.writerow([''] + [ row.get(key) for key in new_fieldnames ])
+
+def sort_table(
+        input_file: str,
+        output_file: str,
+        key: Union[str, List[str]],
+        delimiter: str = '\t',
+        comment_char: str = '#',
+        chunk_size: int = 500000) -> None:
+    """
+    Sort the rows of a table on the values in a column, without loading the whole table into memory
+
+    The rows are read in chunks of chunk_size, each chunk is sorted and written to a temporary file,
+    then the sorted chunks are merged into the output file. Rows with the same key value keep their original order.
+    The comment lines and the header line are copied to the output file unchanged
+
+    Parameters
+    ----------
+    input_file: str
+        path to the input table
+    output_file: str
+        path to the output sorted table
+    key: str | list
+        the column to sort the rows on, or a list of columns; values are compared as strings
+    chunk_size: int
+        the number of rows to sort in memory at a time
+    """
+    table_reader = TableReader(input_file, comment_char = comment_char, delimiter = delimiter)
+    fieldnames = table_reader.get_fieldnames()
+    if isinstance(key, str):
+        key = [ key ]
+    indexes = [ fieldnames.index(k) for k in key ]
+
+    def get_key(row):
+        # missing values at the end of short rows sort first
+        return(tuple([ row[i] if i < len(row) else '' for i in indexes ]))
+
+    # put the temp files next to the output file, the system temp dir might not have room for a large table
+    tmpdir = tempfile.mkdtemp(dir = os.path.dirname(os.path.abspath(output_file)))
+    try:
+        chunk_files = []
+        with open(input_file) as fin:
+            fin.seek(table_reader.data_offset)
+            chunk = []
+            # empty lines are skipped, same as csv.DictReader
+            for row in csv.reader(fin, delimiter = delimiter):
+                if not row:
+                    continue
+                chunk.append(row)
+                if len(chunk) >= chunk_size:
+                    chunk_files.append(write_sorted_chunk(chunk, get_key, tmpdir, len(chunk_files), delimiter))
+                    chunk = []
+            if chunk:
+                chunk_files.append(write_sorted_chunk(chunk, get_key, tmpdir, len(chunk_files), delimiter))
+            del chunk
+
+        with open(output_file, "w") as fout, ExitStack() as stack:
+            fout.writelines(table_reader.comment_lines)
+            writer = csv.writer(fout, delimiter = delimiter, lineterminator = '\n')
+            writer.writerow(fieldnames)
+            readers = [ csv.reader(stack.enter_context(open(f)), delimiter = delimiter) for f in chunk_files ]
+            # NOTE: heapq.merge keeps rows with equal keys in the order of the chunks, so the sort is stable
+            writer.writerows(heapq.merge(*readers, key = get_key))
+    finally:
+        shutil.rmtree(tmpdir)
+
+def write_sorted_chunk(chunk: List[List[str]], get_key, tmpdir: str, number: int, delimiter: str = '\t') -> str:
+    """
+    Sort a chunk of table rows and write them to a file in tmpdir for sort_table
+
+    Returns
+    -------
+    str
+        path to the chunk file
+    """
+    chunk.sort(key = get_key)
+    chunk_file = os.path.join(tmpdir, "chunk.{}.txt".format(number))
+    with open(chunk_file, "w") as fout:
+        writer = csv.writer(fout, delimiter = delimiter, lineterminator = '\n')
+        writer.writerows(chunk)
+    return(chunk_file)
@@ -5,9 +5,13 @@ Script to calculate TMB tumor mutational burden value
 
 num_variants / bases_covered * 1,000,000 = TMB in Megabases
 """
+import os
 import sys
+import csv
 import argparse
-from cBioPortal_utils import MafReader
+from collections import OrderedDict
+from cBioPortal_utils import MafReader, TableReader
+from tmb_variant_filter import TmbVariantFilterStage, filter_row
 
 def calc_from_values(
     num_variants, # str | float | int
@@ -48,15 +52,27 @@ def calc_from_values(
     '0.'
     """
     if _print or output_file:
-        import numpy
         if _print:
             fout = sys.stdout
         if output_file:
             fout = open(output_file, "w")
-        fout.write(numpy.format_float_positional(tmb, trim = '0', precision = 4) + '\n')
+        fout.write(format_tmb(tmb) + '\n')
 
     return(tmb)
 
+def format_tmb(tmb): # float
+    """
+    Format the TMB value for output without scientific notation; see calc_from_values
+    """
+    import numpy
+    return(numpy.format_float_positional(tmb, trim = '0', precision = 4))
+
+def is_pooled_normal(normal_id): # str
+    """
+    Check if the normal id is for a pooled normal sample, in which case the TMB should not be calculated
+    """
+    return('poolednormal' in normal_id.lower())
+
 def normal_override(
     normal_id, # str
     na_str = 'NA',
@@ -65,8 +81,7 @@ def normal_override(
     """
     Override function in case a normal id was passed and we need to skip TMB calculation
     """
-    normal_id = normal_id.lower()
-    is_bad = 'poolednormal' in normal_id
+    is_bad = is_pooled_normal(normal_id)
 
     if is_bad:
         if output_file:
@@ -101,13 +116,11 @@ def calc_from_file(
         sys.exit(0)
 
     # make sure the file has at least 1 line otherwise MafReader will not work
-    try:
-        with open(input_file) as fin:
-            _ = next(fin)
-    except StopIteration:
+    if os.path.getsize(input_file) == 0:
         raise Exception("The input file has no lines")
 
     # reader for variants in the file
+    # NOTE: count() counts the lines after the header without parsing them
     maf_reader = MafReader(input_file)
     num_variants = maf_reader.count()
     calc_from_values(
@@ -119,6 +132,101 @@ def calc_from_file(
         )
 
 
+def load_sample_values(filename, value_col, sample_col = 'SAMPLE_ID'): # -> OrderedDict
+    """
+    Load a table of values for each sample, such as the genome coverage or normal id for each sample
+    """
+    values = OrderedDict()
+    for row in TableReader(filename).read(columns = [sample_col, value_col]):
+        values[row[sample_col]] = row[value_col]
+    return(values)
+
+def find_maf_files(input_path): # -> list
+    """
+    Get the list of maf files to read from the input path, which can be a single maf file or a directory of maf files
+    """
+    if os.path.isdir(input_path):
+        return(sorted([ os.path.join(input_path, f) for f in os.listdir(input_path) if f.endswith('.maf') ]))
+    return([ input_path ])
+
+def count_sample_variants(maf_files, sample_col = 'Tumor_Sample_Barcode'): # -> OrderedDict
+    """
+    Count the variants that pass the TMB filter criteria for each sample in the maf files,
+    in the order that the samples are found
+
+    NOTE: applies tmb_variant_filter.filter_row so the input does not need to be filtered first
+    """
+    counts = OrderedDict()
+    columns = TmbVariantFilterStage.columns + [ sample_col ]
+    for maf_file in maf_files:
+        for row in MafReader(maf_file).read(columns = columns):
+            sample_id = row[sample_col]
+            if sample_id not in counts:
+                counts[sample_id] = 0
+            if filter_row(row):
+                counts[sample_id] += 1
+    return(counts)
+
+def calc_from_cohort(
+    input_path,
+    output_file,
+    genome_coverage = None, # str | float | int | None
+    coverage_file = None, # str or None
+    normals_file = None, # str or None
+    na_str = 'NA',
+    sample_col = 'Tumor_Sample_Barcode',
+    func = None # dummy arg for parser
+    ):
+    """
+    Calculate the TMB for every sample in a multi-sample maf file, or a directory of maf files, in a single pass
+
+    Each variant is checked with tmb_variant_filter.filter_row, and the passing variants are counted per sample.
+    Samples that used a pooled normal, or that do not have a genome coverage value, get the NA string instead of a TMB
+
+    Output is a table with SAMPLE_ID and CMO_TMB_SCORE columns, with the samples from the coverage file,
+    then the normals file, then the maf files, in order
+
+    Parameters
+    ----------
+    input_path: str
+        path to a maf file or a directory of .maf files
+    output_file: str
+        path to the output table
+    genome_coverage: str | float | int
+        the number of base pairs covered by the assay, used for all samples that are not in the coverage_file
+    coverage_file: str
+        table with SAMPLE_ID and GENOME_COVERAGE columns with the coverage for each sample
+    normals_file: str
+        table with SAMPLE_ID and NORMAL_ID columns with the normal used for each sample, to check for pooled normals
+    """
+    sample_coverages = OrderedDict()
+    if coverage_file:
+        sample_coverages = load_sample_values(coverage_file, value_col = 'GENOME_COVERAGE')
+    sample_normals = OrderedDict()
+    if normals_file:
+        sample_normals = load_sample_values(normals_file, value_col = 'NORMAL_ID')
+
+    sample_counts = count_sample_variants(find_maf_files(input_path), sample_col = sample_col)
+
+    sample_ids = OrderedDict()
+    for sample_id in list(sample_coverages.keys()) + list(sample_normals.keys()) + list(sample_counts.keys()):
+        sample_ids[sample_id] = True
+
+    with open(output_file, "w") as fout:
+        writer = csv.writer(fout, delimiter = '\t', lineterminator = '\n')
+        writer.writerow(['SAMPLE_ID', 'CMO_TMB_SCORE'])
+        for sample_id in sample_ids:
+            coverage = sample_coverages.get(sample_id, genome_coverage)
+            normal_id = sample_normals.get(sample_id, None)
+            if coverage is None or (normal_id and is_pooled_normal(normal_id)):
+                tmb = na_str
+            else:
+                tmb = format_tmb(calc_from_values(
+                    num_variants = sample_counts.get(sample_id, 0),
+                    genome_coverage = coverage,
+                    megabases = True))
+            writer.writerow([sample_id, tmb])
+
 def parse():
     """
     Parse command line arguments to run the script
@@ -147,6 +255,17 @@ def parse():
     from_file.add_argument('--na-str', dest = 'na_str', default = 'NA', help = 'Value to output if a pooled normal id was passed in with --normal-id')
     from_file.set_defaults(func = calc_from_file)
 
+    # parser to calculate TMB for all samples in a cohort
+    from_cohort = subparsers.add_parser('from-cohort', help = 'Calculate the TMB in Megabases for every sample in a multi-sample maf file or directory of maf files. Variants are filtered with the tmb_variant_filter.py criteria.')
+    from_cohort.add_argument('input_path', help = 'Maf file or directory of .maf files to read variants from')
+    from_cohort.add_argument('output_file', help = 'File to write the table of SAMPLE_ID and CMO_TMB_SCORE values to')
+    from_cohort.add_argument('--genome-coverage', dest = 'genome_coverage', default = None, help = 'Number of base pairs of the genome covered by the assay, for samples that are not in the --coverage-file')
+    from_cohort.add_argument('--coverage-file', dest = 'coverage_file', default = None, help = 'Table with SAMPLE_ID and GENOME_COVERAGE columns for the number of base pairs covered for each sample')
+    from_cohort.add_argument('--normals-file', dest = 'normals_file', default = None, help = 'Table with SAMPLE_ID and NORMAL_ID columns for the normal used with each tumor; samples with a pooled normal get the NA string instead')
+    from_cohort.add_argument('--na-str', dest = 'na_str', default = 'NA', help = 'Value to output for samples that used a pooled normal or have no genome coverage')
+    from_cohort.add_argument('--sample-col', dest = 'sample_col', default = 'Tumor_Sample_Barcode', help = 'Maf column with the sample ID for each variant')
+    from_cohort.set_defaults(func = calc_from_cohort)
+
 
     args = parser.parse_args()
     args.func(**vars(args))
@@ -21,11 +21,22 @@ NOTE: MOVE MAF OUTPUT AND FORMATTER TO cBioPortal_utils.MafWriter !! DO NOT ADD
 
 """
 import os
+import io
+import re
 import csv
 import sys
+import itertools
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import argparse
 
+# relative imports, from CLI and from parent project
+if __package__:
+    from .cBioPortal_utils import parse_table_header
+
+if not __package__:
+    from cBioPortal_utils import parse_table_header
+
 from signal import signal, SIGPIPE, SIG_DFL
 signal(SIGPIPE,SIG_DFL)
 """
@@ -39,37 +50,100 @@ def find_start_line(filename, comment_char = '#'):
     start_line = 0
     with open(filename) as fin:
         for i, line in enumerate(fin):
-            if line.startswith(comment_char):
-                start_line += 1
+            if not line.startswith(comment_char):
+                break
+            start_line += 1
     return(start_line)
 
-def get_all_comments(files, comment_char = '#', progress = False):
+def get_table_header(filename, delimiter = '\t', has_comments = False, comment_char = '#'):
     """
-    Retrives all the unique pre-header comment lines from all the files in the list
+    Read the comment lines and the header line from the start of a file; the rest of the file is not read
+
+    Parameters
+    ----------
+    filename: str
+        path to the input file
+    delimiter: str
+        the delimiter to use for the input file
+    has_comments: bool
+        whether the file has comment lines before the header line; if False, the first line is the header
+
+    Returns
+    -------
+    tuple
+        (comments, fieldnames, offset); the list of comment lines stripped of whitespace, the list of column names
+        (None for an empty file), and the file offset of the first row after the header line
+    """
+    with open(filename) as fin:
+        if has_comments:
+            comments, fieldnames, offset = parse_table_header(fin, comment_char = comment_char, delimiter = delimiter)
+        else:
+            comments = []
+            fieldnames = None
+            line = fin.readline()
+            if line:
+                fieldnames = next(csv.reader([line], delimiter = delimiter))
+            offset = fin.tell()
+    return(comments, fieldnames, offset)
+
+def get_table_headers(files, delimiter = '\t', has_comments = False, comment_char = '#', threads = 4, progress = False):
+    """
+    Read the comments, fieldnames, and data offset for each file in the list, in parallel across the files
+
+    Returns
+    -------
+    list
+        a list of (comments, fieldnames, offset) tuples from get_table_header, in the same order as the files
     """
     num_files = len(files)
-    comments = []
-    for i, f in enumerate(files):
-        if progress:
-            show_progress(
-                prefix = 'Parsing comments ',
-                num_done = i,
-                num_total = num_files,
-                current_item = f
-                )
-        with open(f) as fin:
-            for line in fin:
-                if line.startswith(comment_char):
-                    comment = line.strip()
-                    if comment not in comments:
-                        comments.append(comment)
-                else:
-                    break
+    headers = []
+    with ThreadPoolExecutor(max_workers = threads) as executor:
+        results = executor.map(
+            lambda f: get_table_header(f, delimiter = delimiter, has_comments = has_comments, comment_char = comment_char),
+            files)
+        for i, header in enumerate(results):
+            if progress:
+                show_progress(
+                    prefix = 'Parsing headers ',
+                    num_done = i,
+                    num_total = num_files,
+                    current_item = files[i]
+                    )
+            headers.append(header)
     if progress:
         show_progress(clear = True)
+    return(headers)
+
+def get_all_comments(files, comment_char = '#', progress = False, headers = None, collapse_prefixes = None):
+    """
+    Retrives all the unique pre-header comment lines from all the files in the list, in the order they are first seen
+
+    headers: list
+        the (comments, fieldnames, offset) for each file from get_table_headers; the files are read if these are not passed
+    collapse_prefixes: list
+        only keep the first comment line that starts with each of these prefixes, e.g. '# Versions:'
+    """
+    if headers is None:
+        headers = get_table_headers(files, has_comments = True, comment_char = comment_char, progress = progress)
+    if collapse_prefixes is None:
+        collapse_prefixes = []
+    comments = []
+    seen_comments = set()
+    seen_prefixes = set()
+    for file_comments, _, _ in headers:
+        for comment in file_comments:
+            if comment in seen_comments:
+                continue
+            seen_comments.add(comment)
+            prefix = next((p for p in collapse_prefixes if comment.startswith(p)), None)
+            if prefix is not None:
+                if prefix in seen_prefixes:
+                    continue
+                seen_prefixes.add(prefix)
+            comments.append(comment)
     return(comments)
 
-def get_all_fieldnames(files, delimiter, has_comments = False, comment_char = '#', progress = False):
+def get_all_fieldnames(files, delimiter, has_comments = False, comment_char = '#', progress = False, headers = None):
     """
     Retrieves all the column names from all files in the list
 
@@ -79,6 +153,8 @@ def get_all_fieldnames(files, delimiter, has_comments = False, comment_char = '#
         a list of paths to input files
     delimiter: str
         the delimiter to use for the input files
+    headers: list
+        the (comments, fieldnames, offset) for each file from get_table_headers; the files are read if these are not passed
 
     Returns
     -------
@@ -89,27 +165,15 @@ def get_all_fieldnames(files, delimiter, has_comments = False, comment_char = '#
     -----
     The column names will be returned in the following order: all columns from the first file, then each missing column from all subsequent files.
     """
+    if headers is None:
+        headers = get_table_headers(files, delimiter = delimiter, has_comments = has_comments, comment_char = comment_char, progress = progress)
     fieldnames = OrderedDict()
-    num_files = len(files)
-    for i, f in enumerate(files):
-        if progress:
-            show_progress(
-                prefix = 'Parsing fieldnames ',
-                num_done = i,
-                num_total = num_files,
-                current_item = f
-                )
-        with open(f) as fin:
-            if has_comments:
-                start_line = find_start_line(f, comment_char = comment_char)
-                while start_line > 0:
-                    next(fin)
-                    start_line -= 1
-            reader = csv.DictReader(fin, delimiter = delimiter)
-            for name in reader.fieldnames:
-                fieldnames[name] = ''
-    if progress:
-        show_progress(clear = True)
+    for _, file_fieldnames, _ in headers:
+        # empty files do not have any columns
+        if file_fieldnames is None:
+            continue
+        for name in file_fieldnames:
+            fieldnames[name] = ''
     return(fieldnames.keys())
 
 def update_dict(d, keys, default_val, keep_keys = False, na_keys = False):
@@ -146,6 +210,105 @@ def update_dict(d, keys, default_val, keep_keys = False, na_keys = False):
             d[key] = default_val
     return(d)
 
+def get_column_map(fieldnames, output_fieldnames, na_str, na_cols = None, filename = None, filename_header = 'file'):
+    """
+    Map the columns of an input file to the output columns, so that the output rows can be made from lists of values instead of dicts
+
+    Parameters
+    ----------
+    fieldnames: list
+        the columns of the input file
+    output_fieldnames: list
+        the columns of the output file
+    na_str: str
+        the value for output columns that are missing from the input file, and for empty values
+    na_cols: list
+        columns that should always have the na_str value
+    filename: str
+        the input file path to use for the filename_header column, if filenames are included in the output
+
+    Returns
+    -------
+    list
+        a list of (index, value) for each output column; the index of the input column to take the value from,
+        or None and the value to use for the column. Gives the same values as update_dict
+
+    Notes
+    -----
+    Empty values from the input columns need to be replaced with na_str, same as update_dict
+    """
+    # duplicated column names get the value of the last one, same as csv.DictReader
+    index = { name: i for i, name in enumerate(fieldnames) }
+    column_map = []
+    for name in output_fieldnames:
+        if filename is not None and name == filename_header:
+            column_map.append((None, filename))
+        elif na_cols and name in na_cols:
+            column_map.append((None, na_str))
+        elif name in index:
+            column_map.append((index[name], None))
+        else:
+            column_map.append((None, na_str))
+    return(column_map)
+
+def read_rows(lines, delimiter = '\t'):
+    """
+    Split table lines into lists of values, skipping empty lines the same as csv.DictReader
+
+    Lines without quotes are split on the delimiter directly; lines with quotes are parsed with csv.reader,
+    which also picks up the rest of a quoted value that continues onto the following lines
+    """
+    lines = iter(lines)
+    for line in lines:
+        if '"' in line:
+            # NOTE: csv.reader only takes as many lines from the shared iterator as it needs for the current row
+            values = next(csv.reader(itertools.chain([line], lines), delimiter = delimiter))
+        else:
+            values = line.rstrip('\n').split(delimiter)
+            if values == ['']:
+                continue
+        if values:
+            yield(values)
+
+def copy_table_lines(fin, fout, num_fields, delimiter = '\t', lineterminator = '\r\n', block_size = 1024 * 1024):
+    """
+    Copy the lines of a table from fin to fout in large blocks, without parsing them;
+    for use when the input file has the same columns as the output file
+
+    A block can only be copied as-is if every line in it has num_fields values, none of them empty, and no quotes,
+    so that the lines are the same as the csv output would be. Copying stops at the first block that does not,
+    and the rest of the file is returned as an iterator of lines to be handled one row at a time
+
+    Returns
+    -------
+    iterator
+        the lines of the file that were not copied
+    """
+    field = '[^{}\n"]+'.format(re.escape(delimiter))
+    block_regex = re.compile('(?:(?:{field}{delimiter}){{{num}}}{field}\n)*'.format(
+        field = field,
+        delimiter = re.escape(delimiter),
+        num = num_fields - 1))
+    remainder = ''
+    while True:
+        block = fin.read(block_size)
+        if not block and not remainder:
+            return(iter([]))
+        if not block:
+            # last line did not have a newline at the end of the file; it still gets one in the output
+            block = '\n'
+        block = remainder + block
+        end = block.rfind('\n') + 1
+        remainder = block[end:]
+        block = block[:end]
+        if not block_regex.fullmatch(block):
+            # finish the partial line at the end of the block, then the rest of the file
+            # NOTE: StringIO only splits lines on '\n', same as iterating over the file
+            return(itertools.chain(io.StringIO(block + remainder + fin.readline()), fin))
+        if lineterminator != '\n':
+            block = block.replace('\n', lineterminator)
+        fout.write(block)
+
 def get_files_from_dir(input_dirs):
     """
     Get the files from a directory
@@ -204,6 +367,8 @@ def main(**kwargs):
     keep_cols = kwargs.pop('keep_cols', set())
     na_cols = kwargs.pop('na_cols', [])
     no_carriage_returns = kwargs.pop('no_carriage_returns', False)
+    threads = kwargs.pop('threads', 4)
+    collapse_comments = kwargs.pop('collapse_comments', None)
 
     if keep_cols is None:
         keep_cols = set()
@@ -229,10 +394,19 @@ def main(**kwargs):
         if progress:
             sys.stderr.write('Found {} files\n'.format(len(input_files)))
 
+    # read the comments, header, and start of the table rows from each input file once, up front
+    headers = get_table_headers(
+        files = input_files,
+        delimiter = delimiter,
+        has_comments = has_comments,
+        comment_char = comment_char,
+        threads = threads,
+        progress = progress)
+
     # get the comment lines from each input file, in order, if we are parsing comments
     comments = None
     if has_comments:
-        comments = get_all_comments(files = input_files, comment_char = comment_char, progress = progress)
+        comments = get_all_comments(files = input_files, comment_char = comment_char, headers = headers, collapse_prefixes = collapse_comments)
 
     # get the output header column fieldnames, in order, from all the input files
     output_fieldnames = get_all_fieldnames(
@@ -240,7 +414,7 @@ def main(**kwargs):
         delimiter = delimiter,
         has_comments = has_comments,
         comment_char = comment_char,
-        progress = progress)
+        headers = headers)
 
     # remove some colnames
     if keep_cols:
@@ -269,15 +443,18 @@ def main(**kwargs):
 
     # initialize output parser
     if no_carriage_returns:
-        writer = csv.DictWriter(fout, delimiter = delimiter, fieldnames = output_fieldnames, lineterminator='\n')
+        lineterminator = '\n'
     else:
-        writer = csv.DictWriter(fout, delimiter = delimiter, fieldnames = output_fieldnames)
+        lineterminator = '\r\n'
+    writer = csv.DictWriter(fout, delimiter = delimiter, fieldnames = output_fieldnames, lineterminator = lineterminator)
     writer.writeheader()
+    # writer for rows that are made from lists of values
+    line_writer = csv.writer(fout, delimiter = delimiter, lineterminator = lineterminator)
 
     # parse the rest of each input file
     num_files = len(input_files)
     num_files_done = 0
-    for input_file in input_files:
+    for input_file, (_, fieldnames, offset) in zip(input_files, headers):
         # show the progress bar
         if progress:
             show_progress(
@@ -287,17 +464,41 @@ def main(**kwargs):
                 current_item = input_file
                 )
 
+        # files without a header line do not have any rows either
+        if fieldnames is None:
+            num_files_done += 1
+            continue
+
+        num_fields = len(fieldnames)
+        column_map = get_column_map(
+            fieldnames = fieldnames,
+            output_fieldnames = output_fieldnames,
+            na_str = na_str,
+            na_cols = na_cols,
+            filename = input_file if filenames else None,
+            filename_header = filename_header)
+
         with open(input_file) as fin:
-            # skip comment lines to find the first header line, if we are parsing comments
-            if has_comments:
-                start_line = find_start_line(input_file, comment_char = comment_char)
-                while start_line > 0:
-                    next(fin)
-                    start_line -= 1
-
-            # start parsing the file
-            reader = csv.DictReader(fin, delimiter = delimiter)
-            for row in reader:
+            # skip the comment lines and header line that were already parsed
+            fin.seek(offset)
+            lines = fin
+
+            # if the file has the same columns as the output, the lines can be copied straight to the output
+            if column_map == [ (i, None) for i in range(num_fields) ] and len(output_fieldnames) == num_fields:
+                lines = copy_table_lines(fin, fout, num_fields = num_fields, delimiter = delimiter, lineterminator = lineterminator)
+
+            for values in read_rows(lines, delimiter = delimiter):
+                if len(values) == num_fields:
+                    line_writer.writerow([ (values[i] or na_str) if i is not None else value for i, value in column_map ])
+                    continue
+
+                # rows with missing or extra values; use the same dict as csv.DictReader
+                row = dict(zip(fieldnames, values))
+                if len(values) > num_fields:
+                    row[None] = values[num_fields:]
+                else:
+                    for key in fieldnames[len(values):]:
+                        row[key] = None
                 # make sure all the desired output fields are present in each row
                 row = update_dict(
                     d = row,
@@ -332,6 +533,7 @@ def parse():
     parser.add_argument("-n", '--na-str', default = '.', dest = 'na_str', help="NA string; character to insert for missing fields in table")
     parser.add_argument("--comments", action='store_true', dest = 'has_comments', help="Whether the input files have comment lines preceeding the header; they will be retained in the output")
     parser.add_argument("--comment-char", default = '#', dest = 'comment_char', help="Character for comment lines")
+    parser.add_argument("--collapse-comments", nargs = '*', dest = 'collapse_comments', help="Only keep the first comment line that starts with each of these prefixes, e.g. '# Versions:'")
     parser.add_argument("--dir", action = 'store_true', dest = 'dir', help="Input file is a directory")
     parser.add_argument("--filenames", action = 'store_true', dest = 'filenames', help="Write out an extra column with the input filename from each row")
     parser.add_argument("--filename-header", default = 'file', dest = 'filename_header', help="If outputting filenames, use this value as the header for the column")
@@ -339,6 +541,7 @@ def parse():
     parser.add_argument("--progress", action = 'store_true', dest = 'progress', help="Show progress bar")
     parser.add_argument("--keep-cols", nargs = '*', dest = 'keep_cols', help="List of columns to keep in the output file; all other columns will be removed, missing columns will be created with NA str")
     parser.add_argument("--na-cols", nargs = '*', dest = 'na_cols', help="List of columns to keep in the output file but replace their values with the NA str")
+    parser.add_argument("--threads", default = 4, type = int, dest = 'threads', help="Number of threads to use for reading the input file headers")
     parser.add_argument("--no-carriage-returns", action = 'store_true', dest = 'no_carriage_returns', help="Do not output carriage returns in the output file")
 
     args = parser.parse_args()
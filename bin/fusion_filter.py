@@ -1,55 +1,150 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
+Script to filter a fusion file down to the fusions that are known to the portal
+
+A fusion is removed from the output if any of its rows has a gene without an Entrez ID,
+or if the fusion has not been previously reported in clinic by DMP (Department of Molecular Pathology) at MSKCC
+
+Usage
+-----
+
+$ fusion_filter.py data_fusions.combined.txt data_fusions.txt known_fusions_at_mskcc.txt
+
+Several fusion files with the same header can be given instead of a combined file; their rows are read in order as a single table;
+
+$ fusion_filter.py sample1.svs.pass.vep.portal.txt sample2.svs.pass.vep.portal.txt data_fusions.txt known_fusions_at_mskcc.txt
+
+The known fusions list can be compiled into a binary index file that is loaded instead of the text list
+on later runs, as long as the index was built from the same text list and it has not changed since;
+
+$ fusion_filter.py data_fusions.combined.txt data_fusions.txt known_fusions_at_mskcc.txt --index-file known_fusions_at_mskcc.idx
+
 -----
 NOTE: MOVE MAF OUTPUT AND FORMATTER TO cBioPortal_utils.MafWriter !! DO NOT ADD MORE ONE-OFF MAF FORMATTING MODULES AND METHODS !!
 -----
 """
 # copied from /juno/work/ci/roslin-pipelines/variant/2.5.7/bin/scripts/fusion_filter.py
 import sys, os, csv, re
+import argparse
+from typing import Set, List, Union
+
+# relative imports, from CLI and from parent project
+if __package__:
+    from .cBioPortal_utils import TableCollator
+    from .cBioPortal_utils import load_pickle_cache
+    from .cBioPortal_utils import save_pickle_cache
+
+if not __package__:
+    from cBioPortal_utils import TableCollator
+    from cBioPortal_utils import load_pickle_cache
+    from cBioPortal_utils import save_pickle_cache
 
-input_file = sys.argv[1]
-output_file = sys.argv[2]
+# version of the index file format; indexes with a different version are rebuilt
+index_version = 2
 
-# I edited this ~ steve
-known_fusions_file = sys.argv[3] # os.path.join(os.path.dirname(sys.argv[0]), 'known_fusions_at_mskcc.txt')
+def load_known_fusions(known_fusions_file: str, index_file: str = None) -> Set[str]:
+    """
+    Fetch all fusions reported in clinic by DMP (Department of Molecular Pathology) at MSKCC
 
-list_of_fusions_to_remove = []
-fixed_file_content = []
+    Parameters
+    ----------
+    known_fusions_file: str
+        path to the text file with one fusion gene pair per line, e.g. IRF2BP2-NTRK1
+    index_file: str
+        path to the binary index of the known fusions; it is loaded instead of the text file if it was built from the same known fusions file,
+        otherwise it is (re)built from the text file
 
-# Fetch all fusions reported in clinic by DMP (Department of Molecular Pathology) at MSKCC
-dmp_fusion = {}
-with open(known_fusions_file) as fusions: # ,'rb'
-    for pair in fusions:
-        pair = pair.strip('\r\n')
-        dmp_fusion[pair] = 1
+    Returns
+    -------
+    set
+        the set of known fusion gene pairs
+    """
+    if index_file is not None:
+        known_fusions = load_pickle_cache(index_file, known_fusions_file, version = index_version)
+        if known_fusions is not None:
+            return(known_fusions)
 
-with open(input_file) as infile: # ,'rb'
-    header = infile.readline().strip('\r\n').split('\t')
-    gene_position = header.index('Hugo_Symbol')
-    Entrez_Gene_Id_position = header.index('Entrez_Gene_Id')
+    known_fusions = set()
+    with open(known_fusions_file) as fusions:
+        for pair in fusions:
+            known_fusions.add(pair.strip('\r\n'))
+    known_fusions = frozenset(known_fusions)
+
+    if index_file is not None:
+        save_pickle_cache(known_fusions, index_file, known_fusions_file, version = index_version)
+    return(known_fusions)
+
+def is_known_fusion(entrez_id: int, fusion: str, known_fusions: Set[str]) -> bool:
+    """
+    Check if a fusion row can be included in the portal files
+
+    Skip fusions with genes missing Entrez IDs, because the portal can't handle those
+    Skip fusions that have not been previously reported by DMP at MSKCC
+    """
+    if entrez_id == 0 or not fusion or '-' not in fusion or fusion.replace(' fusion', '') not in known_fusions:
+        return(False)
+    return(True)
+
+def get_collator(input_file: Union[str, List[str]]) -> TableCollator:
+    """
+    Get the reader for the rows of the input fusion file, or of several fusion files with the same header in order
+    """
+    input_files = [ input_file ] if isinstance(input_file, str) else input_file
+    return(TableCollator(input_files))
+
+def find_fusions_to_remove(input_file: Union[str, List[str]], known_fusions: Set[str]) -> Set[str]:
+    """
+    Read through the fusion file(s) and get the set of Fusion values that have at least one row that fails the filter;
+    all rows for these fusions are removed from the output
+    """
+    fusions_to_remove = set()
+    for row in get_collator(input_file).read():
+        entrez_id = int(row['Entrez_Gene_Id'])
+        fusion = row['Fusion']
+        if not is_known_fusion(entrez_id, fusion, known_fusions):
+            fusions_to_remove.add(fusion)
+    return(fusions_to_remove)
+
+def main(input_file: Union[str, List[str]], output_file: str, known_fusions_file: str, index_file: str = None) -> None:
+    """
+    Main control function for the script
+
+    The input file(s) are read twice; once to find the fusions to remove, then again to write out the rows for the rest of the fusions,
+    so that the whole table does not need to be held in memory
+    """
+    known_fusions = load_known_fusions(known_fusions_file, index_file = index_file)
+    fusions_to_remove = find_fusions_to_remove(input_file, known_fusions)
+
+    collator = get_collator(input_file)
+    header = collator.get_fieldnames()
     Fusion_position = header.index('Fusion')
-    csv_reader = csv.reader(infile,delimiter='\t')
-    for line in csv_reader:
-        gene = line[gene_position]
-        entrez_id = int(line[Entrez_Gene_Id_position])
-        fusion = line[Fusion_position]
-        # Skip fusions with genes missing Entrez IDs, because the portal can't handle those
-        # Skip fusions that have not been previously reported by DMP at MSKCC
-        if entrez_id == 0 or not fusion or '-' not in fusion or fusion.replace(' fusion', '') not in dmp_fusion:
-            list_of_fusions_to_remove.append(fusion)
-        new_line_values = line
-        fixed_file_content.append(new_line_values)
-
-with open(output_file,'w') as outfile:
-    header_line = '\t'.join(header) + '\n'
-    outfile.write(header_line)
-    for line in fixed_file_content:
-        fusion = line[Fusion_position]
-        if fusion in list_of_fusions_to_remove:
-            continue
-        new_line = '\t'.join(line) + '\n'
-        outfile.write(new_line)
-
-# I commented this out because we dont want this behavior right now ~ steve
-# os.remove(input_file)
+    with open(output_file,'w') as outfile:
+        header_line = '\t'.join(header) + '\n'
+        outfile.write(header_line)
+        # write out the values of each row as they are in the input, including short rows and extra values at the end of long rows
+        for line in collator.read_values():
+            fusion = line[Fusion_position]
+            if fusion in fusions_to_remove:
+                continue
+            new_line = '\t'.join(line) + '\n'
+            outfile.write(new_line)
+
+    # I commented this out because we dont want this behavior right now ~ steve
+    # os.remove(input_file)
+
+def parse():
+    """
+    Parse the CLI args
+    """
+    parser = argparse.ArgumentParser(description = 'Filter a fusion file down to the fusions that are known to the portal')
+    parser.add_argument('input_file', nargs = '+', help = 'Input fusion file; multiple fusion files with the same header are read in order as one table')
+    parser.add_argument('output_file', help = 'Output fusion file')
+    # I edited this ~ steve
+    parser.add_argument('known_fusions_file', help = 'File with the list of known fusions, e.g. ref/known_fusions_at_mskcc.txt') # os.path.join(os.path.dirname(sys.argv[0]), 'known_fusions_at_mskcc.txt')
+    parser.add_argument('--index-file', dest = 'index_file', default = None, help = 'Binary index of the known fusions; loaded instead of the known fusions file if it was built from the same file, otherwise it is built from the known fusions file')
+    args = parser.parse_args()
+    main(**vars(args))
+
+if __name__ == '__main__':
+    parse()
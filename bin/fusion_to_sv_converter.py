@@ -8,25 +8,72 @@
 #
 # To get usage:
 #   python fusion_to_sv_converter.py -h
+#
+# NOTE: the rows for each sample and fusion are converted and written out as soon as all of the rows for the fusion are read,
+# so the input should have the rows for each Tumor_Sample_Barcode and Fusion next to each other (e.g. sorted on those columns).
+# If they are not, the input is sorted on those columns in a temporary file first, and the output rows are in the sorted order.
 # ------------------------------------------------------------------------------
 
 import sys
 import os
 import argparse
 import csv
+import shutil
+import tempfile
 from itertools import groupby
 from operator import itemgetter
 
-def write_data(final_mapped_data, header, outfile):
+# relative imports, from CLI and from parent project
+if __package__:
+	from .cBioPortal_utils import sort_table
+
+if not __package__:
+	from cBioPortal_utils import sort_table
+
+class UngroupedFusionsError(Exception):
+	"""
+	The rows for a sample and fusion are not all next to each other in the input file
+	"""
+	pass
+
+def get_sv_header(header):
 	updated_header = ['Sample_ID', 'Site1_Hugo_Symbol', 'Site1_Entrez_Gene_Id', 'Site2_Hugo_Symbol', 'Site2_Entrez_Gene_Id', 'SV_Status']
 	additional_columns = [x for x in header if x not in updated_header and x not in ['index', 'Hugo_Symbol', 'Entrez_Gene_Id', 'Tumor_Sample_Barcode']]
 	updated_header.extend(additional_columns)
+	return(updated_header)
+
+def write_data(final_mapped_data, header, outfile):
+	updated_header = get_sv_header(header)
 
 	with open(outfile, 'w') as sv_data:
 		writer = csv.DictWriter(sv_data, fieldnames=updated_header, delimiter='\t', extrasaction='ignore')
 		writer.writeheader()
 		writer.writerows(final_mapped_data)
 
+def iter_fusion_groups(rows):
+	"""
+	Yield the (key, rows) for each run of rows with the same Tumor_Sample_Barcode and fusion (Event_Info)
+
+	Raises UngroupedFusionsError if the rows for a sample and fusion come up again after a different one
+	"""
+	# only the keys of the groups that are done are kept, not their rows
+	done_keys = set()
+	key = None
+	group = []
+	for row in rows:
+		key_val = row['Tumor_Sample_Barcode']+'_'+row['Event_Info']
+		if key_val != key:
+			if group:
+				yield(key, group)
+				done_keys.add(key)
+			if key_val in done_keys:
+				raise UngroupedFusionsError(key_val)
+			key = key_val
+			group = []
+		group.append(row)
+	if group:
+		yield(key, group)
+
 def map_fusion_to_sv(fusion_dict):
 	final_mapped_data = list()
 
@@ -88,29 +135,41 @@ def interface():
 	args = parser.parse_args()
 	return args
 
-def main(parsed_args):
+def convert_fusion_file(fusion_file, sv_file):
+	"""
+	Convert the fusion file to the sv format, writing out the rows for each sample and fusion as soon as they are read
 
-	data = csv.DictReader(open(parsed_args.fusion_file, 'r'), delimiter='\t')
+	Raises UngroupedFusionsError if the rows for each sample and fusion are not next to each other in the fusion file
+	"""
+	with open(fusion_file, 'r') as fin:
+		data = csv.DictReader(fin, delimiter='\t')
 
-	#Check the input file format - the file should have at least the following fields - Tumor_Sample_Barcode, Fusion, Hugo_Symbol, Entrez_Gene_Id
-	file_format_check(data.fieldnames, parsed_args.fusion_file)
+		#Check the input file format - the file should have at least the following fields - Tumor_Sample_Barcode, Fusion, Hugo_Symbol, Entrez_Gene_Id
+		file_format_check(data.fieldnames, fusion_file)
 
-	#Update fieldnames to map to SV format.
-	data.fieldnames = ['Event_Info' if item == 'Fusion' else item for item in data.fieldnames]
-	data.fieldnames = ['Site2_Effect_On_Frame' if item == 'Frame' else item for item in data.fieldnames]
+		#Update fieldnames to map to SV format.
+		data.fieldnames = ['Event_Info' if item == 'Fusion' else item for item in data.fieldnames]
+		data.fieldnames = ['Site2_Effect_On_Frame' if item == 'Frame' else item for item in data.fieldnames]
 
-	fusion_dict = {}
-	for row in data:
-		key_val = row['Tumor_Sample_Barcode']+'_'+row['Event_Info']
-		if key_val not in fusion_dict:
-			fusion_dict[key_val] = list()
-			fusion_dict[key_val].append(row)
-		else:
-			fusion_dict[key_val].append(row)
+		with open(sv_file, 'w') as sv_data:
+			writer = csv.DictWriter(sv_data, fieldnames=get_sv_header(data.fieldnames), delimiter='\t', extrasaction='ignore')
+			writer.writeheader()
 
-	sv_data = map_fusion_to_sv(fusion_dict)
+			for key_val, rows in iter_fusion_groups(data):
+				writer.writerows(map_fusion_to_sv({key_val: rows}))
 
-	write_data(sv_data, data.fieldnames, parsed_args.sv_file)
+def main(parsed_args):
+	try:
+		convert_fusion_file(parsed_args.fusion_file, parsed_args.sv_file)
+	except UngroupedFusionsError:
+		# sort the fusion file so that the rows for each sample and fusion are together, then start over
+		tmpdir = tempfile.mkdtemp(dir = os.path.dirname(os.path.abspath(parsed_args.sv_file)))
+		try:
+			sorted_fusion_file = os.path.join(tmpdir, 'fusions.sorted.txt')
+			sort_table(parsed_args.fusion_file, sorted_fusion_file, key = ['Tumor_Sample_Barcode', 'Fusion'])
+			convert_fusion_file(sorted_fusion_file, parsed_args.sv_file)
+		finally:
+			shutil.rmtree(tmpdir)
 
 if __name__ == '__main__':
 	parsed_args = interface()
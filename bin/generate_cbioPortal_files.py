@@ -55,6 +55,9 @@ $ generate_cbioPortal_files.py patient --data-clinical-file ../test_data/inputs/
 # data_clinical_sample.txt
 $ generate_cbioPortal_files.py sample --data-clinical-file ../test_data/inputs/Proj_08390_G_sample_data_clinical.txt --sample-summary-file ../test_data/qc/Proj_08390_G_SampleSummary.txt --project-pi pi_name --request-pi pi_name
 
+# data_clinical_sample.txt with Facets Suite data, loading 8 of the Facets files at a time and caching their parsed data
+$ generate_cbioPortal_files.py sample --data-clinical-file ../test_data/inputs/Proj_08390_G_sample_data_clinical.txt --facets-txt-files facets/*.txt --threads 8 --cache-facets
+
 # meta_study.txt
 $ generate_cbioPortal_files.py study --cancer-study-id cancer_study_1 --name name --short-name short_name --type-of-cancer type_of_cancer --extra-groups foo_group --extra-groups bar_group
 
@@ -90,24 +93,34 @@ $ generate_cbioPortal_files.py cases_cna --cancer-study-id cancer_study --data-c
 
 # cases_sequenced.txt
 $ generate_cbioPortal_files.py cases_sequenced --cancer-study-id cancer_study --data-clinical-file ../test_data/inputs/Proj_08390_G_sample_data_clinical.txt
+
+# all of the above at once, loading the input files only one time; the time taken for each file is printed to stderr
+$ generate_cbioPortal_files.py bundle --output-dir portal --cancer-study-id cancer_study_1 --name name --short-name short_name --type-of-cancer type_of_cancer --data-clinical-file ../test_data/inputs/Proj_08390_G_sample_data_clinical.txt --sample-summary-file ../test_data/qc/Proj_08390_G_SampleSummary.txt --project-pi pi_name --request-pi pi_name --skip meta_fusion --threads 4
 """
+import os
+import sys
 import csv
+import time
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Tuple, Callable
 # from collections import OrderedDict
 
 # relative imports, from CLI and from parent project
-if __name__ != "__main__":
+if __package__:
     from .cBioPortal_utils import header_lines_map
     from .cBioPortal_utils import generate_header_lines
     from .cBioPortal_utils import create_file_lines
+    from .cBioPortal_utils import ClinicalWriter
     from .cBioPortal_utils import parse_facets_data
     from .cBioPortal_utils import update_sample_data
     from .cBioPortal_utils import load_facets_data
 
-if __name__ == "__main__":
+if not __package__:
     from cBioPortal_utils import header_lines_map
     from cBioPortal_utils import generate_header_lines
     from cBioPortal_utils import create_file_lines
+    from cBioPortal_utils import ClinicalWriter
     from cBioPortal_utils import parse_facets_data
     from cBioPortal_utils import update_sample_data
     from cBioPortal_utils import load_facets_data
@@ -494,9 +507,11 @@ def generate_cases_sequenced_data_file(**kwargs):
     """
     output = kwargs.pop('output', 'cases_sequenced.txt')
     cancer_study_identifier = kwargs.pop('cancer_study_identifier')
-    data_clinical_file = kwargs.pop('data_clinical_file')
+    data_clinical_file = kwargs.pop('data_clinical_file', None)
+    clinical_data = kwargs.pop('clinical_data', None) # already loaded clinical data, passed in from the bundle
 
-    clinical_data = load_clinical_data(data_clinical_file)
+    if clinical_data == None:
+        clinical_data = load_clinical_data(data_clinical_file)
 
     sample_list = get_sample_list(clinical_data)
 
@@ -513,9 +528,11 @@ def generate_cases_cna_data_file(**kwargs):
     """
     output = kwargs.pop('output', 'cases_cna.txt')
     cancer_study_identifier = kwargs.pop('cancer_study_identifier')
-    data_clinical_file = kwargs.pop('data_clinical_file')
+    data_clinical_file = kwargs.pop('data_clinical_file', None)
+    clinical_data = kwargs.pop('clinical_data', None) # already loaded clinical data, passed in from the bundle
 
-    clinical_data = load_clinical_data(data_clinical_file)
+    if clinical_data == None:
+        clinical_data = load_clinical_data(data_clinical_file)
 
     sample_list = get_sample_list(clinical_data)
 
@@ -532,9 +549,11 @@ def generate_cases_cnaseq_data_file(**kwargs):
     """
     output = kwargs.pop('output', 'cases_cnaseq.txt')
     cancer_study_identifier = kwargs.pop('cancer_study_identifier')
-    data_clinical_file = kwargs.pop('data_clinical_file')
+    data_clinical_file = kwargs.pop('data_clinical_file', None)
+    clinical_data = kwargs.pop('clinical_data', None) # already loaded clinical data, passed in from the bundle
 
-    clinical_data = load_clinical_data(data_clinical_file)
+    if clinical_data == None:
+        clinical_data = load_clinical_data(data_clinical_file)
 
     sample_list = get_sample_list(clinical_data)
 
@@ -551,9 +570,11 @@ def generate_case_list_all_data_file(**kwargs):
     """
     output = kwargs.pop('output', 'cases_all.txt')
     cancer_study_identifier = kwargs.pop('cancer_study_identifier')
-    data_clinical_file = kwargs.pop('data_clinical_file')
+    data_clinical_file = kwargs.pop('data_clinical_file', None)
+    clinical_data = kwargs.pop('clinical_data', None) # already loaded clinical data, passed in from the bundle
 
-    clinical_data = load_clinical_data(data_clinical_file)
+    if clinical_data == None:
+        clinical_data = load_clinical_data(data_clinical_file)
 
     sample_list = get_sample_list(clinical_data)
 
@@ -698,27 +719,36 @@ def generate_data_clinical_sample_file(**kwargs):
     """
     Generate the cBioPortal sample clinical data file
     """
-    data_clinical_file = kwargs.pop('data_clinical_file')
+    data_clinical_file = kwargs.pop('data_clinical_file', None)
     sample_summary_file = kwargs.pop('sample_summary_file', None)
     facets_txt_files = kwargs.pop('facets_txt_files', [])
     output = kwargs.pop('output', 'data_clinical_sample.txt')
     project_pi = kwargs.pop('project_pi', None)
     request_pi = kwargs.pop('request_pi', None)
+    threads = kwargs.pop('threads', 1)
+    cache_facets = kwargs.pop('cache_facets', False)
+    # already loaded input data, passed in from the bundle
+    clinical_data = kwargs.pop('clinical_data', None)
+    sample_coverages = kwargs.pop('sample_coverages', None)
+    parsed_facets_data = kwargs.pop('facets_data', None)
 
     # load data from the files
-    clinical_data = load_clinical_data(data_clinical_file)
+    if clinical_data == None:
+        clinical_data = load_clinical_data(data_clinical_file)
+    else:
+        # the rows get updated below, dont change the shared copy
+        clinical_data = [ dict(row) for row in clinical_data ]
 
     # add the matching coverages to the clincal data, or a '' empty value
-    if sample_summary_file != None:
+    if sample_coverages == None and sample_summary_file != None:
         sample_coverages = load_sample_coverages(sample_summary_file)
+    if sample_coverages != None:
         for row in clinical_data:
             row['SAMPLE_COVERAGE'] = sample_coverages.get(row['SAMPLE_ID'], '')
 
     # if facets data is provided, load it
-    all_facets_data = []
-    parsed_facets_data = None
-    if facets_txt_files:
-        parsed_facets_data = load_facets_data(facets_txt_files)
+    if parsed_facets_data == None and facets_txt_files:
+        parsed_facets_data = load_facets_data(facets_txt_files, threads = threads, use_cache = cache_facets)
 
     # add more optional values, if they were passed
     for row in clinical_data:
@@ -730,43 +760,35 @@ def generate_data_clinical_sample_file(**kwargs):
     # parse the data down to the values needed for the sample file
     clinical_sample_data = generate_portal_data_clinical_sample(clinical_data)
 
-    updated_sample_data = []
     if parsed_facets_data != None:
         # update all the sample datas based on facets data
-        for sample_data in clinical_sample_data:
-            new_sample_data = update_sample_data(sample_data, facets_data = parsed_facets_data)
-            updated_sample_data.append(new_sample_data)
-
-    # create the lines to output to the file
-    if updated_sample_data:
-        lines = create_file_lines(updated_sample_data)
-    else:
-        lines = create_file_lines(clinical_sample_data)
+        clinical_sample_data = [ update_sample_data(sample_data, facets_data = parsed_facets_data) for sample_data in clinical_sample_data ]
 
-    # write all the lines to file
+    # write all the rows to file; the rows can have different columns so get all of them first
     with open(output, "w") as fout:
-        fout.writelines(lines)
+        writer = ClinicalWriter(fout = fout, fieldnames = ClinicalWriter.get_fieldnames(clinical_sample_data))
+        writer.writerows(clinical_sample_data)
 
 
 def generate_data_clinical_patient_file(**kwargs):
     """
     Generate the cBioPortal patient clinical data file
     """
-    data_clinical_file = kwargs.pop('data_clinical_file')
+    data_clinical_file = kwargs.pop('data_clinical_file', None)
+    clinical_data = kwargs.pop('clinical_data', None)
     output = kwargs.pop('output', 'data_clinical_patient.txt')
 
     # load data from the files
-    clinical_data = load_clinical_data(data_clinical_file)
+    if clinical_data == None:
+        clinical_data = load_clinical_data(data_clinical_file)
 
     # parse the data down to the values needed for the patient file
     clinical_patient_data = generate_portal_data_clinical_patient(clinical_data)
 
-    # create the lines to output to the file
-    lines = create_file_lines(clinical_patient_data)
-
-    # write all the lines to file
+    # write all the rows to file
     with open(output, "w") as fout:
-        fout.writelines(lines)
+        writer = ClinicalWriter(fout = fout, fieldnames = ClinicalWriter.get_fieldnames(clinical_patient_data))
+        writer.writerows(clinical_patient_data)
 
 def clean_facets_suite_cna_file(**kwargs):
     """
@@ -787,6 +809,170 @@ def clean_facets_suite_cna_file(**kwargs):
         for line in fin:
             fout.write(line)
 
+# names of the files generated by the bundle; same as the subcommand names
+bundle_files = [
+    'study',
+    'meta_sample',
+    'meta_patient',
+    'meta_cna',
+    'meta_fusion',
+    'meta_sv',
+    'meta_mutations',
+    'meta_segments',
+    'patient',
+    'sample',
+    'cases_all',
+    'cases_cnaseq',
+    'cases_cna',
+    'cases_sequenced'
+    ]
+
+def get_bundle_jobs(
+    output_dir: str,
+    cancer_study_identifier: str,
+    clinical_data: List[Dict],
+    sample_coverages: Dict = None,
+    facets_data: Dict = None,
+    study_args: Dict = None,
+    project_pi: str = None,
+    request_pi: str = None,
+    skip: List[str] = ()
+    ) -> List[Tuple[str, Callable, Dict]]:
+    """
+    Get the list of file generation functions and their args for all the files in the portal bundle
+
+    Parameters
+    ----------
+    output_dir: str
+        the portal directory to write the files to; case lists go in the case_lists subdirectory
+    cancer_study_identifier: str
+        ID for the cancer study
+    clinical_data: list
+        the already loaded data clinical file contents, shared by all the files that need it
+    sample_coverages: dict
+        the already loaded sample summary coverages, if any
+    facets_data: dict
+        the already loaded Facets Suite data, if any
+    study_args: dict
+        the args for the meta_study.txt file; name, short_name, type_of_cancer, description, extra_groups
+    skip: list
+        names of files in `bundle_files` that should not be generated
+
+    Returns
+    -------
+    list
+        a list of (name, function, kwargs) tuples, one per output file
+    """
+    case_lists_dir = os.path.join(output_dir, 'case_lists')
+    segments_data_filename = cancer_study_identifier + '_data_cna_hg19.seg'
+    segments_meta_filename = cancer_study_identifier + '_meta_cna_hg19_seg.txt'
+
+    jobs = [
+    ('study', generate_study_meta_file, dict(study_args or {}, output = os.path.join(output_dir, 'meta_study.txt'), cancer_study_identifier = cancer_study_identifier)),
+    ('meta_sample', generate_clinical_meta_samples_data_file, {'output': os.path.join(output_dir, 'meta_clinical_sample.txt'), 'cancer_study_identifier': cancer_study_identifier}),
+    ('meta_patient', generate_clinical_meta_patient_data_file, {'output': os.path.join(output_dir, 'meta_clinical_patient.txt'), 'cancer_study_identifier': cancer_study_identifier}),
+    ('meta_cna', generate_clinical_meta_cna_data_file, {'output': os.path.join(output_dir, 'meta_CNA.txt'), 'cancer_study_identifier': cancer_study_identifier}),
+    ('meta_fusion', generate_fusion_meta_data_file, {'output': os.path.join(output_dir, 'meta_fusions.txt'), 'cancer_study_identifier': cancer_study_identifier}),
+    ('meta_sv', generate_sv_meta_data_file, {'output': os.path.join(output_dir, 'meta_SV.txt'), 'cancer_study_identifier': cancer_study_identifier}),
+    ('meta_mutations', generate_mutation_meta_data_file, {'output': os.path.join(output_dir, 'meta_mutations_extended.txt'), 'cancer_study_identifier': cancer_study_identifier}),
+    ('meta_segments', generate_meta_segments_data_file, {'output': os.path.join(output_dir, segments_meta_filename), 'cancer_study_identifier': cancer_study_identifier, 'data_filename': segments_data_filename}),
+    ('patient', generate_data_clinical_patient_file, {'output': os.path.join(output_dir, 'data_clinical_patient.txt'), 'clinical_data': clinical_data}),
+    ('sample', generate_data_clinical_sample_file, {
+        'output': os.path.join(output_dir, 'data_clinical_sample.txt'),
+        'clinical_data': clinical_data,
+        'sample_coverages': sample_coverages,
+        'facets_data': facets_data,
+        'project_pi': project_pi,
+        'request_pi': request_pi
+        }),
+    ('cases_all', generate_case_list_all_data_file, {'output': os.path.join(case_lists_dir, 'cases_all.txt'), 'cancer_study_identifier': cancer_study_identifier, 'clinical_data': clinical_data}),
+    ('cases_cnaseq', generate_cases_cnaseq_data_file, {'output': os.path.join(case_lists_dir, 'cases_cnaseq.txt'), 'cancer_study_identifier': cancer_study_identifier, 'clinical_data': clinical_data}),
+    ('cases_cna', generate_cases_cna_data_file, {'output': os.path.join(case_lists_dir, 'cases_cna.txt'), 'cancer_study_identifier': cancer_study_identifier, 'clinical_data': clinical_data}),
+    ('cases_sequenced', generate_cases_sequenced_data_file, {'output': os.path.join(case_lists_dir, 'cases_sequenced.txt'), 'cancer_study_identifier': cancer_study_identifier, 'clinical_data': clinical_data})
+    ]
+
+    jobs = [ job for job in jobs if job[0] not in skip ]
+    return(jobs)
+
+def run_bundle_job(name: str, func: Callable, func_args: Dict) -> Tuple[str, str, float]:
+    """
+    Generate a single file of the bundle, and time how long it took
+    """
+    start = time.time()
+    func(**func_args)
+    elapsed = time.time() - start
+    return(name, func_args['output'], elapsed)
+
+def generate_portal_bundle(**kwargs) -> List[Tuple[str, str, float]]:
+    """
+    Generate all the cBioPortal meta files, clinical data files, and case lists for a study at once
+
+    The data clinical, sample summary, and Facets Suite files are only loaded once and shared by all the files that need them,
+    instead of being loaded again for every file like when the subcommands are used one at a time.
+    Files are written concurrently when more than one thread is used.
+
+    Returns
+    -------
+    list
+        a list of (name, output, seconds) tuples with the time taken to load the inputs and write each file
+    """
+    output_dir = kwargs.pop('output_dir', '.')
+    cancer_study_identifier = kwargs.pop('cancer_study_identifier')
+    data_clinical_file = kwargs.pop('data_clinical_file')
+    sample_summary_file = kwargs.pop('sample_summary_file', None)
+    facets_txt_files = kwargs.pop('facets_txt_files', None)
+    project_pi = kwargs.pop('project_pi', None)
+    request_pi = kwargs.pop('request_pi', None)
+    skip = kwargs.pop('skip', None) or []
+    threads = kwargs.pop('threads', 1)
+    cache_facets = kwargs.pop('cache_facets', False)
+    study_args = {
+    'name': kwargs.pop('name'),
+    'short_name': kwargs.pop('short_name'),
+    'type_of_cancer': kwargs.pop('type_of_cancer'),
+    'description': kwargs.pop('description', ''),
+    'extra_groups': kwargs.pop('extra_groups', None) or []
+    }
+
+    # load the inputs that are shared between files
+    timings = []
+    start = time.time()
+    clinical_data = load_clinical_data(data_clinical_file)
+    sample_coverages = None
+    if sample_summary_file != None:
+        sample_coverages = load_sample_coverages(sample_summary_file)
+    facets_data = None
+    if facets_txt_files:
+        facets_data = load_facets_data(facets_txt_files, threads = threads, use_cache = cache_facets)
+    timings.append(('inputs', data_clinical_file, time.time() - start))
+
+    os.makedirs(os.path.join(output_dir, 'case_lists'), exist_ok = True)
+
+    jobs = get_bundle_jobs(
+        output_dir = output_dir,
+        cancer_study_identifier = cancer_study_identifier,
+        clinical_data = clinical_data,
+        sample_coverages = sample_coverages,
+        facets_data = facets_data,
+        study_args = study_args,
+        project_pi = project_pi,
+        request_pi = request_pi,
+        skip = skip)
+
+    if threads > 1:
+        with ThreadPoolExecutor(max_workers = threads) as executor:
+            futures = [ executor.submit(run_bundle_job, *job) for job in jobs ]
+            # get the results in job order; this also raises any errors from the worker threads
+            for future in futures:
+                timings.append(future.result())
+    else:
+        for job in jobs:
+            timings.append(run_bundle_job(*job))
+
+    for name, output, elapsed in timings:
+        print('{:.3f}s\t{}\t{}'.format(elapsed, name, output), file = sys.stderr)
+    return(timings)
+
 def main():
     """
     Main control function when called as a script
@@ -812,6 +998,8 @@ def main():
     sample.add_argument('--project-pi', dest = 'project_pi', default = None, help = 'A Project PI value to add to entries in the table')
     sample.add_argument('--request-pi', dest = 'request_pi', default = None, help = 'A Request PI value to add to entries in the table')
     sample.add_argument('--facets-txt-files', dest = 'facets_txt_files', nargs='*', help = 'The .txt output files from Facets Suite')
+    sample.add_argument('--threads', dest = 'threads', default = 1, type = int, help = 'Number of Facets Suite files to load at the same time')
+    sample.add_argument('--cache-facets', dest = 'cache_facets', action = 'store_true', help = 'Save the parsed data from each Facets Suite file next to it, and load it from there on later runs')
     sample.set_defaults(func = generate_data_clinical_sample_file)
 
     # subparser for meta_study.txt
@@ -909,6 +1097,25 @@ def main():
     clean_cna.add_argument('--input', dest = 'input_file', required = True, help = 'Name of the input file')
     clean_cna.set_defaults(func = clean_facets_suite_cna_file)
 
+    # subparser for all of the files above at once
+    bundle = subparsers.add_parser('bundle', help = 'Create all the metadata files, clinical data files, and case lists for the study at once')
+    bundle.add_argument('--output-dir', dest = 'output_dir', default = ".", help = 'Directory to write the files to; case lists are written to the case_lists subdirectory')
+    bundle.add_argument('--cancer-study-id', dest = 'cancer_study_identifier', required = True, help = 'ID for the cancer study')
+    bundle.add_argument('--data-clinical-file', dest = 'data_clinical_file', required = True, help = 'The data clinical source file')
+    bundle.add_argument('--sample-summary-file', dest = 'sample_summary_file', default = None, help = 'A supplemental sample summary file with coverage values to add to the sample table')
+    bundle.add_argument('--facets-txt-files', dest = 'facets_txt_files', nargs='*', help = 'The .txt output files from Facets Suite')
+    bundle.add_argument('--project-pi', dest = 'project_pi', default = None, help = 'A Project PI value to add to entries in the sample table')
+    bundle.add_argument('--request-pi', dest = 'request_pi', default = None, help = 'A Request PI value to add to entries in the sample table')
+    bundle.add_argument('--description', dest = 'description', default = '', help = 'A description of the cancer study')
+    bundle.add_argument('--name', dest = 'name', required = True, help = 'The name of the cancer study')
+    bundle.add_argument('--short-name', dest = 'short_name', required = True, help = 'A short name used for display used on various web pages within the cBioPortal')
+    bundle.add_argument('--type-of-cancer', dest = 'type_of_cancer', required = True, help = 'The cancer type abbreviation')
+    bundle.add_argument('--extra-groups', dest = "extra_groups", default = [], action='append', help='Extra grouping labels (one per flag invocation, can be used multiple times)')
+    bundle.add_argument('--skip', dest = 'skip', default = [], action = 'append', choices = bundle_files, help = 'Name of a file to not create (one per flag invocation, can be used multiple times)')
+    bundle.add_argument('--threads', dest = 'threads', default = 1, type = int, help = 'Number of files to load or write at the same time')
+    bundle.add_argument('--cache-facets', dest = 'cache_facets', action = 'store_true', help = 'Save the parsed data from each Facets Suite file next to it, and load it from there on later runs')
+    bundle.set_defaults(func = generate_portal_bundle)
+
 
     args = parser.parse_args()
     args.func(**vars(args))
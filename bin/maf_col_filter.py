@@ -6,14 +6,14 @@ Script for dropping specific columns from a given maf file
 NOTE: MOVE MAF OUTPUT AND FORMATTER TO cBioPortal_utils.MafWriter !!
 """
 import sys
-import csv
 
 # relative imports, from CLI and from parent project
-if __name__ != "__main__":
-    from .cBioPortal_utils import MafReader
+# NOTE: check the package instead of __name__ so that this also works when imported by another script; see maf_pipeline.py
+if __package__:
+    from .cBioPortal_utils import MafStage, run_maf_stages
 
-if __name__ == "__main__":
-    from cBioPortal_utils import MafReader
+if not __package__:
+    from cBioPortal_utils import MafStage, run_maf_stages
 
 # list of column labels that we will preserve in the output; discard any columns not listed here
 # NOTE: set does not preserve order but is faster for lookups
@@ -68,28 +68,24 @@ cols_to_keep = set([
 "impact_assays"
 ])
 
-def main(input_file, output_file):
-    """
-    Main control function for the script
+class MafColFilterStage(MafStage):
     """
-    maf_reader = MafReader(input_file)
-    fieldnames = maf_reader.get_fieldnames()
-    comment_lines = maf_reader.comment_lines
+    Drop the columns that are not in cols_to_keep
 
-    # only keep a subset of the fieldnames for the shareable output file
-    fieldnames = [ f for f in fieldnames if f in cols_to_keep ]
-
-    with open(output_file, "w") as fout:
-        # write out the input comments
-        fout.writelines(comment_lines)
+    NOTE: the rows are not changed, the dropped columns are left out by the writer
+    """
+    # none of the values are needed; only the kept columns need to be parsed for the output
+    columns = []
 
-        # ignore fields not in fieldnames
-        writer = csv.DictWriter(fout, delimiter = '\t', fieldnames = fieldnames, extrasaction = 'ignore', lineterminator='\n')
-        writer.writeheader()
+    def get_fieldnames(self, fieldnames):
+        # only keep a subset of the fieldnames for the shareable output file
+        return([ f for f in fieldnames if f in cols_to_keep ])
 
-        # write out the input rows
-        for row in maf_reader.read():
-            writer.writerow(row)
+def main(input_file, output_file):
+    """
+    Main control function for the script
+    """
+    run_maf_stages(input_file, output_file, stages = [ MafColFilterStage() ])
 
 def parse():
     """
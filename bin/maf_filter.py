@@ -16,20 +16,140 @@ import csv
 import re
 import argparse
 import json
-from typing import Dict, Tuple, List
+import shutil
+import tempfile
+from contextlib import ExitStack
+from concurrent.futures import ProcessPoolExecutor
+from collections import OrderedDict
+from itertools import islice, compress
+from operator import itemgetter
+from typing import Dict, Tuple, List, Iterator, TextIO, Union
 
 # relative imports, from CLI and from parent project
-if __name__ != "__main__":
+if __package__:
     from .cBioPortal_utils import maf_filter_portal_file_cols_to_keep
-    from .cBioPortal_utils import parse_header_comments
+    from .cBioPortal_utils import MafReader
+    from .cBioPortal_utils import TableCollator
+    from .cBioPortal_utils import find_data_offset
 
-if __name__ == "__main__":
+if not __package__:
     from cBioPortal_utils import maf_filter_portal_file_cols_to_keep
-    from cBioPortal_utils import parse_header_comments
+    from cBioPortal_utils import MafReader
+    from cBioPortal_utils import TableCollator
+    from cBioPortal_utils import find_data_offset
 
-def filter_row(row: Dict, is_impact: bool) -> Tuple[Dict, bool, bool, bool, bool, str]:
+# patterns used by the filter criteria; compile these once here instead of for every row
+consequence_keep = ['missense_', 'stop_', 'frameshift_', 'splice_', 'inframe_', 'protein_altering_',
+    'start_', 'synonymous_', 'coding_sequence_', 'transcript_', 'exon_', 'initiator_codon_',
+    'disruptive_inframe_', 'conservative_missense_', 'rare_amino_acid_', 'mature_miRNA_', 'TFBS_']
+consequence_regex = re.compile(r'|'.join(consequence_keep)) # missense_|stop_|frameshift_|splice_|inframe_|protein_altering_|start_|synonymous_|coding_sequence_|transcript_|exon_|initiator_codon_|disruptive_inframe_|conservative_missense_|rare_amino_acid_|mature_miRNA_|TFBS_
+HGVSc_splice_regex = re.compile(r'[nc]\.\d+[-+](\d+)_\d+[-+](\d+)|[nc]\.\d+[-+](\d+)') # c.36-3C>T ; 3
+splice_region_regex = re.compile(r'splice_region_variant')
+non_coding_regex = re.compile(r'non_coding_')
+synonymous_regex = re.compile(r'synonymous_|stop_retained_')
+FILTER_split_regex = re.compile(r';|,')
+# FILTER values that come from the ccs filters
+ccs_filters = set(["mq55", "nm2", "asb", "nad3"])
+
+# order of the keys in the filter_flags dict output by filter_row
+filter_flags_keys = [
+    "silent_mut_no_entrez_intronic",
+    "intronic_event",
+    "entrez_gene_id_0",
+    "synonymous_match",
+    "tumor_vaf",
+    "is_not_Pindel",
+    "is_impact",
+    "only_ccs_filters",
+    "is_impact_and_only_ccs_filters",
+    "pass_FILTER",
+    "is_common_variant",
+    "Mutation_Status_None",
+    "pass_FILTER_or_is_common_variant_or_is_common_variant_and_is_not_Pindel",
+    "set_MuTect_Rescue_and_not_is_impact",
+    "splice_region_variant_with_Consequence",
+    "non_coding_with_Consequence",
+    "HGVSc_splice_match_is_not_None",
+    "pass_consequence_match",
+    "is_TERT",
+    "pass_TERT_start",
+    "pass_TERT_end",
+    "pass_consequence_or_is_TERT",
+    "is_impact_and_is_MT",
+    "fail_DMP_t_depth",
+    "fail_DMP_t_alt_count",
+    "fail_DMP_tumor_vaf",
+    "fail_DMP_whitelist_filter",
+    "dmp_fail",
+    "dmp_fail_and_is_impact",
+    "splice_dist",
+    "splice_dist_min_pass",
+    "set_MuTect_Rescue"
+]
+
+# reject_flag values and their matching reject_reason, in the order they are checked in filter_row
+reject_reasons = OrderedDict([
+    ("pass_FILTER_or_is_common_variant_or_is_common_variant_and_is_not_Pindel", 'Skip any that failed false-positive filters, except common_variant and Skip all events reported uniquely by Pindel'),
+    ("set_MuTect_Rescue_and_not_is_impact", 'Skip MuTect-Rescue events for all but IMPACT/HemePACT projects'),
+    ("non_coding_with_Consequence", 'Skip splice region variants in non-coding genes'),
+    ("splice_dist_min_pass", 'Skip splice region variants that are >3bp into introns'),
+    ("pass_consequence_or_is_TERT", 'Skip all non-coding events except interesting ones like TERT promoter mutations'),
+    ("is_impact_and_is_MT", 'Skip reporting MT muts in IMPACT'),
+    ("dmp_fail_and_is_impact", 'Apply the DMP depth/allele-count/VAF cutoffs as hard filters in IMPACT, and soft filters in non-IMPACT')
+])
+
+def get_splice_dist(HGVSc: str) -> Tuple[bool, int]:
     """
-    Check filter criteria against a single row representing a variant
+    Get the distance from the nearest splice junction from the HGVSc value, using the closest distance for indels
+
+    c.36-3C>T ; 3
+    c.542-4G>T ; 4
+    c.3664-8C>T ; 8
+    """
+    HGVSc_splice_match = HGVSc_splice_regex.match(HGVSc)
+    if HGVSc_splice_match is None:
+        return(False, 0)
+    splice_dist = min(int(d) for d in HGVSc_splice_match.group(1,2,3) if d is not None)
+    return(True, splice_dist)
+
+def only_has_ccs_filters(FILTER: str) -> bool:
+    """
+    Check if the FILTER value only contains the ccs filters
+    """
+    for filter in FILTER_split_regex.split(FILTER):
+        if filter not in ccs_filters:
+            return(False)
+    return(True)
+
+def get_tumor_counts(row: Dict) -> Tuple[int, int, float]:
+    """
+    Get the tumor depth, alt allele count, and VAF to use for filter criteria from the row
+
+    For all events except point mutations, use the variant caller reported allele counts for filtering
+    """
+    if row['Variant_Type'] == "SNP":
+        t_depth = int(row['fillout_t_depth'])
+        t_alt_count = int(row['fillout_t_alt'])
+    else:
+        t_depth = int(row['t_depth'])
+        t_alt_count = int(row['t_alt_count'])
+    tumor_vaf = float(t_alt_count) / float(t_depth) if t_depth != 0 else 0
+    return(t_depth, t_alt_count, tumor_vaf)
+
+def is_dmp_fail(row: Dict) -> bool:
+    """
+    Check the DMP depth/allele-count/VAF cutoffs against the row
+    """
+    t_depth, t_alt_count, tumor_vaf = get_tumor_counts(row)
+    if t_depth < 20 or t_alt_count < 8 or tumor_vaf < 0.02:
+        return(True)
+    return(row['hotspot_whitelist'] == 'FALSE' and (t_alt_count < 10 or tumor_vaf < 0.05))
+
+def get_filter_flags(row: Dict, is_impact: bool) -> Dict:
+    """
+    Evaluate every filter criteria against a single row and return them all, for diagnostics on why a row was kept or rejected
+
+    NOTE: this needs to be run before the row is updated by filter_row
 
     Parameters
     ----------
@@ -40,55 +160,20 @@ def filter_row(row: Dict, is_impact: bool) -> Tuple[Dict, bool, bool, bool, bool
 
     Returns
     -------
-    dict:
-        the original row that was passed into the filter function (row)
-    bool:
-        whether the row should be kept in the "analysis" output file (analysis_keep)
-    bool:
-        whether the row should be kept in the cBioPortal output file (portal_keep)
-    bool:
-        whether the row should be kept as a fillout row in the cBioPortal file (fillout_keep)
-    bool:
-        whether the row should be rejected (reject_row)
-    str|None:
-        the reason the row was rejected (reject_reason)
+    dict
+        the value of each filter criteria, with keys in the order of filter_flags_keys
     """
-    # flags to determine whether the row should be kept or rejected
-    analysis_keep = False
-    portal_keep = False
-    fillout_keep = False
-    reject_row = True
-    reject_reason = None
-    reject_flag = None
-
     # dict to hold the filter criteria we are testing against
     filter_flags = {}
 
-    # update row keys;
-    # "The portal MAF can be minimized since Genome Nexus re-annotates it when HGVSp_Short column is missing"
-    row['Amino_Acid_Change'] = row['HGVSp_Short']
-    # NOTE: !!! This ^^^ logic is now in cBioProtal_utils.MafWriter ; from now on get this functionality from there!!
-    
-    event_type = row['Variant_Type']
-
     # get some values from the row to use for filter criteria
     # For all events except point mutations, use the variant caller reported allele counts for filtering
-    t_depth = int(row['t_depth'])
-    t_alt_count = int(row['t_alt_count'])
-    if event_type == "SNP":
-        t_depth = int(row['fillout_t_depth'])
-        t_alt_count = int(row['fillout_t_alt'])
-    tumor_vaf = float(t_alt_count) / float(t_depth) if t_depth != 0 else 0
+    t_depth, t_alt_count, tumor_vaf = get_tumor_counts(row)
 
     # check if it is removed by one or more ccs filters and nothing else
-    only_ccs_filters = True
-    filters = re.split(';|,', row['FILTER'])
-    for filter in filters:
-        if filter != "mq55" and filter != "nm2" and filter != "asb" and filter != "nad3":
-            only_ccs_filters = False
-            break
+    only_ccs_filters = only_has_ccs_filters(row['FILTER'])
 
-    HGVSc_splice_match = re.match(r'[nc]\.\d+[-+](\d+)_\d+[-+](\d+)|[nc]\.\d+[-+](\d+)', row['HGVSc']) # c.36-3C>T ; 3
+    HGVSc_splice_match_is_not_None, splice_dist = get_splice_dist(row['HGVSc'])
 
     # some filter criteria to check
     is_not_Pindel = row['set'] != 'Pindel'
@@ -103,30 +188,15 @@ def filter_row(row: Dict, is_impact: bool) -> Tuple[Dict, bool, bool, bool, bool
     # Skip MuTect-Rescue events for all but IMPACT/HemePACT projects
     set_MuTect_Rescue = row['set'] == 'MuTect-Rescue'
     set_MuTect_Rescue_and_not_is_impact =  set_MuTect_Rescue and not is_impact
-    splice_region_variant_with_Consequence = re.match(r'splice_region_variant', row['Consequence']) is not None
-    non_coding_with_Consequence = re.search(r'non_coding_', row['Consequence']) is not None
-
-    splice_dist = 0
-    HGVSc_splice_match_is_not_None = HGVSc_splice_match is not None
-    if HGVSc_splice_match_is_not_None:
-        # For indels, use the closest distance to the nearby splice junction
-        splice_dist = min(int(d) for d in [x for x in HGVSc_splice_match.group(1,2,3) if x is not None])
-        # c.36-3C>T ; 3
-        # c.927-3C>G ; 3
-        # c.542-4G>T ; 4
-        # c.3664-8C>T ; 8
-        # c.628-7C>T ; 7
-        # c.1705-3C>T ; 3
+    splice_region_variant_with_Consequence = splice_region_regex.match(row['Consequence']) is not None
+    non_coding_with_Consequence = non_coding_regex.search(row['Consequence']) is not None
+
     splice_dist_min_pass = splice_dist > 3
     # c.542-4G>T ; 4
     # c.3664-8C>T ; 8
     # c.628-7C>T ; 7
 
-    consequence_keep = ['missense_', 'stop_', 'frameshift_', 'splice_', 'inframe_', 'protein_altering_',
-        'start_', 'synonymous_', 'coding_sequence_', 'transcript_', 'exon_', 'initiator_codon_',
-        'disruptive_inframe_', 'conservative_missense_', 'rare_amino_acid_', 'mature_miRNA_', 'TFBS_']
-    consequence_pattern = r'|'.join(consequence_keep) # missense_|stop_|frameshift_|splice_|inframe_|protein_altering_|start_|synonymous_|coding_sequence_|transcript_|exon_|initiator_codon_|disruptive_inframe_|conservative_missense_|rare_amino_acid_|mature_miRNA_|TFBS_
-    consequence_match = re.match(consequence_pattern, row['Consequence'])
+    consequence_match = consequence_regex.match(row['Consequence'])
 
     pass_consequence_match = consequence_match is not None
     is_TERT = row['Hugo_Symbol'] == 'TERT'
@@ -141,27 +211,11 @@ def filter_row(row: Dict, is_impact: bool) -> Tuple[Dict, bool, bool, bool, bool
     dmp_fail = fail_DMP_t_depth or fail_DMP_t_alt_count or fail_DMP_tumor_vaf or fail_DMP_whitelist_filter
     dmp_fail_and_is_impact = dmp_fail and is_impact
 
-    # NOTE: why are we changing the column value here???
-    if dmp_fail and not dmp_fail_and_is_impact:
-        row['FILTER'] = "dmp_filter" if row['FILTER'] == 'PASS' else row['FILTER'] + ";dmp_filter"
-
-    synonymous_match = re.match(r'synonymous_|stop_retained_', row['Consequence']) is None
+    synonymous_match = synonymous_regex.match(row['Consequence']) is None
     entrez_gene_id_0 = row['Entrez_Gene_Id'] != 0
     intronic_event = splice_dist <= 2
     silent_mut_no_entrez_intronic = synonymous_match and entrez_gene_id_0 and intronic_event
 
-    # analysis_and_portal_pass = pass_FILTER_or_is_common_variant_or_is_common_variant_and_is_not_Pindel \
-    #     and pass_consequence_or_is_TERT \
-    #     and silent_mut_no_entrez_intronic
-    #
-    # analysis_pass = pass_FILTER_or_is_common_variant_or_is_common_variant_and_is_not_Pindel \
-    # and not set_MuTect_Rescue_and_not_is_impact \
-    # and not splice_region_variant_with_Consequence \
-    # and pass_consequence_or_is_TERT \
-    # and not is_impact_and_is_MT \
-    # and not dmp_fail_and_is_impact \
-    # and silent_mut_no_entrez_intronic
-
     filter_flags["silent_mut_no_entrez_intronic"] = silent_mut_no_entrez_intronic
     filter_flags["intronic_event"] = intronic_event
     filter_flags["entrez_gene_id_0"] = entrez_gene_id_0
@@ -195,139 +249,705 @@ def filter_row(row: Dict, is_impact: bool) -> Tuple[Dict, bool, bool, bool, bool
     filter_flags["splice_dist"] = splice_dist
     filter_flags["splice_dist_min_pass"] = splice_dist_min_pass
     filter_flags["set_MuTect_Rescue"] = set_MuTect_Rescue
+    return(filter_flags)
+
+def classify_row(row: Dict, is_impact: bool) -> Tuple[bool, bool, bool, bool, str, bool, bool]:
+    """
+    Decide which outputs a single row goes to, evaluating only the filter criteria needed to reach the decision
+
+    NOTE: does not modify the row, see update_row
+
+    Parameters
+    ----------
+    row: dict
+        a dictionary representing a single row read in from a .maf file
+    is_impact: bool
+        wether the sample should be assumed to be IMPACT sample or not; adjusted filter criteria
+
+    Returns
+    -------
+    bool:
+        whether the row should be kept in the "analysis" output file (analysis_keep)
+    bool:
+        whether the row should be kept in the cBioPortal output file (portal_keep)
+    bool:
+        whether the row should be kept as a fillout row in the cBioPortal file (fillout_keep)
+    bool:
+        whether the row should be rejected (reject_row)
+    str|None:
+        the filter_flags key for the reason the row was rejected (reject_flag), see reject_reasons
+    bool:
+        whether "dmp_filter" should be added to the row FILTER (dmp_filter)
+    bool:
+        whether the row should be tagged as "skipped_by_portal" in the analysis file (skipped_by_portal)
+    """
+    # apply the DMP's depth/allele-count/VAF cutoffs as soft filters in non-IMPACT; these get tagged on every row
+    dmp_filter = (not is_impact) and is_dmp_fail(row)
 
     #
     # ~~~~~~~~ KEEP THESE MUTATIONS ~~~~~~ #
     #
     # Store all fillout rows
-    if Mutation_Status_None:
-        fillout_keep = True
-        reject_row = False
-        return(row, analysis_keep, portal_keep, fillout_keep, reject_row, reject_reason, reject_flag, filter_flags)
+    if row['Mutation_Status'] == 'None':
+        return(False, False, True, False, None, dmp_filter, False)
+
+    # Skip any that failed false-positive filters, except common_variant and Skip all events reported uniquely by Pindel
+    FILTER = row['FILTER']
+    pass_FILTER_or_is_common_variant = FILTER == 'PASS' or FILTER == 'common_variant' or (is_impact and only_has_ccs_filters(FILTER))
+    if not (pass_FILTER_or_is_common_variant and row['set'] != 'Pindel'):
+        return(False, False, False, True, "pass_FILTER_or_is_common_variant_or_is_common_variant_and_is_not_Pindel", dmp_filter, False)
+
+    # Skip MuTect-Rescue events for all but IMPACT/HemePACT projects
+    if not is_impact and row['set'] == 'MuTect-Rescue':
+        return(False, False, False, True, "set_MuTect_Rescue_and_not_is_impact", dmp_filter, False)
+
+    # Skip splice region variants in non-coding genes, or those that are >3bp into introns
+    Consequence = row['Consequence']
+    HGVSc_splice_match_is_not_None, splice_dist = get_splice_dist(row['HGVSc'])
+    if splice_region_regex.match(Consequence) is not None:
+        if non_coding_regex.search(Consequence) is not None:
+            return(False, False, False, True, "non_coding_with_Consequence", dmp_filter, False)
+        # Parse the complex HGVSc format to determine the distance from the splice junction
+        if HGVSc_splice_match_is_not_None and splice_dist > 3:
+            return(False, False, False, True, "splice_dist_min_pass", dmp_filter, False)
+
+    # Skip all non-coding events except interesting ones like TERT promoter mutations
+    if consequence_regex.match(Consequence) is None:
+        if not (row['Hugo_Symbol'] == 'TERT' and 1295141 <= int(row['Start_Position']) <= 1295340):
+            return(False, False, False, True, "pass_consequence_or_is_TERT", dmp_filter, False)
+
+    # Skip reporting MT muts in IMPACT, and apply the DMP's depth/allele-count/VAF cutoffs as hard filters in IMPACT, and soft filters in non-IMPACT
+    if is_impact and row['Chromosome'] == 'MT':
+        return(False, False, False, True, "is_impact_and_is_MT", dmp_filter, False)
+
+    if is_impact and is_dmp_fail(row):
+        return(False, False, False, True, "dmp_fail_and_is_impact", dmp_filter, False)
+
     #
-    # ~~~~~~~~~~~~~~ #
+    # ~~~~~~~~ KEEP THESE MUTATIONS ~~~~~~ #
     #
+    # The portal also skips silent muts, genes without Entrez IDs, and intronic events
+    # NOTE: Entrez_Gene_Id is a str so it is never equal to 0
+    if synonymous_regex.match(Consequence) is None and row['Entrez_Gene_Id'] != 0 and splice_dist <= 2:
+        return(True, True, False, False, None, dmp_filter, False)
 
-    # Skip any that failed false-positive filters, except common_variant and Skip all events reported uniquely by Pindel
-    if not pass_FILTER_or_is_common_variant_or_is_common_variant_and_is_not_Pindel:
-        reject_reason = 'Skip any that failed false-positive filters, except common_variant and Skip all events reported uniquely by Pindel'
-        reject_flag = "pass_FILTER_or_is_common_variant_or_is_common_variant_and_is_not_Pindel"
+    # tag this events in analysis maf as "skipped_by_portal" in column "Mutation_Status"
+    return(True, False, False, False, None, dmp_filter, True)
 
-    # Skip any that failed false-positive filters, except common_variant and Skip all events reported uniquely by Pindel
-    if pass_FILTER_or_is_common_variant_or_is_common_variant_and_is_not_Pindel:
-        # Skip MuTect-Rescue events for all but IMPACT/HemePACT projects
-        if set_MuTect_Rescue_and_not_is_impact:
-            reject_row = True
-            reject_reason = 'Skip MuTect-Rescue events for all but IMPACT/HemePACT projects'
-            reject_flag = "set_MuTect_Rescue_and_not_is_impact"
-            return(row, analysis_keep, portal_keep, fillout_keep, reject_row, reject_reason, reject_flag, filter_flags)
-
-        # Skip splice region variants in non-coding genes, or those that are >3bp into introns
-        if splice_region_variant_with_Consequence:
-            if non_coding_with_Consequence:
-                reject_row = True
-                reject_reason = 'Skip splice region variants in non-coding genes'
-                reject_flag = "non_coding_with_Consequence"
-                return(row, analysis_keep, portal_keep, fillout_keep, reject_row, reject_reason, reject_flag, filter_flags)
-
-            # Parse the complex HGVSc format to determine the distance from the splice junction
-            if HGVSc_splice_match_is_not_None:
-                if splice_dist_min_pass:
-                    reject_row = True
-                    reject_reason = 'Skip splice region variants that are >3bp into introns'
-                    reject_flag = "splice_dist_min_pass"
-                    return(row, analysis_keep, portal_keep, fillout_keep, reject_row, reject_reason, reject_flag, filter_flags)
-
-        if not pass_consequence_or_is_TERT:
-            reject_reason = 'Skip all non-coding events except interesting ones like TERT promoter mutations'
-            reject_flag = 'pass_consequence_or_is_TERT'
-
-        # Skip all non-coding events except interesting ones like TERT promoter mutations
-        if pass_consequence_or_is_TERT:
-            # Skip reporting MT muts in IMPACT, and apply the DMP's depth/allele-count/VAF cutoffs as hard filters in IMPACT, and soft filters in non-IMPACT
-            if is_impact_and_is_MT:
-                reject_row = True
-                reject_reason = 'Skip reporting MT muts in IMPACT'
-                reject_flag = "is_impact_and_is_MT"
-                return(row, analysis_keep, portal_keep, fillout_keep, reject_row, reject_reason, reject_flag, filter_flags)
-
-            if dmp_fail_and_is_impact:
-                reject_row = True
-                reject_reason = 'Apply the DMP depth/allele-count/VAF cutoffs as hard filters in IMPACT, and soft filters in non-IMPACT'
-                reject_flag = "dmp_fail_and_is_impact"
-                return(row, analysis_keep, portal_keep, fillout_keep, reject_row, reject_reason, reject_flag, filter_flags)
-
-            #
-            # ~~~~~~~~ KEEP THESE MUTATIONS ~~~~~~ #
-            #
-            # The portal also skips silent muts, genes without Entrez IDs, and intronic events
-            if silent_mut_no_entrez_intronic:
-                portal_keep = True
-                analysis_keep = True
-                reject_row = False
-                return(row, analysis_keep, portal_keep, fillout_keep, reject_row, reject_reason, reject_flag, filter_flags)
-
-            # tag this events in analysis maf as "skipped_by_portal" in column "Mutation_Status"
-            else:
-                row['Mutation_Status'] = "skipped_by_portal"
-                analysis_keep = True
-                reject_row = False
-                return(row, analysis_keep, portal_keep, fillout_keep, reject_row, reject_reason, reject_flag, filter_flags)
-            #
-            # ~~~~~~~~~~~~~~ #
-            #
+def update_row(row: Dict, dmp_filter: bool, skipped_by_portal: bool) -> Dict:
+    """
+    Apply the in-place updates to a row after it has been classified
+    """
+    # update row keys;
+    # "The portal MAF can be minimized since Genome Nexus re-annotates it when HGVSp_Short column is missing"
+    row['Amino_Acid_Change'] = row['HGVSp_Short']
+    # NOTE: !!! This ^^^ logic is now in cBioProtal_utils.MafWriter ; from now on get this functionality from there!!
+
+    # NOTE: why are we changing the column value here???
+    if dmp_filter:
+        row['FILTER'] = "dmp_filter" if row['FILTER'] == 'PASS' else row['FILTER'] + ";dmp_filter"
+
+    if skipped_by_portal:
+        row['Mutation_Status'] = "skipped_by_portal"
+    return(row)
 
+def filter_row(row: Dict, is_impact: bool, diagnostics: bool = True) -> Tuple[Dict, bool, bool, bool, bool, str, str, Dict]:
+    """
+    Check filter criteria against a single row representing a variant
+
+    Parameters
+    ----------
+    row: dict
+        a dictionary representing a single row read in from a .maf file
+    is_impact: bool
+        wether the sample should be assumed to be IMPACT sample or not; adjusted filter criteria
+    diagnostics: bool | str
+        True to return the filter_flags for every row, 'rejects' to return them only for rejected rows, False to never return them.
+        Evaluating all of the filter_flags is much slower than only checking the criteria needed to classify the row
+
+    Returns
+    -------
+    dict:
+        the original row that was passed into the filter function (row)
+    bool:
+        whether the row should be kept in the "analysis" output file (analysis_keep)
+    bool:
+        whether the row should be kept in the cBioPortal output file (portal_keep)
+    bool:
+        whether the row should be kept as a fillout row in the cBioPortal file (fillout_keep)
+    bool:
+        whether the row should be rejected (reject_row)
+    str|None:
+        the reason the row was rejected (reject_reason)
+    str|None:
+        the filter criteria the row was rejected by (reject_flag)
+    dict|None:
+        the values of all the filter criteria (filter_flags), depending on `diagnostics`
+    """
+    analysis_keep, portal_keep, fillout_keep, reject_row, reject_flag, dmp_filter, skipped_by_portal = classify_row(row, is_impact)
+    reject_reason = reject_reasons.get(reject_flag, None)
+
+    # evaluate the diagnostics before the row gets updated
+    filter_flags = None
+    if diagnostics is True or (diagnostics == 'rejects' and reject_row):
+        filter_flags = get_filter_flags(row, is_impact)
+
+    update_row(row, dmp_filter, skipped_by_portal)
     return(row, analysis_keep, portal_keep, fillout_keep, reject_row, reject_reason, reject_flag, filter_flags)
 
-def filter_rows(
+def make_rejected_row(row: Dict, reject_reason: str, reject_flag: str, filter_flags: Dict) -> Dict:
+    """
+    Make a copy of a rejected row with the reasons it was rejected added to it
+    """
+    # make a copy of the row
+    rejected_row = { k:v for k,v in row.items() }
+    # add the reason to the row
+    rejected_row['reject_reason'] = reject_reason
+    rejected_row['reject_flag'] = reject_flag
+    rejected_row['filter_flags'] = json.dumps(filter_flags)
+    return(rejected_row)
+
+def iter_filter_rows(
         row_list: List[Dict],
         is_impact: bool,
         keep_rejects: bool = False
+        ) -> Iterator[ Tuple[Dict, bool, bool, bool, Dict] ]:
+    """
+    Filters the rows one at a time, yielding each row as soon as it has been classified
+
+    Yields
+    ------
+    tuple
+        (row, analysis_keep, portal_keep, fillout_keep, rejected_row); rejected_row is None unless keep_rejects is set and the row was rejected
+    """
+    # only build the full filter_flags for the rows that will be saved to the rejected file
+    diagnostics = 'rejects' if keep_rejects else False
+    for row in row_list:
+        new_row, analysis_keep, portal_keep, fillout_keep, reject_row, reject_reason, reject_flag, filter_flags = filter_row(row, is_impact, diagnostics = diagnostics)
+        rejected_row = None
+        if keep_rejects and reject_row:
+            rejected_row = make_rejected_row(row, reject_reason, reject_flag, filter_flags)
+        yield(row, analysis_keep, portal_keep, fillout_keep, rejected_row)
+
+def collect_filtered_rows(
+        filtered_rows: Iterator[ Tuple[Dict, bool, bool, bool, Dict] ]
         ) -> Tuple[ List[Dict], List[Dict], List[Dict], List[Dict] ]:
     """
-    Filters the rows in the list
+    Collect the output of iter_filter_rows or iter_filter_rows_batch into lists
     """
     analysis_keep_list = []
     portal_keep_list = []
     fillout_keep_list = []
     rejected_list = []
 
-    for row in row_list:
-        new_row, analysis_keep, portal_keep, fillout_keep, reject_row, reject_reason, reject_flag, filter_flags = filter_row(row, is_impact)
+    for row, analysis_keep, portal_keep, fillout_keep, rejected_row in filtered_rows:
         if analysis_keep:
             analysis_keep_list.append(row)
         if portal_keep:
             portal_keep_list.append(row)
         if fillout_keep:
             fillout_keep_list.append(row)
-        if keep_rejects:
-            if reject_row:
-                # make a copy of the row
-                rejected_row = { k:v for k,v in row.items() }
-                # add the reason to the row
-                rejected_row['reject_reason'] = reject_reason
-                rejected_row['reject_flag'] = reject_flag
-                rejected_row['filter_flags'] = json.dumps(filter_flags)
-                rejected_list.append(rejected_row)
+        if rejected_row is not None:
+            rejected_list.append(rejected_row)
 
     return(analysis_keep_list, portal_keep_list, fillout_keep_list, rejected_list)
 
+def filter_rows(
+        row_list: List[Dict],
+        is_impact: bool,
+        keep_rejects: bool = False
+        ) -> Tuple[ List[Dict], List[Dict], List[Dict], List[Dict] ]:
+    """
+    Filters the rows in the list
+
+    NOTE: holds all the kept rows in memory, use iter_filter_rows to stream them instead
+    """
+    filtered_rows = iter_filter_rows(row_list = row_list, is_impact = is_impact, keep_rejects = keep_rejects)
+    return(collect_filtered_rows(filtered_rows))
+
+
+def filter_chunk(rows: List[Dict], is_impact: bool) -> Dict:
+    """
+    Evaluate all of the filter_row criteria at once for a chunk of rows
+
+    Each criteria is evaluated column-wise over the whole chunk and returned as a numpy array with one value per row,
+    using the same names as the filter_flags from filter_row.
+    The "analysis_keep", "portal_keep", "fillout_keep", "reject_row", and "skipped_by_portal" arrays hold the outcomes for each row,
+    and "reject_flag" holds the reject_flag for each row (None for rows that were not rejected)
+
+    NOTE: the rows are not modified here, see apply_chunk_updates
+
+    Parameters
+    ----------
+    rows: list
+        a list of dicts representing rows read in from a .maf file
+    is_impact: bool
+        wether the sample should be assumed to be IMPACT sample or not; adjusted filter criteria
+
+    Returns
+    -------
+    dict
+        a dict of numpy arrays of criteria values for the rows
+    """
+    import numpy as np
+    num_rows = len(rows)
+    flags = {}
+
+    # each column is read once, and the criteria for the column are only evaluated once for each distinct value in it;
+    # the loops over the rows run in C with map, and the per-row values are converted into numpy arrays
+    def map_column(column, func, dtype = bool, mask = None):
+        # select the rows before getting the column, since some columns are only present for the rows in the mask
+        selected = rows if mask is None else compress(rows, mask)
+        values = list(map(itemgetter(column), selected))
+        lookup = { value: func(value) for value in set(values) }
+        return(np.fromiter(map(lookup.__getitem__, values), dtype = dtype, count = len(values)))
+
+    # For all events except point mutations, use the variant caller reported allele counts for filtering
+    is_SNP = map_column('Variant_Type', lambda v: v == "SNP")
+    is_SNP_list = is_SNP.tolist()
+    not_SNP_list = (~is_SNP).tolist()
+    t_depth = np.empty(num_rows, dtype = np.int64)
+    t_depth[is_SNP] = map_column('fillout_t_depth', int, dtype = np.int64, mask = is_SNP_list)
+    t_depth[~is_SNP] = map_column('t_depth', int, dtype = np.int64, mask = not_SNP_list)
+    t_alt_count = np.empty(num_rows, dtype = np.int64)
+    t_alt_count[is_SNP] = map_column('fillout_t_alt', int, dtype = np.int64, mask = is_SNP_list)
+    t_alt_count[~is_SNP] = map_column('t_alt_count', int, dtype = np.int64, mask = not_SNP_list)
+    tumor_vaf = np.zeros(num_rows, dtype = np.float64)
+    np.divide(t_alt_count, t_depth, out = tumor_vaf, where = t_depth != 0)
+    start_position = map_column('Start_Position', int, dtype = np.int64)
+
+    # columns with several criteria get all of them packed into the bits of one value
+    def splice_bits(HGVSc):
+        HGVSc_splice_match_is_not_None, splice_dist = get_splice_dist(HGVSc)
+        return(splice_dist * 2 + HGVSc_splice_match_is_not_None)
+    splice = map_column('HGVSc', splice_bits, dtype = np.int64)
+    HGVSc_splice_match_is_not_None = (splice & 1).astype(bool)
+    splice_dist = splice >> 1
+
+    FILTER_bits = map_column('FILTER', lambda f: (f == 'PASS') | (f == 'common_variant') << 1 | only_has_ccs_filters(f) << 2, dtype = np.uint8)
+    pass_FILTER = (FILTER_bits & 1).astype(bool)
+    is_common_variant = (FILTER_bits & 2).astype(bool)
+    only_ccs_filters = (FILTER_bits & 4).astype(bool)
+
+    Consequence_bits = map_column('Consequence', lambda c: (
+        (splice_region_regex.match(c) is not None)
+        | (non_coding_regex.search(c) is not None) << 1
+        | (consequence_regex.match(c) is not None) << 2
+        | (synonymous_regex.match(c) is None) << 3), dtype = np.uint8)
+    splice_region_variant_with_Consequence = (Consequence_bits & 1).astype(bool)
+    non_coding_with_Consequence = (Consequence_bits & 2).astype(bool)
+    pass_consequence_match = (Consequence_bits & 4).astype(bool)
+    synonymous_match = (Consequence_bits & 8).astype(bool)
+
+    set_bits = map_column('set', lambda s: (s != 'Pindel') | (s == 'MuTect-Rescue') << 1, dtype = np.uint8)
+    is_not_Pindel = (set_bits & 1).astype(bool)
+    set_MuTect_Rescue = (set_bits & 2).astype(bool)
+
+    Mutation_Status_None = map_column('Mutation_Status', lambda v: v == 'None')
+    is_TERT = map_column('Hugo_Symbol', lambda v: v == 'TERT')
+    is_MT = map_column('Chromosome', lambda v: v == 'MT')
+    hotspot_whitelist_FALSE = map_column('hotspot_whitelist', lambda v: v == 'FALSE')
+    # NOTE: Entrez_Gene_Id is a str so it is never equal to 0; keep it the same as filter_row
+    entrez_gene_id_0 = np.ones(num_rows, dtype = bool)
+
+    # combined criteria
+    is_impact_and_only_ccs_filters = only_ccs_filters & is_impact
+    pass_FILTER_or_is_common_variant_or_is_common_variant_and_is_not_Pindel = (pass_FILTER | is_common_variant | is_impact_and_only_ccs_filters) & is_not_Pindel
+    set_MuTect_Rescue_and_not_is_impact = set_MuTect_Rescue & (not is_impact)
+    splice_dist_min_pass = splice_dist > 3
+    pass_TERT_start = start_position >= 1295141
+    pass_TERT_end = start_position <= 1295340
+    pass_consequence_or_is_TERT = pass_consequence_match | (is_TERT & pass_TERT_start & pass_TERT_end)
+    is_impact_and_is_MT = is_MT & is_impact
+    fail_DMP_t_depth = t_depth < 20
+    fail_DMP_t_alt_count = t_alt_count < 8
+    fail_DMP_tumor_vaf = tumor_vaf < 0.02
+    fail_DMP_whitelist_filter = hotspot_whitelist_FALSE & ((t_alt_count < 10) | (tumor_vaf < 0.05))
+    dmp_fail = fail_DMP_t_depth | fail_DMP_t_alt_count | fail_DMP_tumor_vaf | fail_DMP_whitelist_filter
+    dmp_fail_and_is_impact = dmp_fail & is_impact
+    intronic_event = splice_dist <= 2
+    silent_mut_no_entrez_intronic = synonymous_match & entrez_gene_id_0 & intronic_event
+
+    # walk through the filter_row decision tree with masks; each reject mask only applies to rows that passed all the previous checks
+    not_fillout = ~Mutation_Status_None
+    remaining = not_fillout.copy()
+    reject_masks = OrderedDict()
+    reject_masks["pass_FILTER_or_is_common_variant_or_is_common_variant_and_is_not_Pindel"] = remaining & ~pass_FILTER_or_is_common_variant_or_is_common_variant_and_is_not_Pindel
+    remaining &= pass_FILTER_or_is_common_variant_or_is_common_variant_and_is_not_Pindel
+    reject_masks["set_MuTect_Rescue_and_not_is_impact"] = remaining & set_MuTect_Rescue_and_not_is_impact
+    remaining &= ~set_MuTect_Rescue_and_not_is_impact
+    reject_masks["non_coding_with_Consequence"] = remaining & splice_region_variant_with_Consequence & non_coding_with_Consequence
+    remaining &= ~reject_masks["non_coding_with_Consequence"]
+    reject_masks["splice_dist_min_pass"] = remaining & splice_region_variant_with_Consequence & HGVSc_splice_match_is_not_None & splice_dist_min_pass
+    remaining &= ~reject_masks["splice_dist_min_pass"]
+    reject_masks["pass_consequence_or_is_TERT"] = remaining & ~pass_consequence_or_is_TERT
+    remaining &= pass_consequence_or_is_TERT
+    reject_masks["is_impact_and_is_MT"] = remaining & is_impact_and_is_MT
+    remaining &= ~is_impact_and_is_MT
+    reject_masks["dmp_fail_and_is_impact"] = remaining & dmp_fail_and_is_impact
+    remaining &= ~dmp_fail_and_is_impact
+
+    reject_flag = np.full(num_rows, None, dtype = object)
+    for flag, mask in reject_masks.items():
+        reject_flag[mask] = flag
+
+    flags["silent_mut_no_entrez_intronic"] = silent_mut_no_entrez_intronic
+    flags["intronic_event"] = intronic_event
+    flags["entrez_gene_id_0"] = entrez_gene_id_0
+    flags["synonymous_match"] = synonymous_match
+    # filter_row uses an int 0 when there is no depth
+    flags["tumor_vaf"] = tumor_vaf.astype(object)
+    flags["tumor_vaf"][t_depth == 0] = 0
+    flags["is_not_Pindel"] = is_not_Pindel
+    flags["is_impact"] = np.full(num_rows, is_impact, dtype = bool)
+    flags["only_ccs_filters"] = only_ccs_filters
+    flags["is_impact_and_only_ccs_filters"] = is_impact_and_only_ccs_filters
+    flags["pass_FILTER"] = pass_FILTER
+    flags["is_common_variant"] = is_common_variant
+    flags["Mutation_Status_None"] = Mutation_Status_None
+    flags["pass_FILTER_or_is_common_variant_or_is_common_variant_and_is_not_Pindel"] = pass_FILTER_or_is_common_variant_or_is_common_variant_and_is_not_Pindel
+    flags["set_MuTect_Rescue_and_not_is_impact"] = set_MuTect_Rescue_and_not_is_impact
+    flags["splice_region_variant_with_Consequence"] = splice_region_variant_with_Consequence
+    flags["non_coding_with_Consequence"] = non_coding_with_Consequence
+    flags["HGVSc_splice_match_is_not_None"] = HGVSc_splice_match_is_not_None
+    flags["pass_consequence_match"] = pass_consequence_match
+    flags["is_TERT"] = is_TERT
+    flags["pass_TERT_start"] = pass_TERT_start
+    flags["pass_TERT_end"] = pass_TERT_end
+    flags["pass_consequence_or_is_TERT"] = pass_consequence_or_is_TERT
+    flags["is_impact_and_is_MT"] = is_impact_and_is_MT
+    flags["fail_DMP_t_depth"] = fail_DMP_t_depth
+    flags["fail_DMP_t_alt_count"] = fail_DMP_t_alt_count
+    flags["fail_DMP_tumor_vaf"] = fail_DMP_tumor_vaf
+    flags["fail_DMP_whitelist_filter"] = fail_DMP_whitelist_filter
+    flags["dmp_fail"] = dmp_fail
+    flags["dmp_fail_and_is_impact"] = dmp_fail_and_is_impact
+    flags["splice_dist"] = splice_dist
+    flags["splice_dist_min_pass"] = splice_dist_min_pass
+    flags["set_MuTect_Rescue"] = set_MuTect_Rescue
+
+    # outcomes for each row
+    flags["fillout_keep"] = Mutation_Status_None
+    flags["analysis_keep"] = remaining
+    flags["portal_keep"] = remaining & silent_mut_no_entrez_intronic
+    flags["skipped_by_portal"] = remaining & ~silent_mut_no_entrez_intronic
+    flags["reject_row"] = not_fillout & ~remaining
+    flags["reject_flag"] = reject_flag
+    flags["dmp_filter"] = dmp_fail & (not is_impact)
+    return(flags)
+
+def apply_chunk_updates(rows: List[Dict], flags: Dict) -> None:
+    """
+    Apply the same in-place row updates that filter_row makes, using the criteria from filter_chunk
+    """
+    for row, dmp_filter, skipped_by_portal in zip(rows, flags["dmp_filter"].tolist(), flags["skipped_by_portal"].tolist()):
+        update_row(row, dmp_filter, skipped_by_portal)
+
+def iter_filter_rows_batch(
+        row_list: List[Dict],
+        is_impact: bool,
+        keep_rejects: bool = False,
+        chunk_size: int = 10000
+        ) -> Iterator[ Tuple[Dict, bool, bool, bool, Dict] ]:
+    """
+    Filters the rows in chunks, yielding the same output as iter_filter_rows
+
+    Each chunk of rows is evaluated column-wise with filter_chunk instead of one row at a time with filter_row
+
+    Parameters
+    ----------
+    row_list: list | iterable
+        the rows to filter, such as a csv.DictReader
+    is_impact: bool
+        wether the sample should be assumed to be IMPACT sample or not; adjusted filter criteria
+    keep_rejects: bool
+        wether or not to return the rejected rows
+    chunk_size: int
+        the number of rows to evaluate at once
+    """
+    row_iter = iter(row_list)
+    while True:
+        rows = list(islice(row_iter, chunk_size))
+        if not rows:
+            break
+        flags = filter_chunk(rows, is_impact)
+        apply_chunk_updates(rows, flags)
+
+        analysis_keep = flags["analysis_keep"].tolist()
+        portal_keep = flags["portal_keep"].tolist()
+        fillout_keep = flags["fillout_keep"].tolist()
+        rejected_rows = {}
+
+        if keep_rejects:
+            # only convert the criteria for the rejected rows back into per-row filter_flags
+            reject_indexes = flags["reject_row"].nonzero()[0]
+            reject_flags = { key: flags[key][reject_indexes].tolist() for key in [ *filter_flags_keys, "reject_flag" ] }
+            for j, i in enumerate(reject_indexes.tolist()):
+                reject_flag = reject_flags["reject_flag"][j]
+                filter_flags = { key: reject_flags[key][j] for key in filter_flags_keys }
+                rejected_rows[i] = make_rejected_row(rows[i], reject_reasons.get(reject_flag, None), reject_flag, filter_flags)
+
+        for i, row in enumerate(rows):
+            yield(row, analysis_keep[i], portal_keep[i], fillout_keep[i], rejected_rows.get(i, None))
+
+def filter_rows_batch(
+        row_list: List[Dict],
+        is_impact: bool,
+        keep_rejects: bool = False,
+        chunk_size: int = 10000
+        ) -> Tuple[ List[Dict], List[Dict], List[Dict], List[Dict] ]:
+    """
+    Filters the rows in the list in chunks; gives the same output as filter_rows
+    """
+    filtered_rows = iter_filter_rows_batch(row_list = row_list, is_impact = is_impact, keep_rejects = keep_rejects, chunk_size = chunk_size)
+    return(collect_filtered_rows(filtered_rows))
+
+
+def get_writer(fout: TextIO, fieldnames: List[str]) -> csv.DictWriter:
+    """
+    Get a csv writer for the maf output files
+
+    NOTE: csv writer includes carriage returns that we dont want
+    https://stackoverflow.com/questions/3191528/csv-in-python-adding-an-extra-carriage-return-on-windows
+    """
+    # ignore fields not in fieldnames
+    writer = csv.DictWriter(fout, delimiter = '\t', fieldnames = fieldnames, extrasaction = 'ignore', lineterminator='\n')
+    return(writer)
+
+def write_filtered_rows(
+        filtered_rows: Iterator[ Tuple[Dict, bool, bool, bool, Dict] ],
+        analyst_fout: TextIO,
+        portal_fout: TextIO,
+        fillout_fout: TextIO,
+        rejected_fout: TextIO,
+        fieldnames: List[str],
+        portal_fieldnames: List[str],
+        reject_fieldnames: List[str]
+        ) -> None:
+    """
+    Write each row from iter_filter_rows or iter_filter_rows_batch to its output file handles as soon as it is classified
+
+    NOTE: does not write the header lines; rejected_fout can be None if rejected rows are not being kept
+    """
+    analyst_writer = get_writer(analyst_fout, fieldnames)
+    portal_writer = get_writer(portal_fout, portal_fieldnames)
+    fillout_writer = get_writer(fillout_fout, portal_fieldnames)
+    if rejected_fout is not None:
+        rejected_writer = get_writer(rejected_fout, reject_fieldnames)
+
+    for row, analysis_keep, portal_keep, fillout_keep, rejected_row in filtered_rows:
+        if analysis_keep:
+            analyst_writer.writerow(row)
+        if portal_keep:
+            portal_writer.writerow(row)
+        if fillout_keep:
+            fillout_writer.writerow(row)
+        if rejected_row is not None:
+            rejected_writer.writerow(rejected_row)
+
+def get_shard_ranges(input_file: str, num_shards: int, comment_char: str = '#') -> List[Tuple[int, int]]:
+    """
+    Split the table rows of the input file into byte ranges that start and end on line boundaries
+
+    The ranges start after the comment lines and header line, and are roughly equal in size.
+    Files with few rows may get fewer ranges than requested
+
+    NOTE: assumes that there are no newlines embedded inside table values
+
+    Returns
+    -------
+    list
+        a list of (start, end) byte offsets for each shard
+    """
+    with open(input_file, 'rb') as fin:
+        # skip past the comments and header line
+        data_start = find_data_offset(fin, comment_char = comment_char)
+        file_size = os.fstat(fin.fileno()).st_size
+
+        boundaries = [ data_start ]
+        for i in range(1, num_shards):
+            pos = data_start + (file_size - data_start) * i // num_shards
+            # move forward to the start of the next line
+            fin.seek(max(pos - 1, data_start))
+            fin.readline()
+            pos = fin.tell()
+            if boundaries[-1] < pos < file_size:
+                boundaries.append(pos)
+        boundaries.append(file_size)
+
+    ranges = [ (start, end) for start, end in zip(boundaries[:-1], boundaries[1:]) if start < end ]
+    return(ranges)
+
+def read_shard_lines(input_file: str, start: int, end: int) -> Iterator[str]:
+    """
+    Iterate over the text lines in the given byte range of the input file
+    """
+    with open(input_file, 'rb') as fin:
+        fin.seek(start)
+        pos = start
+        for line in fin:
+            if pos >= end:
+                break
+            pos += len(line)
+            yield(line.decode())
+
+def filter_shard(
+        input_file: str,
+        start: int,
+        end: int,
+        shard_prefix: str,
+        fieldnames: List[str],
+        portal_fieldnames: List[str],
+        reject_fieldnames: List[str],
+        is_impact: bool,
+        keep_rejects: bool = False,
+        batch: bool = False,
+        chunk_size: int = 10000
+        ) -> Dict:
+    """
+    Filter the rows in a byte range of the input file, and write the kept rows to temporary files for the shard
+
+    Runs in a worker process for main with multiple workers
+
+    Returns
+    -------
+    dict
+        the paths to the "analysis", "portal", "fillout", and "rejected" output files for the shard (without header lines)
+    """
+    shard_files = OrderedDict([
+        ("analysis", shard_prefix + ".analysis.maf"),
+        ("portal", shard_prefix + ".portal.maf"),
+        ("fillout", shard_prefix + ".fillout.maf"),
+        ("rejected", shard_prefix + ".rejected.maf")
+        ])
+    reader = csv.DictReader(read_shard_lines(input_file, start, end), delimiter = '\t', fieldnames = fieldnames)
+    if batch:
+        filtered_rows = iter_filter_rows_batch(row_list = reader, is_impact = is_impact, keep_rejects = keep_rejects, chunk_size = chunk_size)
+    else:
+        filtered_rows = iter_filter_rows(row_list = reader, is_impact = is_impact, keep_rejects = keep_rejects)
+
+    with ExitStack() as stack:
+        fouts = { key: stack.enter_context(open(path, "w")) for key, path in shard_files.items() }
+        write_filtered_rows(
+            filtered_rows = filtered_rows,
+            analyst_fout = fouts["analysis"],
+            portal_fout = fouts["portal"],
+            fillout_fout = fouts["fillout"],
+            rejected_fout = fouts["rejected"] if keep_rejects else None,
+            fieldnames = fieldnames,
+            portal_fieldnames = portal_fieldnames,
+            reject_fieldnames = reject_fieldnames)
+    return(shard_files)
+
+def filter_shards(
+        input_file: Union[str, List[str]],
+        workers: int,
+        analyst_fout: TextIO,
+        portal_fout: TextIO,
+        rejected_fout: TextIO,
+        **kwargs
+        ) -> None:
+    """
+    Filter the input file in parallel by splitting its rows into byte ranges and running filter_shard on each range in a process pool,
+    then append each shard's output to the output file handles in the original input order
+
+    NOTE: all fillout rows from every shard go after all the portal rows, same as when filtering with a single process
+
+    Parameters
+    ----------
+    input_file: str | list
+        the input .maf file to be filtered, or a list of .maf files with the same header; the rows of each file are split separately
+    workers: int
+        the number of worker processes to use
+    analyst_fout, portal_fout, rejected_fout: TextIO
+        the output file handles, with the header lines already written; rejected_fout can be None if rejected rows are not being kept
+    kwargs: dict
+        the rest of the args for filter_shard
+    """
+    input_files = [ input_file ] if isinstance(input_file, str) else input_file
+    # split the workers between the files; files with only a few rows get fewer shards anyway
+    num_shards = max(1, -(-workers // len(input_files)))
+    shard_ranges = [ (filename, start, end) for filename in input_files for start, end in get_shard_ranges(filename, num_shards = num_shards) ]
+    # put the shard files next to the output so large temp files do not end up in a small /tmp
+    shard_dir = tempfile.mkdtemp(dir = os.path.dirname(os.path.abspath(analyst_fout.name)))
+    try:
+        with ProcessPoolExecutor(max_workers = workers) as executor:
+            futures = [ executor.submit(filter_shard,
+                input_file = filename,
+                start = start,
+                end = end,
+                shard_prefix = os.path.join(shard_dir, str(i)),
+                **kwargs) for i, (filename, start, end) in enumerate(shard_ranges) ]
+            # NOTE: get all results before merging so errors in any shard are raised here
+            shard_files = [ future.result() for future in futures ]
+
+        for key, fout in [("analysis", analyst_fout), ("portal", portal_fout), ("fillout", portal_fout), ("rejected", rejected_fout)]:
+            if fout is None:
+                continue
+            for files in shard_files:
+                with open(files[key]) as fin:
+                    shutil.copyfileobj(fin, fout)
+    finally:
+        shutil.rmtree(shard_dir)
+
+# keep only a subset of fieldnames in the reject file output;
+reject_fieldnames_keep = [
+# keep every "row" field that is explicitly referenced in the filter_row function...
+'Amino_Acid_Change',
+'HGVSp_Short',
+'Variant_Type',
+'t_depth',
+'t_alt_count',
+'fillout_t_depth',
+'fillout_t_alt',
+'FILTER',
+'HGVSc',
+'set',
+'Mutation_Status',
+'Consequence',
+'Hugo_Symbol',
+'Start_Position',
+'Chromosome',
+'hotspot_whitelist',
+'Entrez_Gene_Id',
+# extra fields for easy variant idenfitication
+"End_Position",
+"Variant_Classification",
+"Reference_Allele",
+"Tumor_Seq_Allele1",
+"Tumor_Seq_Allele2",
+"Tumor_Sample_Barcode",
+"Matched_Norm_Sample_Barcode",
+"Match_Norm_Seq_Allele1",
+"Match_Norm_Seq_Allele2",
+"HGVSp",
+"Transcript_ID"
+"Exon_Number",
+"t_ref_count",
+"n_depth",
+"n_ref_count",
+"n_alt_count"
+# "all_effects" # this one is too long
+]
 
 def main(
-    input_file: str,
+    input_file: Union[str, List[str]],
     version_string: str,
     analyst_file: str,
     portal_file: str,
     is_impact: bool = True,
     rejected_file: str = 'rejected.muts.maf',
-    keep_rejects: bool = False) -> None:
+    keep_rejects: bool = False,
+    batch: bool = False,
+    chunk_size: int = 10000,
+    workers: int = 1) -> None:
     """
     Main control function for the module when called as a script. Filters the input .maf file into an "analyst file" and a "portal file", meant to be used for downstream data analysis and for import to cBioPortal, respectively.
 
     Parameters
     ----------
-    input_file: str
-        the input .maf file to be filtered
+    input_file: str | list
+        the input .maf file to be filtered, or a list of .maf files with the same header that are collated in order and filtered as a single table
     version_string: str
         a verstion label to be used in the output comment
     analyst_file: str
@@ -340,104 +960,94 @@ def main(
         the name of the file to save rejected variants to
     keep_rejects: bool
         wether or not to save rejected variants to the rejected_file
+    batch: bool
+        use the chunked filter_rows_batch engine instead of filtering one row at a time
+    chunk_size: int
+        the number of rows to evaluate at once with the batch engine
+    workers: int
+        the number of processes to filter the input file with; the rows are split into byte ranges for each process
     """
     version_line = "# Versions: " + version_string.replace('_',' ')
 
-    # get the comments from the file and find the beginning of the table header
-    comments, start_line = parse_header_comments(input_file)
+    # get the comments from the file and the table header;
+    # multiple input files are read in turn without combining them into a single file first
+    input_files = [ input_file ] if isinstance(input_file, str) else input_file
+    if len(input_files) == 1:
+        maf_reader = MafReader(input_files[0])
+    else:
+        maf_reader = TableCollator(input_files)
+    comments = maf_reader.comments
     comments.append(version_line)
     comments_lines = [ c + '\n' for c in comments ]
+    fieldnames = maf_reader.get_fieldnames()
 
-    with open(input_file,'r') as fin:
-        # skip comment lines
-        while start_line > 0:
-            next(fin)
-            start_line -= 1
-
-        reader = csv.DictReader(fin, delimiter = '\t')
-        fieldnames = reader.fieldnames
-
-        analysis_keep, portal_keep, fillout_keep, rejected_list = filter_rows(row_list = reader, is_impact = is_impact, keep_rejects = keep_rejects)
-
-    # write analysis files
-    with open(analyst_file,'w') as fout:
-        fout.writelines(comments_lines)
-        # ignore fields not in fieldnames
-        # NOTE: csv writer includes carriage returns that we dont want
-        # https://stackoverflow.com/questions/3191528/csv-in-python-adding-an-extra-carriage-return-on-windows
-        writer = csv.DictWriter(fout, delimiter = '\t', fieldnames = fieldnames, extrasaction = 'ignore', lineterminator='\n')
-        writer.writeheader()
-        for row in analysis_keep:
-            writer.writerow(row)
-
-    # write portal file
     # only keep a subset of the fieldnames for the cBioPortal output file
     portal_fieldnames = [ f for f in fieldnames ]
     portal_fieldnames[portal_fieldnames.index('HGVSp_Short')] = 'Amino_Acid_Change'
     portal_fieldnames = [ f for f in portal_fieldnames if f in maf_filter_portal_file_cols_to_keep ]
-    with open(portal_file,'w') as fout:
-        fout.writelines(comments_lines)
-        # ignore fields not in fieldnames
-        writer = csv.DictWriter(fout, delimiter = '\t', fieldnames = portal_fieldnames, extrasaction = 'ignore', lineterminator='\n')
-        writer.writeheader()
-        for row in portal_keep:
-            writer.writerow(row)
+
+    # keep only a subset of fieldnames in the reject file output
+    reject_fieldnames = [ f for f in fieldnames if f in reject_fieldnames_keep ]
+    reject_fieldnames.append('reject_reason')
+    reject_fieldnames.append('reject_flag')
+    reject_fieldnames.append('filter_flags')
+
+    with ExitStack() as stack:
+        # write analysis file
+        analyst_fout = stack.enter_context(open(analyst_file,'w'))
+        analyst_fout.writelines(comments_lines)
+        get_writer(analyst_fout, fieldnames).writeheader()
+
+        # write portal file
+        portal_fout = stack.enter_context(open(portal_file,'w'))
+        portal_fout.writelines(comments_lines)
+        get_writer(portal_fout, portal_fieldnames).writeheader()
+
+        # save a copy of the rows that were rejected with their rejection reasons
+        rejected_fout = None
+        if keep_rejects:
+            rejected_fout = stack.enter_context(open(rejected_file, "w"))
+            get_writer(rejected_fout, reject_fieldnames).writeheader()
+
+        # split the rows up across multiple processes
+        if workers > 1:
+            filter_shards(
+                input_file = input_files,
+                workers = workers,
+                analyst_fout = analyst_fout,
+                portal_fout = portal_fout,
+                rejected_fout = rejected_fout,
+                fieldnames = fieldnames,
+                portal_fieldnames = portal_fieldnames,
+                reject_fieldnames = reject_fieldnames,
+                is_impact = is_impact,
+                keep_rejects = keep_rejects,
+                batch = batch,
+                chunk_size = chunk_size)
+            return
+
+        # classify each row as it is read from the input file
+        if batch:
+            filtered_rows = iter_filter_rows_batch(row_list = maf_reader.read(), is_impact = is_impact, keep_rejects = keep_rejects, chunk_size = chunk_size)
+        else:
+            filtered_rows = iter_filter_rows(row_list = maf_reader.read(), is_impact = is_impact, keep_rejects = keep_rejects)
+
+        # fillout rows need to go after all the portal rows, so spool them to a temp file until the input is done
+        fillout_spool = stack.enter_context(tempfile.TemporaryFile(mode = 'w+', dir = os.path.dirname(os.path.abspath(portal_file))))
+
+        write_filtered_rows(
+            filtered_rows = filtered_rows,
+            analyst_fout = analyst_fout,
+            portal_fout = portal_fout,
+            fillout_fout = fillout_spool,
+            rejected_fout = rejected_fout,
+            fieldnames = fieldnames,
+            portal_fieldnames = portal_fieldnames,
+            reject_fieldnames = reject_fieldnames)
+
         # write fillout if available
-        for row in fillout_keep:
-            writer.writerow(row)
-
-    # save a copy of the rows that were rejected with their rejection reasons
-    if keep_rejects:
-        # keep only a subset of fieldnames in the reject file output;
-        reject_fieldnames_keep = [
-        # keep every "row" field that is explicitly referenced in the filter_row function...
-        'Amino_Acid_Change',
-        'HGVSp_Short',
-        'Variant_Type',
-        't_depth',
-        't_alt_count',
-        'fillout_t_depth',
-        'fillout_t_alt',
-        'FILTER',
-        'HGVSc',
-        'set',
-        'Mutation_Status',
-        'Consequence',
-        'Hugo_Symbol',
-        'Start_Position',
-        'Chromosome',
-        'hotspot_whitelist',
-        'Entrez_Gene_Id',
-        # extra fields for easy variant idenfitication
-        "End_Position",
-        "Variant_Classification",
-        "Reference_Allele",
-        "Tumor_Seq_Allele1",
-        "Tumor_Seq_Allele2",
-        "Tumor_Sample_Barcode",
-        "Matched_Norm_Sample_Barcode",
-        "Match_Norm_Seq_Allele1",
-        "Match_Norm_Seq_Allele2",
-        "HGVSp",
-        "Transcript_ID"
-        "Exon_Number",
-        "t_ref_count",
-        "n_depth",
-        "n_ref_count",
-        "n_alt_count"
-        # "all_effects" # this one is too long
-        ]
-        reject_fieldnames_remove = []
-        reject_fieldnames = [ f for f in fieldnames if f in reject_fieldnames_keep ]
-        reject_fieldnames.append('reject_reason')
-        reject_fieldnames.append('reject_flag')
-        reject_fieldnames.append('filter_flags')
-
-        with open(rejected_file, "w") as fout:
-            writer = csv.DictWriter(fout, delimiter = '\t', fieldnames = reject_fieldnames, extrasaction = 'ignore', lineterminator='\n')
-            writer.writeheader()
-            for row in rejected_list:
-                writer.writerow(row)
+        fillout_spool.seek(0)
+        shutil.copyfileobj(fillout_spool, portal_fout)
 
 def parse():
     """
@@ -446,13 +1056,16 @@ def parse():
     maf_filter.py Proj_08390_G.muts.maf 2.x True analyst_file3.tsv portal_file3.tsv
     """
     parser = argparse.ArgumentParser(description = 'Script for filtering mutations in a .maf file')
-    parser.add_argument('input_file', help='Input maf file')
+    parser.add_argument('input_file', nargs = '+', help='Input maf file; multiple maf files with the same header are collated in order and filtered as one table')
     parser.add_argument('--version-string', dest = 'version_string', required = True, help='Version string label for output file comments')
     parser.add_argument('--analyst-file', dest = 'analyst_file', required = True, help='Filename for filtered analysis file output')
     parser.add_argument('--portal-file', dest = 'portal_file', required = True, help='Filename for filtered cBioPortal file output')
     parser.add_argument('--rejected-file', dest = 'rejected_file', default = 'rejected.muts.maf', help='Filename for rejected variants output')
     parser.add_argument('--keep-rejects', dest = 'keep_rejects', action="store_true", help='Whether to save rejected variants to the rejected file')
     parser.add_argument('--is-impact', action="store_true", help='Whether the sample is an IMPACT sample or not')
+    parser.add_argument('--batch', action="store_true", help='Evaluate the filter criteria on chunks of rows at once (requires numpy)')
+    parser.add_argument('--chunk-size', dest = 'chunk_size', type = int, default = 10000, help='Number of rows per chunk when using --batch')
+    parser.add_argument('--workers', dest = 'workers', type = int, default = 1, help='Number of processes to use for filtering; the input file rows are split into chunks for each process')
     args = parser.parse_args()
 
     main(**vars(args))
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Script to run several maf annotation and filter steps on a maf file with a single read and write of the file
+
+The steps are the same as the ones run by the individual scripts, and are applied to each row in the order given;
+
+update_fillout_maf: update_fillout_maf.py
+add_af: add_af.py
+add_is_in_impact: add_is_in_impact.py
+add_msi_status: add_msi_status.py
+maf_col_filter: maf_col_filter.py
+tmb_variant_filter: tmb_variant_filter.py
+
+Usage
+-----
+
+$ maf_pipeline.py input.maf output.maf --stages update_fillout_maf add_af add_is_in_impact maf_col_filter --IMPACT_file IMPACT_genes.txt
+
+is equivalent to running;
+
+$ update_fillout_maf.py input.maf tmp1.maf
+$ add_af.py tmp1.maf tmp2.maf
+$ add_is_in_impact.py --input_file tmp2.maf --output_file tmp3.maf --IMPACT_file IMPACT_genes.txt
+$ maf_col_filter.py tmp3.maf output.maf
+
+NOTE: the input comments are not included in the output if any of the steps drops them; update_fillout_maf, add_msi_status
+"""
+import sys
+import argparse
+from typing import List
+
+# relative imports, from CLI and from parent project
+if __package__:
+    from .cBioPortal_utils import MafStage, run_maf_stages
+    from .add_af import AddAfStage
+    from .add_is_in_impact import AddIsInImpactStage, load_IMPACT_data
+    from .add_msi_status import AddMsiStatusStage
+    from .maf_col_filter import MafColFilterStage
+    from .tmb_variant_filter import TmbVariantFilterStage
+    from .update_fillout_maf import UpdateFilloutStage
+
+if not __package__:
+    from cBioPortal_utils import MafStage, run_maf_stages
+    from add_af import AddAfStage
+    from add_is_in_impact import AddIsInImpactStage, load_IMPACT_data
+    from add_msi_status import AddMsiStatusStage
+    from maf_col_filter import MafColFilterStage
+    from tmb_variant_filter import TmbVariantFilterStage
+    from update_fillout_maf import UpdateFilloutStage
+
+stage_names = [
+    'update_fillout_maf',
+    'add_af',
+    'add_is_in_impact',
+    'add_msi_status',
+    'maf_col_filter',
+    'tmb_variant_filter'
+]
+
+def get_stage(
+        name: str,
+        IMPACT_file: str = None,
+        include_assay: bool = False,
+        msi_header: str = 'MSI_STATUS'
+        ) -> MafStage:
+    """
+    Initialize the stage with the given name
+
+    Parameters
+    ----------
+    name: str
+        the name of the stage, from stage_names
+    IMPACT_file: str
+        path to the IMPACT gene list file; required for add_is_in_impact
+    include_assay: bool
+        include the assay labels for the add_is_in_impact stage
+    msi_header: str
+        the column header for the add_msi_status stage
+    """
+    if name == 'update_fillout_maf':
+        return(UpdateFilloutStage())
+    if name == 'add_af':
+        return(AddAfStage())
+    if name == 'add_is_in_impact':
+        if IMPACT_file is None:
+            raise ValueError("An IMPACT file is required for the add_is_in_impact stage")
+        return(AddIsInImpactStage(load_IMPACT_data(IMPACT_file), include_assay = include_assay))
+    if name == 'add_msi_status':
+        return(AddMsiStatusStage(msi_header))
+    if name == 'maf_col_filter':
+        return(MafColFilterStage())
+    if name == 'tmb_variant_filter':
+        return(TmbVariantFilterStage())
+    raise ValueError("Unknown stage: {}".format(name))
+
+def main(
+        input_file: str,
+        output_file: str,
+        stages: List[str],
+        IMPACT_file: str = None,
+        include_assay: bool = False,
+        msi_header: str = 'MSI_STATUS'
+        ) -> None:
+    """
+    Main control function for the script
+
+    Parameters
+    ----------
+    input_file: str
+        path to the input maf file
+    output_file: str
+        path to the output maf file
+    stages: list
+        names of the stages to run, in order
+    """
+    maf_stages = [ get_stage(name, IMPACT_file = IMPACT_file, include_assay = include_assay, msi_header = msi_header) for name in stages ]
+    run_maf_stages(input_file, output_file, stages = maf_stages)
+
+def parse():
+    """
+    Parse the CLI args
+    """
+    parser = argparse.ArgumentParser(description = 'Run several maf annotation and filter steps in a single pass over the maf file')
+    parser.add_argument('input_file', help = 'Input maf file')
+    parser.add_argument('output_file', help = 'Output maf file')
+    parser.add_argument('--stages', dest = 'stages', nargs = '+', required = True, choices = stage_names, help = 'Steps to run on each row, in order')
+    parser.add_argument('--IMPACT_file', dest = 'IMPACT_file', default = None, help = 'IMPACT gene list file for the add_is_in_impact step')
+    parser.add_argument('--include-assay', dest = 'include_assay', action = "store_true", help = 'Include the assay labels for the add_is_in_impact step (IMPACT file must have assay labels in second column)')
+    parser.add_argument('--msi-header', dest = 'msi_header', default = 'MSI_STATUS', help = 'Header for the msi status column for the add_msi_status step')
+    args = parser.parse_args()
+
+    if 'add_is_in_impact' in args.stages and args.IMPACT_file is None:
+        parser.error("--IMPACT_file is required for the add_is_in_impact step")
+
+    main(**vars(args))
+
+if __name__ == '__main__':
+    parse()
@@ -2,13 +2,49 @@
 # -*- coding: utf-8 -*-
 """
 Script to merge tables together based on rows
+
+Usage
+-----
+
+$ merge-tables.py table1.tsv table2.tsv --key1 SAMPLE_ID --key2 SampleID --output merged.tsv
+
+Any number of tables can be merged at once by giving one key column per table with --keys,
+or a single key column to use for all of the tables;
+
+$ merge-tables.py data_clinical_sample.txt coverage.tsv tmb.tsv msi.tsv --keys SAMPLE_ID SAMPLE_ID SampleID SAMPLE_ID --output merged.tsv
+
+The rows are matched on the key values with the join given by --how;
+
+left: keep all of the rows of the first table, in their order; rows of the other tables with keys that are not in the first table are dropped
+inner: only keep the rows of the first table with keys that are in all of the tables
+outer: keep all of the rows of all of the tables; rows with keys that are not in the first table come after the rows of the first table,
+    in the order that their keys are first seen
+
+In all cases, the values of columns from tables that do not have the key are filled in with the --na-str value
+
+For large tables that are already sorted on the key columns, use --sorted to merge the rows as they are read
+instead of loading the tables into memory;
+
+$ merge-tables.py table1.sorted.tsv table2.sorted.tsv --key1 SAMPLE_ID --key2 SampleID --output merged.tsv --sorted
+
+or use --sort-inputs to sort the tables on the key columns first;
+
+$ merge-tables.py table1.tsv table2.tsv --key1 SAMPLE_ID --key2 SampleID --output merged.tsv --sort-inputs
+
+NOTE: with --sorted and --sort-inputs the output rows are in the sorted order of the keys instead of the order of the first table,
+and the output columns are always in the order of the input table columns (see generate_output_fieldnames)
 """
+import os
 import sys
 import argparse
 import csv
+import shutil
+import tempfile
 from collections import OrderedDict
 from functools import reduce
-from cBioPortal_utils import TableReader, create_file_lines
+from cBioPortal_utils import TableReader, ClinicalWriter, sort_table
+
+join_types = ['left', 'inner', 'outer']
 
 def write_table(
     comments, # list of comment lines
@@ -32,39 +68,50 @@ def write_table(
 
 
 def merge_comments(
-    comments1, # list of comment line strings
-    comments2 # list of comment line strings
+    *comments # list of comment line strings for each table
     ):
     """
     Merge together all the comment lines from the tables
     """
-    all_comments = [ *comments1, *comments2 ]
+    all_comments = [ line for table_comments in comments for line in table_comments ]
     return(all_comments)
 
 def merge_records(
-    records1, # list of rows (dicts) from the first table
-    records2, # list of rows (dicts) from the second table
-    key1, # first table merge key
-    key2 # second table merge key
+    records_list, # list of the rows (dicts) from each table
+    keys, # the merge key for each table
+    how = 'left' # the type of join; left, inner, or outer
     ):
     """
-    Merge the records from the two tables
+    Merge the records from the tables
+
+    merged_records, merged_rows = merge_records([records1, records2], [key1, key2])
 
-    merged_records, merged_rows = merge_records(records1, records2, key1, key2)
+    The output rows use the key column of the first table for the key values of all the tables
     """
+    key1 = keys[0]
     # start a new map for the records
     records = OrderedDict()
 
     # update the map for the values in the first table by key
     # NOTE: if tables are huge consider changing this to a `while len(recs) > 0: rec = recs.pop(); ...` so we dont have multiple copies of the entire dataset in memory at once
-    for rec in records1:
+    for rec in records_list[0]:
         key = rec.pop(key1)
         records[key] = rec
 
-    # add the matching row in the second table
-    for rec in records2:
-        key = rec.pop(key2)
-        records[key] = {**records[key], **rec}
+    # add the matching rows in each of the other tables
+    for table_records, table_key in zip(records_list[1:], keys[1:]):
+        matched_keys = set()
+        for rec in table_records:
+            key = rec.pop(table_key)
+            if key in records:
+                records[key] = {**records[key], **rec}
+                matched_keys.add(key)
+            elif how == 'outer':
+                records[key] = rec
+                matched_keys.add(key)
+            # for left and inner joins the rows with keys that are not in the first table are dropped
+        if how == 'inner':
+            records = OrderedDict([ (key, rec) for key, rec in records.items() if key in matched_keys ])
     """
     looks like this;
 
@@ -95,6 +142,72 @@ def merge_records(
     """
     return(records, rows)
 
+def iter_sorted_records(
+    records, # iterable of rows (dicts) from a table sorted on the key column
+    key, # the table merge key
+    table # the name of the table for error messages
+    ):
+    """
+    Yield (key value, record) pairs from rows that are sorted on the key column; the key is removed from each record
+
+    Raises a ValueError if the rows are not sorted on the key or the key values are not unique
+    """
+    previous = None
+    for rec in records:
+        value = rec.pop(key)
+        if previous is not None and value <= previous:
+            raise ValueError("{} is not sorted on unique values of column {}; '{}' comes after '{}'".format(table, key, value, previous))
+        previous = value
+        yield(value, rec)
+
+def merge_sorted_records(
+    records_list, # list of iterables of rows (dicts) from each table, sorted on the table key
+    keys, # the merge key for each table
+    how = 'left' # the type of join; left, inner, or outer
+    ):
+    """
+    Merge the records from tables that are sorted on their key columns, one row at a time
+
+    Yields the same rows as merge_records, in the sorted order of the keys,
+    but only holds one row from each table in memory at a time;
+
+    merged_rows = merge_sorted_records([records1, records2], [key1, key2])
+    """
+    key1 = keys[0]
+    tables = [ iter_sorted_records(records, key, 'table{}'.format(i + 1)) for i, (records, key) in enumerate(zip(records_list, keys)) ]
+    # the current (key value, record) from each table; None once the table runs out of rows
+    heads = [ next(table, None) for table in tables ]
+    while True:
+        if how == 'left':
+            if heads[0] is None:
+                break
+            value = heads[0][0]
+            # drop the rows of the other tables with keys that are not in the first table
+            for i in range(1, len(tables)):
+                while heads[i] is not None and heads[i][0] < value:
+                    heads[i] = next(tables[i], None)
+        else:
+            values = [ head[0] for head in heads if head is not None ]
+            if not values:
+                break
+            value = min(values)
+
+        row = {key1: value}
+        num_matched = 0
+        for i in range(len(tables)):
+            if heads[i] is not None and heads[i][0] == value:
+                row.update(heads[i][1])
+                heads[i] = next(tables[i], None)
+                num_matched += 1
+        if how == 'inner' and num_matched < len(tables):
+            continue
+        yield(row)
+
+    # read the rest of the other tables so that unsorted rows after the end of the first table still get caught
+    for table in tables:
+        for _ in table:
+            pass
+
 def generate_output_fieldnames(fieldnames1, fieldnames2, key2):
     """
     get the output column headers; exclude key2
@@ -103,107 +216,163 @@ def generate_output_fieldnames(fieldnames1, fieldnames2, key2):
     output_fieldnames = [ *output_fieldnames, *[f for f in fieldnames2 if f!= key2] ]
     return(output_fieldnames)
 
+def generate_all_output_fieldnames(fieldnames_list, keys):
+    """
+    get the output column headers for all of the tables; exclude the keys of all tables after the first
+    """
+    output_fieldnames = reduce(
+        lambda fieldnames1, table: generate_output_fieldnames(fieldnames1, *table),
+        zip(fieldnames_list[1:], keys[1:]),
+        fieldnames_list[0])
+    return(output_fieldnames)
+
 def merge_standard_tables(
-    comments1,
-    comments2,
-    records1,
-    records2,
-    key1,
-    key2,
-    fieldnames1,
-    fieldnames2,
+    comments_list,
+    records_list,
+    keys,
+    fieldnames_list,
     delimiter,
     na_str,
-    fout
+    fout,
+    how = 'left'
     ):
     """
     Merge operation on standard tsv tables
     """
     # Concatenate all the comment lines; these will still have trailing '\n' !!
-    all_comments = merge_comments(comments1, comments2)
+    all_comments = merge_comments(*comments_list)
 
-    # combine the records from the two tables
-    _, merged_rows = merge_records(records1, records2, key1, key2)
+    # combine the records from the tables
+    _, merged_rows = merge_records(records_list, keys, how = how)
 
-    # get the output column headers; exclude key2
-    output_fieldnames = generate_output_fieldnames(fieldnames1, fieldnames2, key2)
+    # get the output column headers; exclude the keys after the first table
+    output_fieldnames = generate_all_output_fieldnames(fieldnames_list, keys)
 
     # write the output table
     write_table(all_comments, output_fieldnames, delimiter, merged_rows, na_str, fout)
 
-def merge_cBioPortal_tables(records1, records2, key1, key2, fieldnames1, fieldnames2, delimiter, na_str, fout):
+def merge_cBioPortal_tables(records_list, keys, fieldnames_list, delimiter, na_str, fout, how = 'left'):
     """
-    Merges the records of two tables and outputs the result in a cBioPortal compatible format;
-    The header comment lines from both tables are ignored and new comments are generated for use with cBioPortal
+    Merges the records of the tables and outputs the result in a cBioPortal compatible format;
+    The header comment lines from all tables are ignored and new comments are generated for use with cBioPortal
     """
-    # combine the records from the two tables
-    _, merged_rows = merge_records(records1, records2, key1, key2)
+    # combine the records from the tables
+    _, merged_rows = merge_records(records_list, keys, how = how)
 
-    # get the output column headers; exclude key2
-    output_fieldnames = generate_output_fieldnames(fieldnames1, fieldnames2, key2)
+    # key column first, then the rest of the columns in table order
+    key1 = keys[0]
+    output_fieldnames = [ key1, *[ f for f in generate_all_output_fieldnames(fieldnames_list, keys) if f != key1 ] ]
 
-    # convert the rows into cBioPortal file lines
+    # write the rows with the cBioPortal header lines
     # NOTE: rows with missing values get filled in at this step
-    lines = create_file_lines(merged_rows, delimiter, na_str)
+    writer = ClinicalWriter(fout = fout, fieldnames = output_fieldnames, delimiter = delimiter, na_str = na_str)
+    writer.writerows(merged_rows)
 
-    # write the lines
-    fout.writelines(lines)
+def merge_sorted_tables(
+    tables,
+    keys,
+    fout,
+    delimiter = '\t',
+    cBioPortal = False,
+    na_str = 'NA',
+    how = 'left'
+    ):
+    """
+    Merge tables that are sorted on their key columns without loading them into memory
+    """
+    table_readers = [ TableReader(table, delimiter = delimiter) for table in tables ]
+
+    # get the output column headers; exclude the keys after the first table
+    output_fieldnames = generate_all_output_fieldnames([ reader.get_fieldnames() for reader in table_readers ], keys)
+
+    merged_rows = merge_sorted_records([ reader.read() for reader in table_readers ], keys, how = how)
+
+    if cBioPortal:
+        # key column first, then the rest of the columns in table order; same as merge_cBioPortal_tables
+        key1 = keys[0]
+        output_fieldnames = [ key1, *[ f for f in output_fieldnames if f != key1 ] ]
+        writer = ClinicalWriter(fout = fout, fieldnames = output_fieldnames, delimiter = delimiter, na_str = na_str)
+        writer.writerows(merged_rows)
+    else:
+        all_comments = merge_comments(*[ reader.comment_lines for reader in table_readers ])
+        write_table(all_comments, output_fieldnames, delimiter, merged_rows, na_str, fout)
 
 def merge_tables(
-    table1,
-    table2,
-    key1,
-    key2,
+    tables,
+    keys,
     output_file = None,
     delimiter = '\t',
     cBioPortal = False,
     na_str = 'NA',
+    how = 'left',
+    is_sorted = False,
+    sort_inputs = False,
     func = None):
     """
-    Merge two tables on rows in a common column
+    Merge tables on rows in a common column; keys has the key column for each table
+
+    If is_sorted is True, the tables must already be sorted on the key columns and the rows are merged as they are read;
+    if sort_inputs is True, the tables are sorted on the key columns first and then merged the same way
     """
+    if len(keys) != len(tables):
+        raise ValueError("A key column is needed for each table; got {} tables and {} keys".format(len(tables), len(keys)))
+    if how not in join_types:
+        raise ValueError("Unknown join type: {}".format(how))
+
     # open output file
     if output_file:
         fout = open(output_file, "w")
     else:
         fout = sys.stdout
 
-    # load all records from both tables
-    table1_reader = TableReader(table1, delimiter = delimiter)
-    comments1 = table1_reader.comment_lines
-    fieldnames1 = table1_reader.get_fieldnames()
-    records1 = [ rec for rec in table1_reader.read() ]
+    if is_sorted or sort_inputs:
+        tmpdir = None
+        try:
+            if sort_inputs:
+                tmpdir = tempfile.mkdtemp(dir = os.path.dirname(os.path.abspath(output_file or tables[0])))
+                sorted_tables = []
+                for i, (table, key) in enumerate(zip(tables, keys)):
+                    sorted_table = os.path.join(tmpdir, "table{}.sorted.txt".format(i + 1))
+                    sort_table(table, sorted_table, key, delimiter = delimiter)
+                    sorted_tables.append(sorted_table)
+                tables = sorted_tables
+            merge_sorted_tables(tables, keys, fout, delimiter = delimiter, cBioPortal = cBioPortal, na_str = na_str, how = how)
+        finally:
+            if tmpdir is not None:
+                shutil.rmtree(tmpdir)
+        fout.close()
+        return
 
-    table2_reader = TableReader(table2, delimiter = delimiter)
-    comments2 = table2_reader.comment_lines
-    fieldnames2 = table2_reader.get_fieldnames()
-    records2 = [ rec for rec in table2_reader.read() ]
+    # load all records from all tables
+    comments_list = []
+    fieldnames_list = []
+    records_list = []
+    for table in tables:
+        table_reader = TableReader(table, delimiter = delimiter)
+        comments_list.append(table_reader.comment_lines)
+        fieldnames_list.append(table_reader.get_fieldnames())
+        records_list.append([ rec for rec in table_reader.read() ])
 
     if cBioPortal:
         merge_cBioPortal_tables(
-            records1,
-            records2,
-            key1,
-            key2,
-            fieldnames1,
-            fieldnames2,
+            records_list,
+            keys,
+            fieldnames_list,
             delimiter,
             na_str,
-            fout
+            fout,
+            how = how
         )
     else:
         merge_standard_tables(
-            comments1,
-            comments2,
-            records1,
-            records2,
-            key1,
-            key2,
-            fieldnames1,
-            fieldnames2,
+            comments_list,
+            records_list,
+            keys,
+            fieldnames_list,
             delimiter,
             na_str,
-            fout
+            fout,
+            how = how
         )
 
     fout.close()
@@ -214,15 +383,34 @@ def main():
     Parse command line arguments to run the script
     """
     parser = argparse.ArgumentParser(description = 'Merge tables together by rows. Tables must have column headers. Values in the key column must be unique.')
-    parser.add_argument('table1', help = 'First table to merge against')
-    parser.add_argument('table2', help = 'Second table to merge against')
-    parser.add_argument('--key1', dest = 'key1', required = True, help = 'Column label to use for merge in first table')
-    parser.add_argument('--key2', dest = 'key2', required = True, help = 'Column label to use for merge in second table')
+    parser.add_argument('tables', nargs = '+', help = 'Tables to merge; the first table is merged against the rest')
+    parser.add_argument('--key1', dest = 'key1', help = 'Column label to use for merge in first table')
+    parser.add_argument('--key2', dest = 'key2', help = 'Column label to use for merge in second table')
+    parser.add_argument('--keys', dest = 'keys', nargs = '+', help = 'Column labels to use for merge in each table, in the same order as the tables; a single label is used for all of the tables')
+    parser.add_argument('--how', dest = 'how', default = 'left', choices = join_types, help = 'Type of join to use for keys that are not in all of the tables')
     parser.add_argument('--output', dest = 'output_file', help = 'Name of the output file')
     parser.add_argument('--na-str', dest = 'na_str', default = 'NA', help = 'Value to output for rows with missing values')
     parser.add_argument('--cBioPortal', dest = 'cBioPortal', action = "store_true", help = 'Ignore header comment lines and output table with cBioPortal headers. NOTE: all output header columns must be supported in cBioPortal_utils.header_lines_map')
+    parser.add_argument('--sorted', dest = 'is_sorted', action = "store_true", help = 'The tables are already sorted on the key columns; merge the rows as they are read instead of loading the tables into memory')
+    parser.add_argument('--sort-inputs', dest = 'sort_inputs', action = "store_true", help = 'Sort the tables on the key columns in temporary files first, then merge them the same way as --sorted')
     parser.set_defaults(func = merge_tables)
     args = parser.parse_args()
+
+    if len(args.tables) < 2:
+        parser.error("At least two tables are needed to merge")
+    if args.keys and (args.key1 or args.key2):
+        parser.error("Use either --keys or --key1 and --key2, not both")
+    if not args.keys:
+        if not (args.key1 and args.key2) or len(args.tables) != 2:
+            parser.error("--key1 and --key2 are required to merge two tables; use --keys for more tables")
+        args.keys = [ args.key1, args.key2 ]
+    elif len(args.keys) == 1:
+        args.keys = args.keys * len(args.tables)
+    elif len(args.keys) != len(args.tables):
+        parser.error("--keys needs one column label for each table, or a single label for all of the tables")
+    del args.key1
+    del args.key2
+
     args.func(**vars(args))
 
 if __name__ == '__main__':
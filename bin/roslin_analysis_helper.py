@@ -1,16 +1,24 @@
 #!/usr/bin/env python3
 # copied from /juno/work/ci/roslin-pipelines/variant/2.5.7/bin/scripts/roslin_analysis_helper.py
 
-import argparse, os, sys, yaml, json, re, time, io, csv, shutil, logging
+import argparse, os, sys, yaml, json, re, io, csv, shutil, logging
+import threading
 from subprocess import Popen, PIPE
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from tempfile import mkdtemp
 from datetime import date
 from distutils.dir_util import copy_tree
-import genPortalUUID
 import traceback
 import copy
 import glob
 
+# relative imports, from CLI and from parent project
+if __package__:
+    from . import genPortalUUID
+
+if not __package__:
+    import genPortalUUID
+
 log_name = 'roslin_analysis_helper.log'
 logger = logging.getLogger("roslin_analysis_helper")
 old_jobs_folder = "oldJobs"
@@ -33,44 +41,102 @@ def get_sample_list(clinical_data):
     return sample_list
 
 def run_command_list(command_list,name):
+    # every command in the list is run, like before; the list counts as failed if its last command failed
     command_num = 1
+    errorcode = None
     for single_command in command_list:
         single_command_name = name + '_' + str(command_num)
-        run_job(single_command,True,single_command_name)
-        time.sleep(2)
+        errorcode = run_job(single_command,True,single_command_name)
         command_num = command_num + 1
-
-def generate_maf_data(maf_directory,output_directory,maf_file_name,analysis_mut_file,log_directory,script_path,pipeline_version_str,is_impact):
+    return errorcode == 0
+
+def make_step(name,command_list,inputs,outputs,depends=None):
+    # a step is a chain of shell commands that run in order;
+    # steps run concurrently with each other unless one is listed in the other's depends
+    return {'name':name,'commands':command_list,'inputs':inputs,'outputs':outputs,'depends':depends or []}
+
+def step_is_up_to_date(step):
+    # inputs can be glob queries; a step without matching inputs or without outputs is never up to date
+    input_files = []
+    for single_input in step['inputs']:
+        input_files.extend(glob.glob(single_input))
+    if not input_files or not step['outputs']:
+        return False
+    for single_output in step['outputs']:
+        if not os.path.exists(single_output):
+            return False
+    newest_input = max([ os.path.getmtime(input_file) for input_file in input_files ])
+    oldest_output = min([ os.path.getmtime(output_file) for output_file in step['outputs'] ])
+    return oldest_output >= newest_input
+
+def run_step(step,skip_up_to_date):
+    if skip_up_to_date and step_is_up_to_date(step):
+        logger.info("Job ( {} ) Skipped, outputs are up to date".format(step['name']))
+        return True
+    succeeded = run_command_list(step['commands'],step['name'])
+    if not succeeded:
+        # remove partial outputs so that a later run does not take them as up to date
+        for single_output in step['outputs']:
+            if os.path.exists(single_output):
+                os.remove(single_output)
+    return succeeded
+
+def run_steps(steps,jobs=1,skip_up_to_date=False):
+    # start every step whose depends have finished, up to jobs at a time;
+    # steps that depend on a failed step are not run
+    pending = { step['name']: step for step in steps }
+    if len(pending) != len(steps):
+        raise Exception("Duplicate step names: " + ', '.join([ step['name'] for step in steps ]))
+    for step in steps:
+        unknown_depends = [ dep for dep in step['depends'] if dep not in pending ]
+        if unknown_depends:
+            raise Exception("Step " + step['name'] + " depends on unknown steps: " + ', '.join(unknown_depends))
+    running = {}
+    finished = {}
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        while pending or running:
+            for name in list(pending):
+                step = pending[name]
+                if any([ dep in pending or dep in running.values() for dep in step['depends'] ]):
+                    continue
+                del pending[name]
+                if all([ finished.get(dep) for dep in step['depends'] ]):
+                    running[executor.submit(run_step,step,skip_up_to_date)] = name
+                else:
+                    logger.info("Job ( {} ) Skipped, a step it depends on failed".format(name))
+                    finished[name] = False
+            if not running:
+                if pending:
+                    raise Exception("Circular dependency between steps: " + ', '.join(pending))
+                break
+            done, not_done = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                finished[running.pop(future)] = future.result()
+    return finished
+
+def get_maf_data_steps(maf_directory,output_directory,maf_file_name,analysis_mut_file,log_directory,script_path,pipeline_version_str,is_impact):
     maf_files_query = os.path.join(maf_directory,'*.muts.maf')
-    combined_output = maf_file_name.replace('.txt','.combined.txt')
-    combined_output_file = os.path.join(output_directory,combined_output)
     pipeline_version_str_arg = pipeline_version_str.replace(' ','_')
     portal_file = os.path.join(output_directory,maf_file_name)
-    regexp_string = "--regexp='^(Hugo|#)'"
     maf_filter_script = os.path.join(script_path,'maf_filter.py')
-    tmp_combined_output_file = combined_output_file + ".tmp"
+    # maf_filter reads the per-sample maf files in order and checks their headers match, so they do not need to be combined into one file first
+    maf_filter_args = [maf_filter_script, maf_files_query, '--version-string', pipeline_version_str_arg, '--analyst-file', analysis_mut_file, '--portal-file', portal_file]
+    if is_impact:
+        maf_filter_args.append('--is-impact')
     maf_command_list = []
-    maf_command_list.append('grep -h --regexp=^Hugo ' + maf_files_query + ' > ' + tmp_combined_output_file)
-    maf_command_list.append('head -n1 ' + tmp_combined_output_file + ' > ' + combined_output_file)
-    maf_command_list.append('rm ' + tmp_combined_output_file)
-    maf_command_list.append('grep -hEv ' + regexp_string + ' ' + maf_files_query + ' >> ' + combined_output_file)
-    maf_command_list.append('python ' + ' '.join([maf_filter_script, combined_output_file, pipeline_version_str_arg, str(is_impact), analysis_mut_file, portal_file]))
-    run_command_list(maf_command_list,'generate_maf')
+    maf_command_list.append('python ' + ' '.join(maf_filter_args))
+    return [make_step('generate_maf',maf_command_list,[maf_files_query],[portal_file,analysis_mut_file])]
 
-def generate_fusion_data(fusion_directory,output_directory,data_filename,fusion_mut_file,log_directory,script_path,pipeline_version_str):
+def generate_maf_data(maf_directory,output_directory,maf_file_name,analysis_mut_file,log_directory,script_path,pipeline_version_str,is_impact):
+    run_steps(get_maf_data_steps(maf_directory,output_directory,maf_file_name,analysis_mut_file,log_directory,script_path,pipeline_version_str,is_impact))
+
+def get_fusion_data_steps(fusion_directory,output_directory,data_filename,fusion_mut_file,log_directory,script_path,pipeline_version_str):
     fusion_files_query = os.path.join(fusion_directory,'*.svs.pass.vep.portal.txt')
-    combined_output = data_filename.replace('.txt','.combined.txt')
-    combined_output_path = os.path.join(output_directory,combined_output)
     output_path = os.path.join(output_directory,data_filename)
     fusion_filter_script = os.path.join(script_path,'fusion_filter.py')
-    tmp_combined_output_file = combined_output_path + ".tmp"
+    # fusion_filter reads the per-sample fusion files in order, same as maf_filter
     fusion_command_list = []
-    fusion_command_list.append('grep -h --regexp=^Hugo ' + fusion_files_query + ' > ' + tmp_combined_output_file)
-    fusion_command_list.append('head -n1 ' + tmp_combined_output_file + ' > ' + combined_output_path)
-    fusion_command_list.append('rm ' + tmp_combined_output_file)
-    fusion_command_list.append('grep -hv --regexp=^Hugo ' + fusion_files_query + ' >> ' + combined_output_path)
-    fusion_command_list.append('python ' + fusion_filter_script + ' ' + combined_output_path + ' ' + output_path + ' /juno/work/ci/kellys5/projects/roslin-analysis-helper-dev/helix_filters_01/ref/known_fusions_at_mskcc.txt')
-    run_command_list(fusion_command_list,'generate_fusion')
+    fusion_command_list.append('python ' + fusion_filter_script + ' ' + fusion_files_query + ' ' + output_path + ' /juno/work/ci/kellys5/projects/roslin-analysis-helper-dev/helix_filters_01/ref/known_fusions_at_mskcc.txt')
 
     # concatenate all *.svs.pass.vep.maf files into one file and copy it into analysis folder
     analysis_fusion_files_query = os.path.join(fusion_directory,'*.svs.pass.vep.maf')
@@ -81,7 +147,13 @@ def generate_fusion_data(fusion_directory,output_directory,data_filename,fusion_
     analysis_fusion_command_list.append('head -n1 ' + analysis_tmp_combined_output_file + ' >> ' + fusion_mut_file)
     analysis_fusion_command_list.append('rm ' + analysis_tmp_combined_output_file)
     analysis_fusion_command_list.append('grep -Phv --regexp="^Hugo|^#" ' + analysis_fusion_files_query + ' >> ' + fusion_mut_file)
-    run_command_list(analysis_fusion_command_list,'generate_analysis_fusion')
+    return [
+        make_step('generate_fusion',fusion_command_list,[fusion_files_query],[output_path]),
+        make_step('generate_analysis_fusion',analysis_fusion_command_list,[analysis_fusion_files_query],[fusion_mut_file])
+    ]
+
+def generate_fusion_data(fusion_directory,output_directory,data_filename,fusion_mut_file,log_directory,script_path,pipeline_version_str):
+    run_steps(get_fusion_data_steps(fusion_directory,output_directory,data_filename,fusion_mut_file,log_directory,script_path,pipeline_version_str))
 
 def assay_matcher(assay):
     if assay.find("IMPACT410") > -1:
@@ -96,7 +168,7 @@ def assay_matcher(assay):
         assay = "IMPACT468_08390"
     return assay
 
-def generate_discrete_copy_number_data(data_directory,output_directory,data_filename,gene_cna_file,assay,log_directory):
+def get_discrete_copy_number_data_steps(data_directory,output_directory,data_filename,gene_cna_file,assay,log_directory):
     discrete_copy_number_files_query = os.path.join(data_directory,'*_hisens.cncf.txt')
     output_path = os.path.join(output_directory,data_filename)
     scna_output_path = output_path.replace('.txt','.scna.txt')
@@ -115,9 +187,12 @@ def generate_discrete_copy_number_data(data_directory,output_directory,data_file
     cna_command_list.append('tool.sh --tool facets --version 1.6.3 --language_version default --language python --cmd geneLevel ' + extra_arg + ' -f ' + discrete_copy_number_files_query + ' -m -o ' + output_path)
     cna_command_list.append('mv ' + output_path + ' ' + gene_cna_file)
     cna_command_list.append('mv ' + scna_output_path + ' ' + output_path)
-    run_command_list(cna_command_list,'generate_discrete_copy_number')
+    return [make_step('generate_discrete_copy_number',cna_command_list,[discrete_copy_number_files_query],[output_path,gene_cna_file])]
 
-def generate_segmented_copy_number_data(data_directory,output_directory,data_filename,analysis_seg_file,log_directory):
+def generate_discrete_copy_number_data(data_directory,output_directory,data_filename,gene_cna_file,assay,log_directory):
+    run_steps(get_discrete_copy_number_data_steps(data_directory,output_directory,data_filename,gene_cna_file,assay,log_directory))
+
+def get_segmented_copy_number_data_steps(data_directory,output_directory,data_filename,analysis_seg_file,log_directory):
     segmented_files_query = os.path.join(data_directory,'*_hisens.seg')
     combined_output_path = os.path.join(output_directory,data_filename)
     tmp_combined_output_file = combined_output_path + ".tmp"
@@ -128,7 +203,10 @@ def generate_segmented_copy_number_data(data_directory,output_directory,data_fil
     seg_command_list.append('grep -hv --regexp=^ID ' + segmented_files_query + ' | awk \'OFS="\t" {$6=sprintf("%.4f",$6); print}\' >> ' + combined_output_path)
     seg_command_list.append('rm ' + tmp_combined_output_file)
     seg_command_list.append('cp ' + combined_output_path + ' ' + analysis_seg_file)
-    run_command_list(seg_command_list,'generate_segmented_copy_number')
+    return [make_step('generate_segmented_copy_number',seg_command_list,[segmented_files_query],[combined_output_path,analysis_seg_file])]
+
+def generate_segmented_copy_number_data(data_directory,output_directory,data_filename,analysis_seg_file,log_directory):
+    run_steps(get_segmented_copy_number_data_steps(data_directory,output_directory,data_filename,analysis_seg_file,log_directory))
 
 def create_case_list_file(cases_path,cases_data):
     with open(cases_path,'w') as cases_file:
@@ -239,29 +317,30 @@ def generate_fusion_meta(portal_config_data,data_filename):
     fusion_meta_data['data_filename'] = data_filename
     return fusion_meta_data
 
+def log_job_stream(stream,name,stream_name):
+    for line in iter(stream.readline, b''):
+        logger.info("{} {}: {}".format(name,stream_name,line.decode(errors='replace').rstrip('\r\n')))
+    stream.close()
+
 def run_job(command, shell, name):
     logger.info("Running job "+ name)
     logger.debug("Command: "+command)
-    output_message = ""
-    error_message = ""
+    errorcode = None
     try:
         single_process = Popen(command, stdout=PIPE,stderr=PIPE, shell=shell)
-        stdout, stderr = single_process.communicate()
-        errorcode = single_process.returncode
-        if stdout:
-            output_message = "----- log stdout -----\n {}".format(stdout)
-        if stderr:
-            error_message = "----- log stderr -----\n {}".format(stderr)
+        # log the output as it arrives; stderr is read on its own thread so that neither pipe can fill up and block the job
+        stderr_thread = threading.Thread(target=log_job_stream, args=(single_process.stderr,name,'stderr'))
+        stderr_thread.start()
+        log_job_stream(single_process.stdout,name,'stdout')
+        stderr_thread.join()
+        errorcode = single_process.wait()
         if errorcode != 0:
-            error_message = error_message + "\nJob ( {} ) Failed, errorcode: {}".format(name,str(errorcode))
+            logger.info("Job ( {} ) Failed, errorcode: {}".format(name,str(errorcode)))
         else:
-            output_message = output_message + "\nJob ( {} ) Done".format(name)
+            logger.info("Job ( {} ) Done".format(name))
     except:
-        error_message = error_message + "\nJob ( {} ) Failed. Exception:\n{}".format(name,traceback.format_exc())
-    if output_message:
-        logger.info(output_message)
-    if error_message:
-        logger.info(error_message)
+        logger.info("Job ( {} ) Failed. Exception:\n{}".format(name,traceback.format_exc()))
+    return errorcode
 
 def get_meta_info(input_yaml):
     meta_info = {}
@@ -441,6 +520,8 @@ if __name__ == '__main__':
     parser.add_argument('--clinical_data',required=False,help='The clinical file located with Roslin manifests')
     parser.add_argument('--debug',action="store_true",required=False, help="Run the analysis helper in debug mode")
     parser.add_argument('--stable_id',required=False, help="For merges, overrides the stable_id")
+    parser.add_argument('--jobs',type=int,default=1,required=False, help="Number of independent steps (maf, fusion, copy number, segments) to run at the same time")
+    parser.add_argument('--resume',action="store_true",required=False, help="Keep the existing analysis and portal directories and skip the steps whose outputs are newer than their inputs")
     args = parser.parse_args()
     script_path = os.path.dirname(os.path.realpath(__file__))
     current_working_directory = os.getcwd()
@@ -549,15 +630,16 @@ if __name__ == '__main__':
     analysis_dir = os.path.abspath(os.path.join(output_directory,'analysis'))
     portal_dir = os.path.abspath(os.path.join(output_directory,'portal'))
 
-    if os.path.exists(analysis_dir):
-        logger.info('Removing analysis directory: ' + str(analysis_dir))
-        shutil.rmtree(analysis_dir)
-    if os.path.exists(portal_dir):
-        logger.info('Removing portal directory: ' + str(portal_dir))
-        shutil.rmtree(portal_dir)
+    if not args.resume:
+        if os.path.exists(analysis_dir):
+            logger.info('Removing analysis directory: ' + str(analysis_dir))
+            shutil.rmtree(analysis_dir)
+        if os.path.exists(portal_dir):
+            logger.info('Removing portal directory: ' + str(portal_dir))
+            shutil.rmtree(portal_dir)
 
-    os.makedirs(analysis_dir)
-    os.makedirs(portal_dir)
+    os.makedirs(analysis_dir, exist_ok=True)
+    os.makedirs(portal_dir, exist_ok=True)
 
     analysis_mut_file = os.path.join(analysis_dir, portal_config_data['ProjectID'] + '.muts.maf')
     analysis_sv_file = os.path.join(analysis_dir, portal_config_data['ProjectID'] + '.svs.maf')
@@ -600,12 +682,20 @@ if __name__ == '__main__':
     segmented_data_meta = generate_segmented_meta(portal_config_data,segmented_data_file)
     logger.info('Finished generating segmented meta')
 
+    steps = []
     logger.info('Submitting job to generate maf data')
-    generate_maf_data(args.maf_directory,portal_dir,maf_file_name,analysis_mut_file,log_directory,script_path,version_str,project_is_impact)
+    steps.extend(get_maf_data_steps(args.maf_directory,portal_dir,maf_file_name,analysis_mut_file,log_directory,script_path,version_str,project_is_impact))
     logger.info('Submitting job to generate discrete copy number data')
-    generate_discrete_copy_number_data(args.facets_directory,portal_dir,discrete_copy_number_file,analysis_gene_cna_file,assay,log_directory)
+    steps.extend(get_discrete_copy_number_data_steps(args.facets_directory,portal_dir,discrete_copy_number_file,analysis_gene_cna_file,assay,log_directory))
     logger.info('Submitting job to generate segmented copy number data')
-    generate_segmented_copy_number_data(args.facets_directory,portal_dir,segmented_data_file,analysis_seg_file,log_directory)
+    steps.extend(get_segmented_copy_number_data_steps(args.facets_directory,portal_dir,segmented_data_file,analysis_seg_file,log_directory))
+    if project_is_impact:
+        logger.info('Submitting job to generate fusion data')
+        steps.extend(get_fusion_data_steps(args.maf_directory,portal_dir,fusion_file_name,analysis_sv_file,log_directory,script_path,version_str))
+    step_results = run_steps(steps,jobs=args.jobs,skip_up_to_date=args.resume)
+    for step_name in step_results:
+        if not step_results[step_name]:
+            logger.error("Step failed: " + step_name)
 
     if clinical_data:
         clinical_meta_samples_path = os.path.join(portal_dir, clinical_meta_samples_file)
@@ -638,8 +728,6 @@ if __name__ == '__main__':
     if project_is_impact:
         fusion_meta = generate_fusion_meta(portal_config_data,fusion_file_name)
         logger.info('Finished generating fusion meta')
-        logger.info('Submitting job to generate fusion data')
-        generate_fusion_data(args.maf_directory,portal_dir,fusion_file_name,analysis_sv_file,log_directory,script_path,version_str)
         fusion_meta_path = os.path.join(portal_dir,fusion_meta_file)
         logger.info('Writing fusion meta file')
         with open(fusion_meta_path,'w') as fusion_meta_path_file:
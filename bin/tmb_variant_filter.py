@@ -3,9 +3,15 @@
 """
 Script to filter variant .maf file to use with TMB tumor mutational burden calculation
 """
-import csv
 import sys
-from cBioPortal_utils import MafReader, is_TERT_promoter
+
+# relative imports, from CLI and from parent project
+# NOTE: check the package instead of __name__ so that this also works when imported by another script; see maf_pipeline.py
+if __package__:
+    from .cBioPortal_utils import MafStage, run_maf_stages, is_TERT_promoter
+
+if not __package__:
+    from cBioPortal_utils import MafStage, run_maf_stages, is_TERT_promoter
 
 # some maf column header labels that we will use to find values needed for filtering
 alt_dp_colname = 't_alt_count'
@@ -206,27 +212,32 @@ def filter_row(row):
 
     return(keep_row)
 
+class TmbVariantFilterStage(MafStage):
+    """
+    Drop the rows that do not pass the TMB filter criteria in filter_row
+    """
+    # all of the columns used by filter_row
+    columns = [
+        alt_dp_colname,
+        ref_dp_colname,
+        af_colname,
+        dp_colname,
+        gene_function_colname,
+        mutation_status_colname,
+        'Hugo_Symbol', # for is_TERT_promoter
+        'Start_Position'
+    ]
+
+    def transform(self, row):
+        if filter_row(row):
+            return(row)
+        return(None)
+
 def main(input_file, output_file):
     """
     Main control function for the script
     """
-    # setup reader from the input maf file
-    maf_reader = MafReader(input_file)
-    fieldnames = maf_reader.get_fieldnames()
-    comment_lines = maf_reader.comment_lines
-
-    with open(output_file, "w") as fout:
-        # write out the input comments
-        fout.writelines(comment_lines)
-
-        # ignore fields not in fieldnames
-        writer = csv.DictWriter(fout, delimiter = '\t', fieldnames = fieldnames, extrasaction = 'ignore', lineterminator='\n')
-        writer.writeheader()
-
-        # write out the input rows that pass filter criteria
-        for row in maf_reader.read():
-            if filter_row(row):
-                writer.writerow(row)
+    run_maf_stages(input_file, output_file, stages = [ TmbVariantFilterStage() ])
 
 def parse():
     """
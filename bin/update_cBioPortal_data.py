@@ -91,30 +91,46 @@ $ update_cBioPortal_data.py sample --input output/portal/data_clinical_sample.tx
 
 $ bin/update_cBioPortal_data.py mutations --input data_mutations.cc.maf --facets-txt facets-data.txt --output bar.txt
 
+# annotate the mutations in chunks of rows with numpy instead of one row at a time, for large mafs
+$ bin/update_cBioPortal_data.py mutations --input data_mutations.cc.maf --facets-txt facets-data.txt --output bar.txt --batch
+
 
 """
+import os
 import csv
 import sys
+import heapq
+import shutil
+import tempfile
 import argparse
+from itertools import islice
+from contextlib import ExitStack
+from typing import TextIO, List, Dict, Tuple, Set, Iterable, Iterator
 
 # relative imports, from CLI and from parent project
-if __name__ != "__main__":
-    from .cBioPortal_utils import create_file_lines
+if __package__:
+    from .cBioPortal_utils import ClinicalWriter
+    from .cBioPortal_utils import TableReader
     from .cBioPortal_utils import update_sample_data
     from .cBioPortal_utils import sample_data_remove_cols
     from .cBioPortal_utils import facets_data_keep_cols_map
     from .cBioPortal_utils import parse_facets_data
+    from .cBioPortal_utils import load_facets_data
     from .cBioPortal_utils import MafReader
     from .cBioPortal_utils import MafWriter
+    from .cBioPortal_utils import TableSchema
 
-if __name__ == "__main__":
-    from cBioPortal_utils import create_file_lines
+if not __package__:
+    from cBioPortal_utils import ClinicalWriter
+    from cBioPortal_utils import TableReader
     from cBioPortal_utils import update_sample_data
     from cBioPortal_utils import sample_data_remove_cols
     from cBioPortal_utils import facets_data_keep_cols_map
     from cBioPortal_utils import parse_facets_data
+    from cBioPortal_utils import load_facets_data
     from cBioPortal_utils import MafReader
     from cBioPortal_utils import MafWriter
+    from cBioPortal_utils import TableSchema
 
 # # remove these columns from data_clinical_sample.txt data while updating it with Facets Suite data
 # sample_data_remove_cols = ["purity", "ploidy", "facets_version"]
@@ -189,7 +205,8 @@ def update_mutation_data(mut_data, facets_data = None, sample_id = None):
             sample_id = mut_data['sample']
 
     # copy the original dict
-    d = { k:v for k,v in mut_data.items() }
+    # NOTE: use copy() so that compact TableRow records only copy their updated values
+    d = mut_data.copy()
 
     # add new columns that match the old columns
     for old_key, new_key in mutation_data_keep_cols_map.items():
@@ -217,58 +234,195 @@ def update_mutation_data(mut_data, facets_data = None, sample_id = None):
                 d['ASCN.ASCN_INTEGER_COPY_NUMBER'] = 'NA'
     return(d)
 
+# index of each genome_doubled value in the first axis of the facets call states lookup array
+facets_call_states_wgd_index = {'TRUE': 0, 'FALSE': 1}
+# value in the lookup array for (wgd, mcn, lcn) states that are not in facets_call_states
+facets_call_states_missing = -128
+
+def get_facets_call_states_array():
+    """
+    Convert facets_call_states into a dense numpy lookup array indexed by [wgd, mcn, lcn],
+    using facets_call_states_wgd_index for the wgd index;
+    states that are not in facets_call_states hold the facets_call_states_missing value
+    """
+    import numpy as np
+    max_mcn = max([ mcn for wgd, mcn, lcn in facets_call_states ])
+    max_lcn = max([ lcn for wgd, mcn, lcn in facets_call_states ])
+    lookup = np.full((len(facets_call_states_wgd_index), max_mcn + 1, max_lcn + 1), facets_call_states_missing, dtype = np.int8)
+    for (wgd, mcn, lcn), numeric_call in facets_call_states.items():
+        lookup[facets_call_states_wgd_index[wgd], mcn, lcn] = numeric_call
+    return(lookup)
+
+def parse_int_column(values: List[str]):
+    """
+    Parse a column of values into a numpy array of ints, the same way as int();
+    returns the array of ints and a boolean array of which values could be parsed
+
+    Each distinct value is only parsed once, since copy number columns only have a few distinct values
+    """
+    import numpy as np
+    # give each distinct value a code, then parse each code once
+    codes = {}
+    inverse = np.fromiter((codes.setdefault(value, len(codes)) for value in values), dtype = np.int64, count = len(values))
+    parsed = np.zeros(len(codes), dtype = np.int64)
+    is_valid = np.zeros(len(codes), dtype = bool)
+    for value, code in codes.items():
+        try:
+            parsed[code] = int(value)
+            is_valid[code] = True
+        except (ValueError, TypeError, OverflowError):
+            pass
+    return(parsed[inverse], is_valid[inverse])
+
+def get_integer_copy_numbers(
+        sample_ids: List[str],
+        tcn_values: List[str],
+        lcn_values: List[str],
+        facets_data: Dict,
+        lookup = None) -> List[str]:
+    """
+    Get the ASCN.ASCN_INTEGER_COPY_NUMBER values for a chunk of mutations at once; gives the same values as update_mutation_data
+
+    The tcn and lcn values are parsed into numpy arrays and the (wgd, mcn, lcn) states are looked up
+    in the dense array from get_facets_call_states_array
+
+    Parameters
+    ----------
+    sample_ids: list
+        the sample ID for each mutation; None if the mutation has no sample ID
+    tcn_values: list
+        the tcn value for each mutation
+    lcn_values: list
+        the lcn value for each mutation
+    facets_data: dict
+        a dict of facets hisens entries per sample from parse_facets_data
+    lookup: numpy.ndarray
+        the array from get_facets_call_states_array; pass it in to avoid rebuilding it for every chunk
+
+    Returns
+    -------
+    list
+        the ASCN.ASCN_INTEGER_COPY_NUMBER value for each mutation
+    """
+    import numpy as np
+    num_rows = len(sample_ids)
+    if lookup is None:
+        lookup = get_facets_call_states_array()
+
+    # get the wgd index for each row from its sample ID; -1 if there is no sample ID or its wgd value cannot be looked up
+    sample_wgd = { sample_id: facets_call_states_wgd_index.get(data.get('genome_doubled'), -1) for sample_id, data in facets_data.items() }
+    wgd = np.fromiter((sample_wgd.get(sample_id, -1) for sample_id in sample_ids), dtype = np.int64, count = num_rows)
+
+    tcn, tcn_is_valid = parse_int_column(tcn_values)
+    lcn, lcn_is_valid = parse_int_column(lcn_values)
+    # keep the values in a small range so that mcn cannot overflow; anything out of range is not in the lookup anyway
+    tcn_is_valid &= np.abs(tcn) < 2**31
+    lcn_is_valid &= np.abs(lcn) < 2**31
+    mcn = tcn - lcn
+    is_valid = tcn_is_valid & lcn_is_valid & (wgd >= 0) & (mcn >= 0) & (mcn < lookup.shape[1]) & (lcn >= 0) & (lcn < lookup.shape[2])
+    numeric_calls = np.full(num_rows, facets_call_states_missing, dtype = lookup.dtype)
+    numeric_calls[is_valid] = lookup[wgd[is_valid], mcn[is_valid], lcn[is_valid]]
+
+    # convert the calls back into strings
+    call_strings = { numeric_call: str(numeric_call) for numeric_call in facets_call_states.values() }
+    call_strings[facets_call_states_missing] = 'NA'
+    return([ call_strings[numeric_call] for numeric_call in numeric_calls.tolist() ])
+
+def write_updated_mutations_batch(
+        reader: Iterable[List[str]],
+        fieldnames: List[str],
+        fout: TextIO,
+        facets_data: Dict = None,
+        chunk_size: int = 10000) -> None:
+    """
+    Write out the mutations with the ASCN columns added, in chunks; gives the same output as update_mutations_file
+
+    The rows are kept as the lists of values from csv.reader; the new column values for each chunk are found column-wise
+    and appended to the original values, so no dict is made for any row
+
+    NOTE: the fieldnames must not have duplicates or any of the new ASCN columns; update_mutations_file falls back to updating the rows one at a time for those
+
+    Parameters
+    ----------
+    reader: csv.reader
+        the reader for the maf rows, after the header line
+    fieldnames: list
+        the maf header columns
+    fout: file handle
+        the output file
+    """
+    lookup = get_facets_call_states_array()
+    num_fields = len(fieldnames)
+    index = { name: i for i, name in enumerate(fieldnames) }
+    # input columns that get copied to new columns
+    copy_indexes = [ index[old_key] for old_key in mutation_data_keep_cols_map if old_key in index ]
+    output_fieldnames = fieldnames + [ new_key for old_key, new_key in mutation_data_keep_cols_map.items() if old_key in index ] + [ 'ASCN.ASCN_METHOD', 'ASCN.ASCN_INTEGER_COPY_NUMBER' ]
+
+    # prefer to use 'tumor' field, otherwise use 'sample' field
+    sample_index = index.get('tumor', index.get('sample'))
+    tcn_index = index.get('tcn')
+    lcn_index = index.get('lcn')
+
+    writer = csv.writer(fout, delimiter = '\t', lineterminator = '\r\n')
+    writer.writerow(output_fieldnames)
+    row_iter = iter(reader)
+    while True:
+        chunk = list(islice(row_iter, chunk_size))
+        if not chunk:
+            break
+        # empty lines are skipped, same as csv.DictReader
+        chunk = [ values for values in chunk if values ]
+        for values in chunk:
+            if len(values) > num_fields:
+                raise ValueError("dict contains fields not in fieldnames: None")
+            # missing values at the end of short rows are written as empty values
+            if len(values) < num_fields:
+                values.extend([ '' ] * (num_fields - len(values)))
+
+        if facets_data == None:
+            integer_copy_numbers = [ 'NA' ] * len(chunk)
+        else:
+            get_column = lambda i: [ values[i] for values in chunk ] if i is not None else [ None ] * len(chunk)
+            integer_copy_numbers = get_integer_copy_numbers(
+                sample_ids = get_column(sample_index),
+                tcn_values = get_column(tcn_index),
+                lcn_values = get_column(lcn_index),
+                facets_data = facets_data,
+                lookup = lookup)
+
+        for values, integer_copy_number in zip(chunk, integer_copy_numbers):
+            writer.writerow(values + [ values[i] for i in copy_indexes ] + [ 'FACETS', integer_copy_number ])
+
 def update_sample_file(**kwargs):
     """
     Update the data_clinical_sample.txt file with the new Facets Suite data
 
-    NOTE: can prob deprecate some of the code here by using cBioPortal_utils.TableReader instead
+    The sample file is read twice; once to get all of the output columns, then again to write out the updated rows,
+    so that the rows do not need to be held in memory
+
     NOTE: can prob refactor some of the code here to re-use code from merge-tables.py script
     """
     input_file = kwargs.pop('input_file')
     output_file = kwargs.pop('output_file')
     facets_txt_file = kwargs.pop('facets_txt_file')
 
-    # LOAD ALL SAMPLE DATA
-    all_sample_data = []
-
-    # need to find the row to start reading from
-    skip_row = 0
-    with open(input_file) as fin:
-        for i, line in enumerate(fin):
-            if line.startswith('#'):
-                skip_row += 1
-
-    # skip all '#' comment rows in header and load all the data
-    with open(input_file) as fin:
-        while skip_row > 0:
-            next(fin)
-            skip_row -= 1
-        reader = csv.DictReader(fin, delimiter = '\t')
-        for row in reader:
-            all_sample_data.append(row)
-
     # LOAD ALL FACETS DATA
-    all_facets_data = []
-    with open(facets_txt_file) as fin:
-        reader = csv.DictReader(fin, delimiter = '\t')
-        for row in reader:
-            all_facets_data.append(row)
-
     # clean up the facets data to remove stuff we dont want and recalculate things
-    parsed_facets_data = parse_facets_data(all_facets_data)
+    parsed_facets_data = load_facets_data([ facets_txt_file ])
 
     # update all the sample datas based on facets data
-    updated_sample_data = []
-    for sample_data in all_sample_data:
-        new_sample_data = update_sample_data(sample_data, facets_data = parsed_facets_data)
-        updated_sample_data.append(new_sample_data)
+    table_reader = TableReader(input_file)
+    def iter_updated_sample_data():
+        for sample_data in table_reader.read(compact = True):
+            yield(update_sample_data(sample_data, facets_data = parsed_facets_data))
 
-    # create the lines to output to the file
-    lines = create_file_lines(updated_sample_data)
+    # the columns added from the facets data depend on whether each sample had a match, so check all the rows for them first
+    fieldnames = ClinicalWriter.get_fieldnames(iter_updated_sample_data())
 
-    # write all the lines to file
+    # write all the rows to file
     with open(output_file, "w") as fout:
-        fout.writelines(lines)
+        writer = ClinicalWriter(fout = fout, fieldnames = fieldnames)
+        writer.writerows(iter_updated_sample_data())
 
 
 def update_mutations_file(**kwargs):
@@ -279,25 +433,32 @@ def update_mutations_file(**kwargs):
     input_file = kwargs.pop('input_file')
     output_file = kwargs.pop('output_file')
     facets_txt_file = kwargs.pop('facets_txt_file')
+    batch = kwargs.pop('batch', False)
+    chunk_size = kwargs.pop('chunk_size', 10000)
 
     # LOAD ALL FACETS DATA
-    all_facets_data = []
-    with open(facets_txt_file) as fin:
-        reader = csv.DictReader(fin, delimiter = '\t')
-        for row in reader:
-            all_facets_data.append(row)
-
     # clean up the facets data to remove stuff we dont want and recalculate things
-    parsed_facets_data = parse_facets_data(all_facets_data)
+    parsed_facets_data = load_facets_data([ facets_txt_file ])
 
     # UPDATE ALL THE MUTATIONS DATA
     with open(input_file) as fin, open(output_file, "w") as fout:
-        reader = csv.DictReader(fin, delimiter = '\t')
+        # use compact rows that share the column names since the maf can be very wide
+        reader = csv.reader(fin, delimiter = '\t')
+        input_fieldnames = next(reader)
+
+        # annotate the rows in chunks, unless the output columns would need to be matched up by name
+        new_fieldnames = set([ *mutation_data_keep_cols_map.values(), 'ASCN.ASCN_METHOD', 'ASCN.ASCN_INTEGER_COPY_NUMBER' ])
+        if batch and len(set(input_fieldnames)) == len(input_fieldnames) and not new_fieldnames.intersection(input_fieldnames):
+            write_updated_mutations_batch(reader, input_fieldnames, fout, facets_data = parsed_facets_data, chunk_size = chunk_size)
+            return
+
+        schema = TableSchema(input_fieldnames)
+        reader = schema.make_rows(reader)
 
         # need to update the first row in order to know what fieldnames to output
         first_row = next(reader)
         updated_first_row = update_mutation_data(mut_data = first_row, facets_data = parsed_facets_data)
-        fieldnames = updated_first_row.keys()
+        fieldnames = list(updated_first_row.keys())
 
         # set up the output file
         writer = csv.DictWriter(fout, delimiter = '\t', fieldnames = fieldnames)
@@ -309,6 +470,103 @@ def update_mutations_file(**kwargs):
             updated_row = update_mutation_data(mut_data = row, facets_data = parsed_facets_data)
             writer.writerow(updated_row)
 
+# columns used to match the Facets maf rows to the portal maf rows
+merge_maf_key_cols = [
+    'Hugo_Symbol',
+    'Entrez_Gene_Id',
+    'Chromosome',
+    'Start_Position',
+    'End_Position',
+    'Tumor_Sample_Barcode',
+    'Matched_Norm_Sample_Barcode'
+]
+
+def get_merge_maf_key(mut: Dict) -> Tuple[str]:
+    """
+    Get the key used to match a mutation between the Facets maf and the portal maf
+    """
+    return(tuple([ mut[col] for col in merge_maf_key_cols ]))
+
+def load_facets_copy_numbers(facets_maf_file: str, keys: Set[Tuple[str]]) -> Dict:
+    """
+    Stream the Facets maf and get the ASCN.TOTAL_COPY_NUMBER value for each mutation that has one of the keys;
+    all the other Facets mutations are not kept
+
+    NOTE: if there are multiple Facets rows for a key, the last one is used
+    """
+    copy_numbers = {}
+    facets_reader = MafReader(facets_maf_file)
+    for mut in facets_reader.read(columns = merge_maf_key_cols + ['ASCN.TOTAL_COPY_NUMBER']):
+        key = get_merge_maf_key(mut)
+        if key in keys:
+            copy_numbers[key] = mut['ASCN.TOTAL_COPY_NUMBER']
+    return(copy_numbers)
+
+def iter_partitioned_copy_numbers(
+        input_file: str,
+        facets_maf_file: str,
+        num_partitions: int,
+        tmpdir: str,
+        na_value: str = '.') -> Iterator[str]:
+    """
+    Get the Facets ASCN.TOTAL_COPY_NUMBER value for each portal mutation, in the order of the portal maf,
+    by splitting both mafs into partitions on disk based on the mutation key and joining each partition separately
+
+    Use this when both maf files are too large to index in memory; only the keys for a single partition are held in memory at a time
+
+    Parameters
+    ----------
+    input_file: str
+        the portal maf file
+    facets_maf_file: str
+        the Facets maf file
+    num_partitions: int
+        number of partitions to split the mutations into
+    tmpdir: str
+        directory to write the partition files to
+    na_value: str
+        value to use for portal mutations that do not have a Facets match
+    """
+    portal_paths = [ os.path.join(tmpdir, "portal.{}.tsv".format(i)) for i in range(num_partitions) ]
+    facets_paths = [ os.path.join(tmpdir, "facets.{}.tsv".format(i)) for i in range(num_partitions) ]
+    result_paths = [ os.path.join(tmpdir, "result.{}.tsv".format(i)) for i in range(num_partitions) ]
+
+    # write the row number and key for each portal mutation to its partition
+    with ExitStack() as stack:
+        writers = [ csv.writer(stack.enter_context(open(path, "w")), delimiter = '\t', lineterminator = '\n') for path in portal_paths ]
+        for i, mut in enumerate(MafReader(input_file).read(columns = merge_maf_key_cols)):
+            key = get_merge_maf_key(mut)
+            writers[hash(key) % num_partitions].writerow([i, *key])
+
+    # write the key and copy number for each Facets mutation to its partition
+    with ExitStack() as stack:
+        writers = [ csv.writer(stack.enter_context(open(path, "w")), delimiter = '\t', lineterminator = '\n') for path in facets_paths ]
+        for mut in MafReader(facets_maf_file).read(columns = merge_maf_key_cols + ['ASCN.TOTAL_COPY_NUMBER']):
+            key = get_merge_maf_key(mut)
+            writers[hash(key) % num_partitions].writerow([*key, mut['ASCN.TOTAL_COPY_NUMBER']])
+
+    # join each partition; the results are in portal row order within each partition
+    for portal_path, facets_path, result_path in zip(portal_paths, facets_paths, result_paths):
+        with open(portal_path) as fin:
+            portal_rows = [ (int(row[0]), tuple(row[1:])) for row in csv.reader(fin, delimiter = '\t') ]
+        keys = set([ key for _, key in portal_rows ])
+        copy_numbers = {}
+        with open(facets_path) as fin:
+            for row in csv.reader(fin, delimiter = '\t'):
+                key = tuple(row[:-1])
+                if key in keys:
+                    copy_numbers[key] = row[-1]
+        with open(result_path, "w") as fout:
+            writer = csv.writer(fout, delimiter = '\t', lineterminator = '\n')
+            for i, key in portal_rows:
+                writer.writerow([i, copy_numbers.get(key, na_value)])
+
+    # merge the partition results back into the portal row order
+    with ExitStack() as stack:
+        readers = [ csv.reader(stack.enter_context(open(path)), delimiter = '\t') for path in result_paths ]
+        for i, value in heapq.merge(*readers, key = lambda row: int(row[0])):
+            yield(value)
+
 def merge_maf_files(**kwargs):
     """
     Merge in columns from Facets .maf file into the cBioPortal data_mutations_extended.txt maf
@@ -321,66 +579,66 @@ def merge_maf_files(**kwargs):
     NOTE: can prob refactor some of the code here to re-use code from merge-tables.py script
 
     NOTE: This script was previously using huge amounts of memory (50GB+ for a 2.5GB Facets file (1.6mil rows), 180 row 49KB data_mutations_extended file)
-    its still using too much (down to ~1GB) but its low enough that it should be OK for now
-    If memory usage is an issue in the future see notes here https://github.com/mskcc/pluto-cwl/issues/56
-    - consider using pandas to merge the Facets data against the data_mutations_extended
-    - consider loading Facets data into in-memory SQLite and query against that ??
-    - consider switching to bash 'join' instead
-    Right now, it seems like Facets data is not actually using up the memory, since the facets_index here is reduced to ~80MB for the given Facets input file
-    So, really not actually sure what is using up the rest of the memory
+    because it indexed every row of the Facets maf. Now the keys from the small portal maf are loaded first,
+    and the Facets maf is streamed once to keep only the values that match those keys, so memory depends on the size of the portal maf.
+    The portal maf is read once for its keys and once more to write the output.
+    If the portal maf has more than max_index_rows rows, both files are split into partitions on disk
+    and joined one partition at a time instead; see https://github.com/mskcc/pluto-cwl/issues/56
     """
     input_file = kwargs.pop('input_file')
     output_file = kwargs.pop('output_file')
     facets_maf_file = kwargs.pop('facets_maf_file')
+    max_index_rows = kwargs.pop('max_index_rows', 1000000)
+    na_value = '.'
+
+    portal_reader = MafReader(input_file)
+    # count the portal rows and index their keys in the same pass;
+    # the keys are dropped once there are too many rows to hold them in memory
+    keys = set()
+    num_portal_rows = 0
+    for mut in portal_reader.read(columns = merge_maf_key_cols):
+        num_portal_rows += 1
+        if keys is not None:
+            if num_portal_rows > max_index_rows:
+                keys = None
+            else:
+                keys.add(get_merge_maf_key(mut))
+    tmpdir = None
+    try:
+        if keys is not None:
+            # get the values that match the keys of the small portal maf from the Facets maf, then look them up for each portal row
+            copy_numbers = load_facets_copy_numbers(facets_maf_file, keys)
+            get_value = lambda mut: copy_numbers.get(get_merge_maf_key(mut), na_value)
+        else:
+            num_partitions = num_portal_rows // max_index_rows + 1
+            # put the partition files next to the output so large temp files do not end up in a small /tmp
+            tmpdir = tempfile.mkdtemp(dir = os.path.dirname(os.path.abspath(output_file)))
+            values = iter_partitioned_copy_numbers(input_file, facets_maf_file,
+                num_partitions = num_partitions,
+                tmpdir = tmpdir,
+                na_value = na_value)
+            get_value = lambda mut: next(values)
 
-    # load the mutations from the Facets maf
-    facets_reader = MafReader(facets_maf_file)
-
-    # only retain certain keys in each Facets record needed for lookups later
-    # index all the facets mutations so they can be looked up directly
-    facets_index = {}
-    for mut in facets_reader.read():
-        key = '.'.join([
-            mut['Hugo_Symbol'],
-            mut['Entrez_Gene_Id'],
-            mut['Chromosome'],
-            mut['Start_Position'],
-            mut['End_Position'],
-            mut['Tumor_Sample_Barcode'],
-            mut['Matched_Norm_Sample_Barcode']
-            ])
-        facets_index[key] = mut['ASCN.TOTAL_COPY_NUMBER']
-
-    with open(output_file, "w") as fout:
-        # load the mutations and attributes from the portal maf
-        portal_reader = MafReader(input_file)
-        portal_comment_lines = portal_reader.comment_lines
-        portal_fieldnames = portal_reader.get_fieldnames()
+        with open(output_file, "w") as fout:
+            # load the mutations and attributes from the portal maf
+            portal_comment_lines = portal_reader.comment_lines
+            portal_fieldnames = portal_reader.get_fieldnames()
 
-        portal_fieldnames.append("ASCN.CLONAL")
+            portal_fieldnames.append("ASCN.CLONAL")
 
-        fout.writelines(portal_comment_lines)
+            fout.writelines(portal_comment_lines)
 
-        writer = csv.DictWriter(fout, fieldnames = portal_fieldnames, delimiter = '\t', extrasaction = 'ignore', lineterminator='\n')
+            writer = csv.DictWriter(fout, fieldnames = portal_fieldnames, delimiter = '\t', extrasaction = 'ignore', lineterminator='\n')
 
-        writer.writeheader()
+            writer.writeheader()
 
-        # add the column from the Facets row to the portal row
-        for mut in portal_reader.read() :
-            key = '.'.join([
-                mut['Hugo_Symbol'],
-                mut['Entrez_Gene_Id'],
-                mut['Chromosome'],
-                mut['Start_Position'],
-                mut['End_Position'],
-                mut['Tumor_Sample_Barcode'],
-                mut['Matched_Norm_Sample_Barcode']
-                ])
-            if key in facets_index:
-                mut["ASCN.CLONAL"] = facets_index[key]
-            else:
-                mut["ASCN.CLONAL"] = '.'
-            writer.writerow(mut)
+            # add the column from the Facets row to the portal row
+            for mut in portal_reader.read():
+                mut["ASCN.CLONAL"] = get_value(mut)
+                writer.writerow(mut)
+    finally:
+        if tmpdir is not None:
+            shutil.rmtree(tmpdir)
 
 def convert_maf_to_cBioPortal(**kwargs) -> None:
     """
@@ -435,12 +693,15 @@ def main():
     mutations.add_argument('--input', dest = 'input_file', required = True, help = 'Name of the input file')
     mutations.add_argument('--output', dest = 'output_file', required = True, help = 'Name of the output file')
     mutations.add_argument('--facets-txt', dest = 'facets_txt_file', required = True, help = 'The .txt output from Facets Suite')
+    mutations.add_argument('--batch', action = "store_true", help = 'Annotate the mutations in chunks of rows at once (requires numpy)')
+    mutations.add_argument('--chunk-size', dest = 'chunk_size', type = int, default = 10000, help = 'Number of rows per chunk when using --batch')
     mutations.set_defaults(func = update_mutations_file)
 
     merge_mafs = subparsers.add_parser('merge_mafs', help = 'Merge in data from the Facets Suite .maf output with the data_mutations_extended.txt maf file')
     merge_mafs.add_argument('--input', dest = 'input_file', required = True, help = 'Name of the input file (data_mutations_extended.txt)')
     merge_mafs.add_argument('--output', dest = 'output_file', required = True, help = 'Name of the output file')
     merge_mafs.add_argument('--facets-maf', dest = 'facets_maf_file', required = True, help = 'The .maf output from Facets Suite')
+    merge_mafs.add_argument('--max-index-rows', dest = 'max_index_rows', type = int, default = 1000000, help = 'Max number of input file rows to index in memory; larger input files are joined in partitions on disk')
     merge_mafs.set_defaults(func = merge_maf_files)
 
 
@@ -49,35 +49,56 @@ make sure NaN values are set to 0 as well
 add a col is_fillout to label if a row was from fillout or not
 
 
-"""
-import sys
-import csv
-args = sys.argv[1:]
-input_file = args[0]
-output_file = args[1]
-# string in the input maf file that represents empty value
-input_na_str = ''
+Usage
+-----
+
+$ update_fillout_maf.py input.maf output.maf
 
+Use '-' or leave out the file names to read from stdin and write to stdout, so that it can be piped with other steps;
 
-with open(input_file) as fin, open(output_file, "w") as fout:
-    # skip first line
-    # TODO: handle comment lines better
-    next(fin)
+$ cat input.maf | update_fillout_maf.py | add_af.py - output.maf
 
-    reader = csv.DictReader(fin, delimiter = '\t')
-    old_fieldnames = reader.fieldnames
+"""
+import sys
+import argparse
+from functools import lru_cache
+
+# relative imports, from CLI and from parent project
+# NOTE: check the package instead of __name__ so that this also works when imported by another script; see maf_pipeline.py
+if __package__:
+    from .cBioPortal_utils import MafStage, run_maf_stages
 
-    # append the new columns to the maf;
-    new_fieldnames = [ f for f in old_fieldnames ]
-    new_fieldnames.append('t_depth_sample') # t_depth
-    new_fieldnames.append('t_ref_count_sample') # t_ref_count
-    new_fieldnames.append('t_alt_count_sample') # t_alt_count
-    new_fieldnames.append('is_fillout')
+if not __package__:
+    from cBioPortal_utils import MafStage, run_maf_stages
 
-    writer = csv.DictWriter(fout, delimiter = '\t', fieldnames = new_fieldnames, lineterminator='\n') # no carriage returns allowed
-    writer.writeheader()
+# string in the input maf file that represents empty value
+input_na_str = ''
 
-    for row in reader:
+@lru_cache(maxsize = 8192)
+def get_src_samples(src: str) -> frozenset:
+    """
+    Get the set of samples from the SRC column value; many rows have the same SRC value so the split is cached
+    """
+    return(frozenset(src.split(',')))
+
+class UpdateFilloutStage(MafStage):
+    """
+    Save the original sample allele counts to new columns, label the fillout rows,
+    and back-fill empty allele counts with the fillout values
+    """
+    # input comments are not written to the output maf
+    keep_comments = False
+
+    def get_fieldnames(self, fieldnames):
+        # append the new columns to the maf;
+        new_fieldnames = [ f for f in fieldnames ]
+        new_fieldnames.append('t_depth_sample') # t_depth
+        new_fieldnames.append('t_ref_count_sample') # t_ref_count
+        new_fieldnames.append('t_alt_count_sample') # t_alt_count
+        new_fieldnames.append('is_fillout')
+        return(new_fieldnames)
+
+    def transform(self, row):
         # original values for the sample
         t_depth_sample = row['t_depth']
         t_ref_count_sample = row['t_ref_count']
@@ -90,7 +111,7 @@ with open(input_file) as fin, open(output_file, "w") as fout:
 
         # check if the variant was a fillout or not; SRC will not contain the Tumor_Sample_Barcode
         sample_id = row['Tumor_Sample_Barcode']
-        samples = set(row['SRC'].split(','))
+        samples = get_src_samples(row['SRC'])
         row['is_fillout'] = not sample_id in samples
 
         # if any of the values was blank, replace with fillout values
@@ -107,5 +128,23 @@ with open(input_file) as fin, open(output_file, "w") as fout:
                 row['t_depth'] = str(int(t_ref_count_fillout) + int(t_alt_count_fillout))
             except ValueError: #         ValueError: invalid literal for int() with base 10: ''
                 row['t_depth'] = ''
-
-        writer.writerow(row)
+        return(row)
+
+def main(input_file, output_file):
+    """
+    Main control function for the script
+    """
+    run_maf_stages(input_file, output_file, stages = [ UpdateFilloutStage() ])
+
+def parse():
+    """
+    Parse command line options
+    """
+    parser = argparse.ArgumentParser(description = 'Update the allele count columns in the fillout maf file for use with cBioPortal')
+    parser.add_argument('input_file', nargs = '?', default = '-', help = "Input maf file; '-' for stdin")
+    parser.add_argument('output_file', nargs = '?', default = '-', help = "Output maf file; '-' for stdout")
+    args = parser.parse_args()
+    main(**vars(args))
+
+if __name__ == '__main__':
+    parse()
@@ -19,13 +19,21 @@ from pluto.settings import DATA_SETS
 from settings import BIN_DIR
 from bin.cBioPortal_utils import (
 create_file_lines,
+ClinicalWriter,
 generate_header_lines,
 update_sample_data,
 parse_facets_data,
 parse_header_comments,
+parse_table_header,
+find_data_offset,
+count_table_lines,
 load_facets_data,
+load_pickle_cache,
+save_pickle_cache,
 MafReader,
 MafWriter,
+TableSchema,
+sort_table,
 is_TERT_promoter
 )
 sys.path.pop(0)
@@ -84,6 +92,44 @@ class TestCBioUtils(PlutoTestCase):
         ]
         self.assertEqual(lines, expected_lines)
 
+    def test_clinical_writer(self):
+        """
+        Test that the ClinicalWriter writes the same lines as create_file_lines
+        """
+        clinical_data = [
+        {'PATIENT_ID': 'Patient1', 'SEX': 'M', "SAMPLE_TYPE": "FOO"},
+        {'PATIENT_ID': 'Patient2', 'SEX': None, "SAMPLE_CLASS": "BAR"}
+        ]
+        fieldnames = ClinicalWriter.get_fieldnames(clinical_data)
+        self.assertEqual(fieldnames, ['PATIENT_ID', 'SEX', 'SAMPLE_TYPE', 'SAMPLE_CLASS'])
+
+        output_file = os.path.join(self.tmpdir, "output.txt")
+        with open(output_file, "w") as fout:
+            writer = ClinicalWriter(fout = fout, fieldnames = fieldnames)
+            # rows can come from an iterator
+            writer.writerows(row for row in clinical_data)
+        with open(output_file) as fin:
+            lines = fin.readlines()
+        self.assertEqual(lines, create_file_lines(clinical_data))
+
+        # known columns in a different order, with a different na_str
+        with open(output_file, "w") as fout:
+            writer = ClinicalWriter(fout = fout, fieldnames = ['SEX', 'PATIENT_ID'], na_str = '.')
+            for row in clinical_data:
+                writer.writerow(row)
+        with open(output_file) as fin:
+            lines = fin.readlines()
+        expected_lines = [
+        '#SEX\tPATIENT_ID\n',
+        '#SEX\tPATIENT_ID\n',
+        '#STRING\tSTRING\n',
+        '#1\t1\n',
+        'SEX\tPATIENT_ID\n',
+        'M\tPatient1\n',
+        '.\tPatient2\n'
+        ]
+        self.assertEqual(lines, expected_lines)
+
     def test_generate_header_lines(self):
         """
         Test that the header lines are generated as expected for the given column headers
@@ -457,6 +503,70 @@ class TestCBioUtils(PlutoTestCase):
             }
         self.assertDictEqual(facets_data, expected_data)
 
+    def test_load_facets_data_threads_cache(self):
+        """
+        Test that Facets Suite .txt files loaded at the same time or from the cache give the same data as loading them one at a time
+        """
+        header = ['sample', 'run_type', 'purity', 'ploidy', 'facets_version', 'genome_doubled']
+        facets_files = []
+        for i in range(6):
+            lines = [
+            header,
+            ['Sample{}.Normal{}'.format(i, i), 'purity', '0.5', '3.0', '0.5.14', 'TRUE'],
+            ['Sample{}.Normal{}'.format(i, i), 'hisens', '0.{}'.format(i), '2.{}'.format(i), '0.5.14', 'FALSE'],
+            # the same sample is in every file; the value from the last file should be used
+            ['SampleX.NormalX', 'hisens', '0.{}'.format(i), '1.{}'.format(i), '0.5.14', 'TRUE']
+            ]
+            facets_files.append(self.write_table(self.tmpdir, filename = "Sample{}.txt".format(i), lines = lines))
+
+        expected_data = load_facets_data(facets_files)
+        self.assertEqual(len(expected_data), 7)
+        self.assertEqual(expected_data['SampleX']['ASCN_PURITY'], '0.5')
+        self.assertEqual(expected_data['Sample2']['ASCN_WGD'], 'no WGD')
+
+        self.assertDictEqual(load_facets_data(facets_files, threads = 4), expected_data)
+
+        # the first run writes the cache files, the second run loads them
+        for i in range(2):
+            self.assertDictEqual(load_facets_data(facets_files, threads = 4, use_cache = True), expected_data)
+            self.assertTrue(all([ os.path.exists(filename + '.hisens.pkl') for filename in facets_files ]))
+
+        # the cache is not used after the input file changes
+        lines = [ header, ['SampleY.NormalY', 'hisens', '0.9', '2.9', '0.5.14', 'TRUE'] ]
+        self.write_table(self.tmpdir, filename = "Sample5.txt", lines = lines)
+        os.utime(facets_files[-1], (os.path.getmtime(facets_files[-1]) + 10, os.path.getmtime(facets_files[-1]) + 10))
+        facets_data = load_facets_data(facets_files, use_cache = True)
+        self.assertTrue('SampleY' in facets_data)
+        self.assertTrue('Sample5' not in facets_data)
+        self.assertEqual(facets_data['SampleX']['ASCN_PURITY'], '0.4')
+
+    def test_pickle_cache(self):
+        """
+        Test that a cache is only loaded for the same version of the same source file it was built from,
+        and that a failed save does not leave a temp file behind
+        """
+        source_file1 = self.write_table(self.tmpdir, filename = "source1.txt", lines = [['foo']])
+        source_file2 = self.write_table(self.tmpdir, filename = "source2.txt", lines = [['bar']])
+        cache_file = os.path.join(self.tmpdir, "source.pkl")
+
+        self.assertEqual(load_pickle_cache(cache_file, source_file1, version = 1), None)
+        save_pickle_cache({'foo': 1}, cache_file, source_file1, version = 1)
+        self.assertEqual(load_pickle_cache(cache_file, source_file1, version = 1), {'foo': 1})
+        # different cache format version
+        self.assertEqual(load_pickle_cache(cache_file, source_file1, version = 2), None)
+        # built from a different file, even though the cache is newer than it
+        os.utime(source_file2, (os.path.getmtime(cache_file) - 10, os.path.getmtime(cache_file) - 10))
+        self.assertEqual(load_pickle_cache(cache_file, source_file2, version = 1), None)
+        # the source file changed
+        self.write_table(self.tmpdir, filename = "source1.txt", lines = [['foo'], ['baz']])
+        self.assertEqual(load_pickle_cache(cache_file, source_file1, version = 1), None)
+
+        files = sorted(os.listdir(self.tmpdir))
+        with self.assertRaises(Exception):
+            # lambdas cannot be pickled
+            save_pickle_cache({'foo': lambda x: x}, os.path.join(self.tmpdir, "bad.pkl"), source_file1, version = 1)
+        self.assertEqual(sorted(os.listdir(self.tmpdir)), files)
+
 
 
 class TestMafReader(PlutoTestCase):
@@ -567,6 +677,197 @@ class TestMafReader(PlutoTestCase):
         expected_num_variants = 0
         self.assertEqual(num_variants, expected_num_variants)
 
+    def test_maf_reader_header_offset(self):
+        """
+        Test case for reading the table rows more than once from the cached header offset
+        comment characters after the header line are part of the table rows
+        """
+        maf_lines = [
+            ['# comment 1'],
+            ['Hugo_Symbol', 'Chromosome'],
+            ['SUFU', '1'],
+            ['#GOT1', '2']
+        ]
+        input_maf_file = self.write_table(tmpdir = self.tmpdir, filename = 'input.maf', lines = maf_lines)
+        maf_reader = MafReader(input_maf_file)
+        self.assertEqual(maf_reader.comments, ['# comment 1'])
+        self.assertEqual(maf_reader.start_line, 1)
+
+        expected_mutations = [{'Hugo_Symbol': 'SUFU', 'Chromosome': '1'} , {'Hugo_Symbol': '#GOT1', 'Chromosome': '2'}]
+        self.assertEqual([ mut for mut in maf_reader.read() ], expected_mutations)
+        self.assertEqual([ mut for mut in maf_reader.read() ], expected_mutations)
+
+        # modifying the returned fieldnames should not change the reader
+        fieldnames = maf_reader.get_fieldnames()
+        fieldnames.append('t_af')
+        self.assertEqual(maf_reader.get_fieldnames(), ['Hugo_Symbol', 'Chromosome'])
+
+    def test_parse_table_header(self):
+        """
+        Test case for getting the comments, header, and first row offset from an open file
+        """
+        maf_lines = [
+            ['# comment 1'],
+            ['# comment 2'],
+            ['Hugo_Symbol', 'Chromosome'],
+            ['SUFU', '1']
+        ]
+        input_maf_file = self.write_table(tmpdir = self.tmpdir, filename = 'input.maf', lines = maf_lines)
+        with open(input_maf_file) as fin:
+            comments, fieldnames, offset = parse_table_header(fin)
+            fin.seek(offset)
+            next_line = fin.readline()
+        self.assertEqual(comments, ['# comment 1', '# comment 2'])
+        self.assertEqual(fieldnames, ['Hugo_Symbol', 'Chromosome'])
+        self.assertEqual(next_line, 'SUFU\t1\n')
+
+    def test_maf_reader_compact(self):
+        """
+        Test case for reading compact rows that share the column names from the maf
+        """
+        maf_lines = [
+            ['# comment 1'],
+            ['Hugo_Symbol', 'Chromosome'],
+            ['SUFU', '1'],
+            [],
+            ['GOT1', '2', 'extra'],
+            ['SOX9']
+        ]
+        input_maf_file = self.write_table(tmpdir = self.tmpdir, filename = 'input.maf', lines = maf_lines)
+        maf_reader = MafReader(input_maf_file)
+        expected_records = [ rec for rec in maf_reader.read() ]
+        records = [ rec for rec in maf_reader.read(compact = True) ]
+        self.assertEqual(records, expected_records)
+        self.assertEqual([ list(rec.keys()) for rec in records ], [ list(rec.keys()) for rec in expected_records ])
+        self.assertEqual(records[0]['Hugo_Symbol'], 'SUFU')
+        self.assertEqual(records[1][None], ['extra'])
+        self.assertEqual(records[2].get('Chromosome', 'NA'), None)
+        # all the rows share the same schema
+        self.assertTrue(records[0].schema is records[1].schema)
+
+    def test_maf_reader_values(self):
+        """
+        Test case for reading the list of values for each row from the maf, as they are in the file
+        """
+        maf_lines = [
+            ['# comment 1'],
+            ['Hugo_Symbol', 'Chromosome'],
+            ['SUFU', '1'],
+            [],
+            ['GOT1', '2', 'extra'],
+            ['SOX9']
+        ]
+        input_maf_file = self.write_table(tmpdir = self.tmpdir, filename = 'input.maf', lines = maf_lines)
+        maf_reader = MafReader(input_maf_file)
+        values = [ line for line in maf_reader.read_values() ]
+        self.assertEqual(values, [['SUFU', '1'], ['GOT1', '2', 'extra'], ['SOX9']])
+
+    def test_maf_count_lines(self):
+        """
+        Test case for counting the rows in a maf with blank lines, quoted values with newlines, and no newline at the end of the file
+        """
+        input_maf_file = os.path.join(self.tmpdir, "input.maf")
+        with open(input_maf_file, "w") as fout:
+            fout.write('# comment 1\n\nHugo_Symbol\tChromosome\nSUFU\t1\n\n\nGOT1\t2\r\n\r\nSOX9\t3')
+        self.assertEqual(MafReader(input_maf_file).count(), 3)
+        with open(input_maf_file, "rb") as fin:
+            offset = find_data_offset(fin)
+        # small block sizes so that lines are split across blocks
+        for block_size in [1, 2, 3, 1024]:
+            self.assertEqual(count_table_lines(input_maf_file, offset = offset, block_size = block_size), 3)
+
+        with open(input_maf_file, "w") as fout:
+            fout.write('Hugo_Symbol\tChromosome\nSUFU\t"1\n\n2"\nGOT1\t2\n\n')
+        self.assertEqual(count_table_lines(input_maf_file), None)
+        self.assertEqual(MafReader(input_maf_file).count(), 2)
+
+    def test_maf_reader_columns(self):
+        """
+        Test case for reading only some of the columns from the maf
+        """
+        maf_lines = [
+            ['# comment 1'],
+            ['Hugo_Symbol', 'Chromosome', 'Start_Position'],
+            ['SUFU', '1', '100'],
+            [],
+            ['"GOT1"', '2', '200'],
+            ['SOX9']
+        ]
+        input_maf_file = self.write_table(tmpdir = self.tmpdir, filename = 'input.maf', lines = maf_lines)
+        maf_reader = MafReader(input_maf_file)
+        records = [ rec for rec in maf_reader.read(columns = ['Start_Position', 'Hugo_Symbol', 'foo']) ]
+        expected_records = [
+            {'Start_Position': '100', 'Hugo_Symbol': 'SUFU'},
+            {'Start_Position': '200', 'Hugo_Symbol': 'GOT1'},
+            {'Start_Position': None, 'Hugo_Symbol': 'SOX9'}
+        ]
+        self.assertEqual(records, expected_records)
+
+        lines = [ line for rec, line in maf_reader.read(columns = ['Hugo_Symbol'], include_lines = True) ]
+        self.assertEqual(lines, ['SUFU\t1\t100\n', '"GOT1"\t2\t200\n', 'SOX9\n'])
+        self.assertEqual(maf_reader.count(), 3)
+
+    def test_table_row_copy_on_write(self):
+        """
+        Test case for updating a copy of a compact row without changing the original row
+        """
+        schema = TableSchema(['Hugo_Symbol', 'Chromosome', 'Start_Position'])
+        row = next(schema.make_rows([['SUFU', '1', '100']]))
+        new_row = row.copy()
+        new_row['Chromosome'] = '2'
+        new_row['t_af'] = '0.5'
+        del new_row['Start_Position']
+
+        self.assertEqual(row, {'Hugo_Symbol': 'SUFU', 'Chromosome': '1', 'Start_Position': '100'})
+        self.assertEqual(dict(new_row), {'Hugo_Symbol': 'SUFU', 'Chromosome': '2', 't_af': '0.5'})
+        self.assertEqual(list(new_row.keys()), ['Hugo_Symbol', 'Chromosome', 't_af'])
+        self.assertTrue('Start_Position' not in new_row)
+        self.assertEqual(len(new_row), 3)
+        self.assertEqual(list(new_row.values()), ['SUFU', '2', '0.5'])
+        self.assertEqual(list(row.values()), ['SUFU', '1', '100'])
+        with self.assertRaises(KeyError):
+            new_row['Start_Position']
+        self.assertEqual(new_row.pop('t_af'), '0.5')
+        self.assertEqual(dict(new_row), {'Hugo_Symbol': 'SUFU', 'Chromosome': '2'})
+
+        # compact rows work with the functions that copy and update rows
+        sample_row = next(TableSchema(['SAMPLE_ID', 'purity']).make_rows([['Sample1-T', '0.5']]))
+        updated_row = update_sample_data(sample_row, {'Sample1-T': {'ploidy': '2'}})
+        self.assertEqual(updated_row, {'SAMPLE_ID': 'Sample1-T'})
+        self.assertEqual(sample_row, {'SAMPLE_ID': 'Sample1-T', 'purity': '0.5'})
+
+    def test_sort_table(self):
+        """
+        Test case for sorting a table on a column in small chunks; rows with the same key keep their order
+        """
+        lines = [
+            ['# comment 1'],
+            ['SAMPLE_ID', 'VALUE'],
+            ['Sample3', '1'],
+            ['Sample1', '2'],
+            [],
+            ['Sample2', '3'],
+            ['Sample1', '4'],
+            ['Sample0'],
+        ]
+        input_file = self.write_table(tmpdir = self.tmpdir, filename = 'input.tsv', lines = lines)
+        output_file = os.path.join(self.tmpdir, "output.tsv")
+        for chunk_size in [1, 2, 100]:
+            sort_table(input_file, output_file, key = 'SAMPLE_ID', chunk_size = chunk_size)
+            with open(output_file) as fin:
+                output_lines = fin.readlines()
+            expected_lines = [
+                '# comment 1\n',
+                'SAMPLE_ID\tVALUE\n',
+                'Sample0\n',
+                'Sample1\t2\n',
+                'Sample1\t4\n',
+                'Sample2\t3\n',
+                'Sample3\t1\n'
+            ]
+            self.assertEqual(output_lines, expected_lines)
+        self.assertEqual(sorted(os.listdir(self.tmpdir)), ['input.tsv', 'output.tsv'])
+
     def test_is_TERT_promoter(self):
         """
         Test case for detecting if a variant is considered to be in the TERT promoter or not
@@ -169,8 +169,62 @@ class TestCalcTMB(PlutoTestCase):
         expected_result = 'NA'
         self.assertEqual(result, expected_result)
 
+    def test_calc_tmb_from_cohort(self):
+        """
+        Test case for calculating the TMB for all the samples in a multi-sample maf file at once,
+        with variants filtered by the tmb_variant_filter.py criteria
+        """
+        good_variant = {'Hugo_Symbol': 'SUFU', 'Start_Position': '1', 'Consequence': 'missense_variant', 'Mutation_Status': 'SOMATIC', 't_depth': '100', 't_alt_count': '50', 't_ref_count': '50'}
+        maf_rows = [
+            { **good_variant, 'Tumor_Sample_Barcode': 'Sample1-T' },
+            { **good_variant, 'Tumor_Sample_Barcode': 'Sample2-T' },
+            { **good_variant, 'Tumor_Sample_Barcode': 'Sample1-T' },
+            { **good_variant, 'Tumor_Sample_Barcode': 'Sample1-T', 'Consequence': 'synonymous_variant' }, # filtered out
+            { **good_variant, 'Tumor_Sample_Barcode': 'Sample3-T', 't_alt_count': '1' }, # filtered out
+            { **good_variant, 'Tumor_Sample_Barcode': 'Sample4-T' }
+        ]
+        maf_lines = self.dicts2lines(dict_list = maf_rows, comment_list = [['# comment 1']])
+        input_maf_file = self.write_table(tmpdir = self.tmpdir, filename = 'input.maf', lines = maf_lines)
+        coverage_lines = [
+            ['SAMPLE_ID', 'GENOME_COVERAGE'],
+            ['Sample2-T', '2000'],
+            ['Sample5-T', '2000'] # no variants
+        ]
+        coverage_file = self.write_table(tmpdir = self.tmpdir, filename = 'coverage.txt', lines = coverage_lines)
+        normals_lines = [
+            ['SAMPLE_ID', 'NORMAL_ID'],
+            ['Sample1-T', 'Sample1-N'],
+            ['Sample4-T', 'ABCPOOLEDNORMAL123']
+        ]
+        normals_file = self.write_table(tmpdir = self.tmpdir, filename = 'normals.txt', lines = normals_lines)
+        output_file = os.path.join(self.tmpdir, "output.txt")
 
-
+        command = [script, 'from-cohort', input_maf_file, output_file, '--genome-coverage', "1000", '--coverage-file', coverage_file, '--normals-file', normals_file]
+        returncode, proc_stdout, proc_stderr = self.run_command(command, validate = True, testcase = self)
+        with open(output_file) as fin:
+            lines = [ line.strip().split('\t') for line in fin ]
+        expected_lines = [
+            ['SAMPLE_ID', 'CMO_TMB_SCORE'],
+            ['Sample2-T', '500.0'],
+            ['Sample5-T', '0.0'],
+            ['Sample1-T', '2000.0'],
+            ['Sample4-T', 'NA'],
+            ['Sample3-T', '0.0']
+        ]
+        self.assertEqual(lines, expected_lines)
+
+        # same results from a directory of per-sample maf files
+        maf_dir = os.path.join(self.tmpdir, "mafs")
+        os.mkdir(maf_dir)
+        for sample_id in ['Sample1-T', 'Sample2-T', 'Sample3-T', 'Sample4-T']:
+            sample_rows = [ row for row in maf_rows if row['Tumor_Sample_Barcode'] == sample_id ]
+            sample_lines = self.dicts2lines(dict_list = sample_rows, comment_list = [['# comment 1']])
+            self.write_table(tmpdir = maf_dir, filename = sample_id + '.maf', lines = sample_lines)
+        command = [script, 'from-cohort', maf_dir, output_file, '--genome-coverage', "1000", '--coverage-file', coverage_file, '--normals-file', normals_file]
+        returncode, proc_stdout, proc_stderr = self.run_command(command, validate = True, testcase = self)
+        with open(output_file) as fin:
+            lines = [ line.strip().split('\t') for line in fin ]
+        self.assertEqual(lines, expected_lines)
 
 
 if __name__ == "__main__":
@@ -157,6 +157,71 @@ class TestConcatTables(PlutoTestCase):
         ]
         self.assertEqual(comments, expected_comments)
 
+    def test_get_table_headers(self):
+        """
+        Test that the comments, fieldnames, and data offsets are read from the start of each file
+        """
+        lines1 = [
+        '# comment 1\n',
+        'HEADER1\tHEADER2\n',
+        'foo1\tbar1\n',
+        '# not a comment\tbar2\n'
+        ]
+        lines2 = [
+        'HEADER1\tHEADER3\n',
+        'foo2\tbaz2\n'
+        ]
+        input_file1 = os.path.join(self.tmpdir, "input1.txt")
+        input_file2 = os.path.join(self.tmpdir, "input2.txt")
+        input_file3 = os.path.join(self.tmpdir, "input3.txt")
+        with open(input_file1, "w") as fout:
+            fout.writelines(lines1)
+        with open(input_file2, "w") as fout:
+            fout.writelines(lines2)
+        with open(input_file3, "w") as fout:
+            fout.write('')
+        headers = concat_tables.get_table_headers([input_file1, input_file2, input_file3], delimiter = '\t', has_comments = True, threads = 2)
+        self.assertEqual([ (comments, fieldnames) for comments, fieldnames, offset in headers ], [
+            (['# comment 1'], ['HEADER1', 'HEADER2']),
+            ([], ['HEADER1', 'HEADER3']),
+            ([], None)
+            ])
+        with open(input_file1) as fin:
+            fin.seek(headers[0][2])
+            self.assertEqual(fin.readlines(), lines1[2:])
+
+        self.assertEqual(concat_tables.find_start_line(input_file1), 1)
+        fieldnames = concat_tables.get_all_fieldnames([input_file1, input_file2, input_file3], delimiter = '\t', headers = headers)
+        self.assertEqual([f for f in fieldnames], ['HEADER1', 'HEADER2', 'HEADER3'])
+
+    def test_get_all_comments_collapse_prefixes(self):
+        """
+        Test that only the first comment with each prefix is kept when collapsing comments
+        """
+        lines1 = [
+        '# Versions: 1.0\n',
+        '# comment 1\n',
+        'HEADER1\tHEADER2\n',
+        'foo1\tbar1\n'
+        ]
+        lines2 = [
+        '# Versions: 1.1\n',
+        '# comment 1\n',
+        '# comment 2\n',
+        'HEADER1\tHEADER3\n',
+        'foo2\tbaz2\n'
+        ]
+        input_file1 = os.path.join(self.tmpdir, "input1.txt")
+        input_file2 = os.path.join(self.tmpdir, "input2.txt")
+        with open(input_file1, "w") as fout:
+            fout.writelines(lines1)
+        with open(input_file2, "w") as fout:
+            fout.writelines(lines2)
+        comments = concat_tables.get_all_comments([input_file1, input_file2], comment_char = '#')
+        self.assertEqual(comments, ['# Versions: 1.0', '# comment 1', '# Versions: 1.1', '# comment 2'])
+        comments = concat_tables.get_all_comments([input_file1, input_file2], comment_char = '#', collapse_prefixes = ['# Versions:'])
+        self.assertEqual(comments, ['# Versions: 1.0', '# comment 1', '# comment 2'])
+
     def test_concat_tables1(self):
         """
         Test that the script runs as expected with a single input file
@@ -226,6 +291,51 @@ class TestConcatTables(PlutoTestCase):
 
         self.assertEqual(lines, expected_lines)
 
+    def test_concat_tables_same_header_edge_rows(self):
+        """
+        test the script with input files with the same headers, where some of the lines cannot be copied as-is
+        """
+        lines1 = [
+        'HEADER1\tHEADER2\n',
+        'foo1\tbar1\n',
+        'foo2\t\n',
+        '\n',
+        '"foo3\n',
+        'foo3"\tbar3\n',
+        'foo4'
+        ]
+        lines2 = [
+        'HEADER1\tHEADER2\n',
+        'foo5\tbar5\n'
+        ]
+        input_file1 = os.path.join(self.tmpdir, "input1.txt")
+        input_file2 = os.path.join(self.tmpdir, "input2.txt")
+        output_file = os.path.join(self.tmpdir, "output.txt")
+        with open(input_file1, "w") as fout:
+            fout.writelines(lines1)
+        with open(input_file2, "w") as fout:
+            fout.writelines(lines2)
+
+        command = [ concat_tables_script, '-o', output_file, '--no-carriage-returns', input_file1, input_file2 ]
+        returncode, proc_stdout, proc_stderr = self.run_command(command)
+        if returncode != 0:
+            print(proc_stderr)
+        self.assertEqual(returncode, 0)
+
+        with open(output_file, newline = '') as fin:
+            lines = fin.readlines()
+
+        expected_lines = [
+        'HEADER1\tHEADER2\n',
+        'foo1\tbar1\n',
+        'foo2\t.\n',
+        '"foo3\n',
+        'foo3"\tbar3\n',
+        'foo4\t.\n',
+        'foo5\tbar5\n'
+        ]
+        self.assertEqual(lines, expected_lines)
+
     def test_concat_tables_diff_header(self):
         """
         test the script with multiple input files with different headers
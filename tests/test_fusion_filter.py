@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests cases for filtering fusion files
+"""
+import os
+import sys
+import unittest
+
+THIS_DIR = os.path.dirname(os.path.realpath(__file__))
+PARENT_DIR = os.path.dirname(THIS_DIR)
+sys.path.insert(0, PARENT_DIR)
+from settings import BIN_DIR
+from pluto.tools import PlutoTestCase
+from bin.fusion_filter import load_known_fusions
+sys.path.pop(0)
+
+script = os.path.join(BIN_DIR, 'fusion_filter.py')
+
+
+class TestFusionFilter(PlutoTestCase):
+    def test_filter_fusions1(self):
+        """
+        Test case for removing the fusions that are not known, or that have a row without an Entrez ID
+        """
+        lines = [
+            ["Hugo_Symbol", "Entrez_Gene_Id", "Center", "Tumor_Sample_Barcode", "Fusion", "Method"],
+            ["IRF2BP2", "359948", "mskcc.org", "sample1", "IRF2BP2-NTRK1 fusion", "EMBL.DELLYv0.7.7"],
+            ["NTRK1", "4914", "mskcc.org", "sample1", "IRF2BP2-NTRK1 fusion", "EMBL.DELLYv0.7.7"],
+            ["FOO", "1234", "mskcc.org", "sample1", "FOO-BAR fusion", "EMBL.DELLYv0.7.7"],
+            ["EML4", "27436", "mskcc.org", "sample2", "EML4-ALK fusion", "EMBL.DELLYv0.7.7"],
+            ["ALK", "0", "mskcc.org", "sample2", "EML4-ALK fusion", "EMBL.DELLYv0.7.7"],
+        ]
+        known_fusions_lines = [
+            ["IRF2BP2-NTRK1"],
+            ["EML4-ALK"]
+        ]
+        input_file = self.write_table(self.tmpdir, filename = "input.txt", lines = lines)
+        known_fusions_file = self.write_table(self.tmpdir, filename = "known_fusions.txt", lines = known_fusions_lines)
+        index_file = os.path.join(self.tmpdir, "known_fusions.idx")
+        output_file = os.path.join(self.tmpdir, "output.txt")
+
+        # run twice so that the second run uses the index built by the first run
+        for i in range(2):
+            command = [script, input_file, output_file, known_fusions_file, '--index-file', index_file]
+            returncode, proc_stdout, proc_stderr = self.run_command(command, validate = True, testcase = self)
+
+            with open(output_file) as fin:
+                output_lines = fin.readlines()
+            expected_lines = [
+                'Hugo_Symbol\tEntrez_Gene_Id\tCenter\tTumor_Sample_Barcode\tFusion\tMethod\n',
+                'IRF2BP2\t359948\tmskcc.org\tsample1\tIRF2BP2-NTRK1 fusion\tEMBL.DELLYv0.7.7\n',
+                'NTRK1\t4914\tmskcc.org\tsample1\tIRF2BP2-NTRK1 fusion\tEMBL.DELLYv0.7.7\n'
+            ]
+            self.assertEqual(output_lines, expected_lines)
+            self.assertTrue(os.path.exists(index_file))
+
+        self.assertEqual(load_known_fusions(known_fusions_file, index_file = index_file), {'IRF2BP2-NTRK1', 'EML4-ALK'})
+
+        # an index built from a different known fusions file is not used, even though the index is newer
+        other_fusions_file = self.write_table(self.tmpdir, filename = "other_fusions.txt", lines = [["FOO-BAR"]])
+        os.utime(other_fusions_file, (os.path.getmtime(index_file) - 10, os.path.getmtime(index_file) - 10))
+        self.assertEqual(load_known_fusions(other_fusions_file, index_file = index_file), {'FOO-BAR'})
+
+    def test_filter_fusions_multiple_files(self):
+        """
+        Test case for filtering the rows of several fusion files with the same header as a single table,
+        with the values of short and long rows written out as they are in the input
+        """
+        header = ["Hugo_Symbol", "Entrez_Gene_Id", "Center", "Tumor_Sample_Barcode", "Fusion", "Method"]
+        lines1 = [
+            header,
+            ["IRF2BP2", "359948", "mskcc.org", "sample1", "IRF2BP2-NTRK1 fusion", "EMBL.DELLYv0.7.7"],
+            ["NTRK1", "4914", "mskcc.org", "sample1", "IRF2BP2-NTRK1 fusion", "EMBL.DELLYv0.7.7"],
+        ]
+        lines2 = [
+            header,
+            ["EML4", "27436", "mskcc.org", "sample2", "EML4-ALK fusion", "EMBL.DELLYv0.7.7"],
+            ["ALK", "238", "mskcc.org", "sample2", "EML4-ALK fusion", "EMBL.DELLYv0.7.7"],
+            ["FOO", "1234", "mskcc.org", "sample2", "FOO-BAR fusion", "EMBL.DELLYv0.7.7"],
+            # row that is missing its last value
+            ["ALK", "238", "mskcc.org", "sample3", "EML4-ALK fusion"],
+            # row with an extra value at the end
+            ["EML4", "27436", "mskcc.org", "sample3", "EML4-ALK fusion", "EMBL.DELLYv0.7.7", "extra"],
+        ]
+        known_fusions_lines = [
+            ["IRF2BP2-NTRK1"],
+            ["EML4-ALK"]
+        ]
+        input_file1 = self.write_table(self.tmpdir, filename = "sample1.txt", lines = lines1)
+        input_file2 = self.write_table(self.tmpdir, filename = "sample2.txt", lines = lines2)
+        known_fusions_file = self.write_table(self.tmpdir, filename = "known_fusions.txt", lines = known_fusions_lines)
+        output_file = os.path.join(self.tmpdir, "output.txt")
+
+        command = [script, input_file1, input_file2, output_file, known_fusions_file]
+        returncode, proc_stdout, proc_stderr = self.run_command(command, validate = True, testcase = self)
+
+        with open(output_file) as fin:
+            output_lines = fin.readlines()
+        expected_lines = [
+            'Hugo_Symbol\tEntrez_Gene_Id\tCenter\tTumor_Sample_Barcode\tFusion\tMethod\n',
+            'IRF2BP2\t359948\tmskcc.org\tsample1\tIRF2BP2-NTRK1 fusion\tEMBL.DELLYv0.7.7\n',
+            'NTRK1\t4914\tmskcc.org\tsample1\tIRF2BP2-NTRK1 fusion\tEMBL.DELLYv0.7.7\n',
+            'EML4\t27436\tmskcc.org\tsample2\tEML4-ALK fusion\tEMBL.DELLYv0.7.7\n',
+            'ALK\t238\tmskcc.org\tsample2\tEML4-ALK fusion\tEMBL.DELLYv0.7.7\n',
+            'ALK\t238\tmskcc.org\tsample3\tEML4-ALK fusion\n',
+            'EML4\t27436\tmskcc.org\tsample3\tEML4-ALK fusion\tEMBL.DELLYv0.7.7\textra\n'
+        ]
+        self.assertEqual(output_lines, expected_lines)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -107,6 +107,37 @@ class TestConvertFusion(PlutoTestCase):
 
         self.assertEqual(records, expected_records)
 
+    def test_convert_fusion_ungrouped(self):
+        """
+        Test case for converting a fusion file where the rows for each sample and fusion are not next to each other
+        """
+        lines1 = [
+            ["Hugo_Symbol", "Entrez_Gene_Id", "Center", "Tumor_Sample_Barcode", "Fusion", "Frame"],
+            ["NTRK1", "4914", "mskcc.org", "sample2", "NTRK1-TPM3 fusion", "5to5"],
+            ["IRF2BP2", "359948", "mskcc.org", "sample1", "IRF2BP2-NTRK1 fusion", "5to5"],
+            ["TPM3", "7170", "mskcc.org", "sample2", "NTRK1-TPM3 fusion", "5to5"],
+            ["NTRK1", "4914", "mskcc.org", "sample1", "IRF2BP2-NTRK1 fusion", "5to5"],
+        ]
+        table1 = self.write_table(
+            self.tmpdir, filename="input_fusion.txt", lines=lines1)
+
+        output_file = os.path.join(self.tmpdir, "output_sv.txt")
+        command = [script, '--fusion_file', table1, '--sv_file', output_file]
+
+        returncode, proc_stdout, proc_stderr = self.run_command(
+            command, validate=True, testcase=self)
+
+        with open(output_file) as fin:
+            lines = fin.readlines()
+        expected_lines = [
+            'Sample_ID\tSite1_Hugo_Symbol\tSite1_Entrez_Gene_Id\tSite2_Hugo_Symbol\tSite2_Entrez_Gene_Id\tSV_Status\tCenter\tEvent_Info\tSite2_Effect_On_Frame\n',
+            'sample1\tIRF2BP2\t359948\tNTRK1\t4914\tSOMATIC\tmskcc.org\tIRF2BP2-NTRK1 fusion\t5to5\n',
+            'sample2\tNTRK1\t4914\tTPM3\t7170\tSOMATIC\tmskcc.org\tNTRK1-TPM3 fusion\t5to5\n'
+        ]
+        self.assertEqual(lines, expected_lines)
+        # the temporary sorted file is removed
+        self.assertEqual(sorted(os.listdir(self.tmpdir)), ['input_fusion.txt', 'output_sv.txt'])
+
     def test_convert_fusion_empty(self):
         """
         Test case for converting an empty fusion file to sv format
@@ -31,6 +31,8 @@ from bin.generate_cbioPortal_files import get_sample_list
 from bin.generate_cbioPortal_files import generate_meta_segments_data
 from bin.generate_cbioPortal_files import generate_data_clinical_sample_file
 from bin.generate_cbioPortal_files import clean_facets_suite_cna_file
+from bin.generate_cbioPortal_files import generate_portal_bundle
+from bin.generate_cbioPortal_files import bundle_files
 sys.path.pop(0)
 
 class TestGenerateCBioFiles(PlutoTestCase):
@@ -745,8 +747,88 @@ class TestGenerateCBioFiles(PlutoTestCase):
         self.assertEqual(lines, expected_lines)
 
 
+    def test_generate_portal_bundle(self):
+        """
+        Test that the bundle creates the same files as the individual subcommands
+        """
+        clinical_lines = [
+        ['SAMPLE_ID', 'IGO_ID', 'PATIENT_ID', 'COLLAB_ID', 'SAMPLE_TYPE', 'SAMPLE_CLASS', 'GENE_PANEL', 'ONCOTREE_CODE', 'SPECIMEN_PRESERVATION_TYPE', 'SEX', 'TISSUE_SITE', 'REQUEST_ID', 'PROJECT_ID', 'PIPELINE', 'PIPELINE_VERSION'],
+        ['Sample1', '08390_G_1', 'p_C_00001', 'COLLAB-01-T', 'Primary', 'Biopsy', 'IMPACT468', 'MEL', 'FFPE', 'M', '', '08390_G', '08390', 'roslin', '2.5.7'],
+        ['Sample2', '08390_G_2', 'p_C_00002', 'COLLAB-02-T', 'Primary', 'Biopsy', 'IMPACT468', 'MEL', 'FFPE', 'F', '', '08390_G', '08390', 'roslin', '2.5.7'],
+        ['Sample3', '08390_G_3', 'p_C_00002', 'COLLAB-03-T', 'Metastasis', 'Biopsy', 'IMPACT468', 'MEL', 'FFPE', 'F', '', '08390_G', '08390', 'roslin', '2.5.7']
+        ]
+        summary_lines = [
+        ['Sample', 'Coverage'],
+        ['Sample1', '108'],
+        ['Sample3', '502'],
+        ['Project Average', '305']
+        ]
+        data_clinical_file = self.write_table(self.tmpdir, filename = "data_clinical.txt", lines = clinical_lines)
+        sample_summary_file = self.write_table(self.tmpdir, filename = "SampleSummary.txt", lines = summary_lines)
+        script = os.path.join(BIN_DIR, 'generate_cbioPortal_files.py')
 
-
+        # make each file on its own
+        single_dir = os.path.join(self.tmpdir, "single")
+        os.mkdir(single_dir)
+        commands = [
+        ['study', '--output', 'meta_study.txt', '--cancer-study-id', 'study1', '--name', 'name', '--short-name', 'short', '--type-of-cancer', 'mel', '--extra-groups', 'foo'],
+        ['meta_sample', '--output', 'meta_clinical_sample.txt', '--cancer-study-id', 'study1'],
+        ['meta_patient', '--output', 'meta_clinical_patient.txt', '--cancer-study-id', 'study1'],
+        ['meta_cna', '--output', 'meta_CNA.txt', '--cancer-study-id', 'study1'],
+        ['meta_sv', '--output', 'meta_SV.txt', '--cancer-study-id', 'study1'],
+        ['meta_mutations', '--output', 'meta_mutations_extended.txt', '--cancer-study-id', 'study1'],
+        ['meta_segments', '--output', 'study1_meta_cna_hg19_seg.txt', '--cancer-study-id', 'study1', '--segmented-data-file', 'study1_data_cna_hg19.seg'],
+        ['patient', '--output', 'data_clinical_patient.txt', '--data-clinical-file', data_clinical_file],
+        ['sample', '--output', 'data_clinical_sample.txt', '--data-clinical-file', data_clinical_file, '--sample-summary-file', sample_summary_file, '--project-pi', 'jonesd', '--request-pi', 'smithd'],
+        ['cases_all', '--output', 'cases_all.txt', '--cancer-study-id', 'study1', '--data-clinical-file', data_clinical_file],
+        ['cases_cnaseq', '--output', 'cases_cnaseq.txt', '--cancer-study-id', 'study1', '--data-clinical-file', data_clinical_file],
+        ['cases_cna', '--output', 'cases_cna.txt', '--cancer-study-id', 'study1', '--data-clinical-file', data_clinical_file],
+        ['cases_sequenced', '--output', 'cases_sequenced.txt', '--cancer-study-id', 'study1', '--data-clinical-file', data_clinical_file]
+        ]
+        for command in commands:
+            command[2] = os.path.join(single_dir, command[2])
+            returncode, proc_stdout, proc_stderr = self.run_command([script] + command, validate = True, testcase = self)
+
+        # make them all at once, with and without threads
+        for threads in ['1', '4']:
+            bundle_dir = os.path.join(self.tmpdir, "bundle" + threads)
+            command = [
+            script, 'bundle',
+            '--output-dir', bundle_dir,
+            '--cancer-study-id', 'study1',
+            '--name', 'name', '--short-name', 'short', '--type-of-cancer', 'mel', '--extra-groups', 'foo',
+            '--data-clinical-file', data_clinical_file,
+            '--sample-summary-file', sample_summary_file,
+            '--project-pi', 'jonesd', '--request-pi', 'smithd',
+            '--skip', 'meta_fusion',
+            '--threads', threads
+            ]
+            returncode, proc_stdout, proc_stderr = self.run_command(command, validate = True, testcase = self)
+
+            self.assertFalse(os.path.exists(os.path.join(bundle_dir, 'meta_fusions.txt')))
+            for command in commands:
+                filename = os.path.basename(command[2])
+                if filename.startswith('cases_'):
+                    bundle_file = os.path.join(bundle_dir, 'case_lists', filename)
+                else:
+                    bundle_file = os.path.join(bundle_dir, filename)
+                with open(command[2]) as fin:
+                    expected_lines = fin.readlines()
+                with open(bundle_file) as fin:
+                    lines = fin.readlines()
+                self.assertEqual(lines, expected_lines)
+                # each file gets a timing line
+                self.assertTrue(bundle_file in proc_stderr)
+
+        # call it from Python to get the timings back
+        timings = generate_portal_bundle(
+            output_dir = os.path.join(self.tmpdir, "bundle_py"),
+            cancer_study_identifier = 'study1',
+            name = 'name', short_name = 'short', type_of_cancer = 'mel',
+            data_clinical_file = data_clinical_file,
+            sample_summary_file = sample_summary_file,
+            threads = 2)
+        self.assertEqual([ name for name, output, elapsed in timings ], ['inputs'] + bundle_files)
 
 
 if __name__ == "__main__":
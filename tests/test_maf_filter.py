@@ -10,6 +10,10 @@ to run only small tests;
 
 python tests/test_maf_filter.py TestMafFilter2Script TestMafFilterScript_Small
 
+to run the throughput benchmarks for the filter engines; these are skipped unless MAF_FILTER_BENCHMARKS is set
+
+MAF_FILTER_BENCHMARKS=True python tests/test_maf_filter.py TestMafFilterBenchmark
+
 to run all tests, including large tests that might take a while to finish;
 
 python tests/test_maf_filter.py
@@ -18,6 +22,8 @@ import sys
 import os
 import unittest
 import csv
+import time
+from itertools import cycle, islice
 
 try:
     from fixtures_mutations import (
@@ -52,6 +58,8 @@ from bin import maf_filter
 sys.path.pop(0)
 
 maf_filter_script = os.path.join(BIN_DIR, 'maf_filter.py')
+# the benchmarks take a while to run, so only run them when asked for
+run_benchmarks = os.environ.get('MAF_FILTER_BENCHMARKS') == 'True'
 
 demo_maf_rows = [
     bad_row_PNISR,
@@ -114,6 +122,90 @@ class TestMafFilterScript_Small(PlutoTestCase):
         comments, mutations = self.load_mutations(rejected_file)
         self.assertEqual(len(mutations), 5)
 
+    def test_maf_filter_fillout_order(self):
+        """
+        Test that fillout rows are written to the portal file after all the other portal rows,
+        even when they come first in the input file
+        """
+        fillout_row = { **good_row_FGF3, 'Hugo_Symbol': 'SUFU', 'Mutation_Status': 'None' }
+        maf_rows = [ fillout_row, bad_row_PNISR, good_row_FGF3 ]
+        demo_maf_lines = self.dicts2lines(dict_list = maf_rows, comment_list = [['# comment 1']])
+        input_maf_file = self.write_table(self.tmpdir, filename = "input.maf", lines = demo_maf_lines)
+
+        for extra_args in [ [], ['--batch'], ['--workers', '2'] ]:
+            analyst_file = os.path.join(self.tmpdir, "analyst_file.txt")
+            portal_file = os.path.join(self.tmpdir, "portal_file.txt")
+            rejected_file = os.path.join(self.tmpdir, "rejected.muts.maf")
+            command = [ maf_filter_script, input_maf_file, '--version-string', "2.x", '--is-impact', '--analyst-file', analyst_file, '--portal-file', portal_file, '--keep-rejects', '--rejected-file', rejected_file, *extra_args ]
+            returncode, proc_stdout, proc_stderr = self.run_command(command, validate = True, testcase = self)
+
+            comments, mutations = self.load_mutations(analyst_file)
+            self.assertEqual([ mut['Hugo_Symbol'] for mut in mutations ], ['FGF3'])
+
+            comments, mutations = self.load_mutations(portal_file)
+            self.assertEqual(comments, ['# comment 1', '# Versions: 2.x'])
+            self.assertEqual([ mut['Hugo_Symbol'] for mut in mutations ], ['FGF3', 'SUFU'])
+
+            comments, mutations = self.load_mutations(rejected_file)
+            self.assertEqual([ mut['Hugo_Symbol'] for mut in mutations ], ['PNISR'])
+
+    def test_maf_filter_batch_missing_columns(self):
+        """
+        Test that the batch filter engine gives the same output as the row-by-row filter for maf files
+        that only have the allele count columns used for their variant types;
+        no fillout columns without SNP rows, and no caller allele counts with only SNP rows
+        """
+        non_SNP_rows = []
+        SNP_rows = []
+        for row in demo_maf_rows:
+            non_SNP_rows.append({ k:v for k,v in row.items() if k not in ['fillout_t_depth', 'fillout_t_alt'] })
+            non_SNP_rows[-1]['Variant_Type'] = 'DEL'
+            SNP_rows.append({ k:v for k,v in row.items() if k not in ['t_depth', 't_alt_count'] })
+
+        for filename, maf_rows in [ ("non_SNP.maf", non_SNP_rows), ("SNP.maf", SNP_rows) ]:
+            input_maf_file = self.write_table(self.tmpdir, filename = filename, lines = self.dicts2lines(dict_list = maf_rows, comment_list = []))
+            outputs = []
+            for extra_args in [ [], ['--batch'] ]:
+                analyst_file = os.path.join(self.tmpdir, "analyst_file.txt")
+                portal_file = os.path.join(self.tmpdir, "portal_file.txt")
+                rejected_file = os.path.join(self.tmpdir, "rejected.muts.maf")
+                command = [ maf_filter_script, input_maf_file, '--version-string', "2.x", '--is-impact', '--analyst-file', analyst_file, '--portal-file', portal_file, '--keep-rejects', '--rejected-file', rejected_file, *extra_args ]
+                returncode, proc_stdout, proc_stderr = self.run_command(command, validate = True, testcase = self)
+                outputs.append([ self.load_mutations(output_file) for output_file in [ analyst_file, portal_file, rejected_file ] ])
+            self.assertEqual(outputs[1], outputs[0])
+
+    def test_maf_filter_multiple_files(self):
+        """
+        Test that multiple input maf files are filtered as one table in the order they are given,
+        and that files with a different header are an error
+        """
+        fillout_row = { **good_row_FGF3, 'Hugo_Symbol': 'SUFU', 'Mutation_Status': 'None' }
+        kept_row = { **good_row_FGF3, 'Hugo_Symbol': 'FGF4' }
+        maf_file1 = self.write_table(self.tmpdir, filename = "sample1.muts.maf",
+            lines = self.dicts2lines(dict_list = [ fillout_row, good_row_FGF3 ], comment_list = [['# sample1']]))
+        maf_file2 = self.write_table(self.tmpdir, filename = "sample2.muts.maf",
+            lines = self.dicts2lines(dict_list = [ bad_row_PNISR, kept_row ], comment_list = [['# sample2']]))
+
+        for extra_args in [ [], ['--batch'], ['--workers', '2'] ]:
+            analyst_file = os.path.join(self.tmpdir, "analyst_file.txt")
+            portal_file = os.path.join(self.tmpdir, "portal_file.txt")
+            command = [ maf_filter_script, maf_file1, maf_file2, '--version-string', "2.x", '--is-impact', '--analyst-file', analyst_file, '--portal-file', portal_file, *extra_args ]
+            returncode, proc_stdout, proc_stderr = self.run_command(command, validate = True, testcase = self)
+
+            comments, mutations = self.load_mutations(analyst_file)
+            self.assertEqual(comments, ['# Versions: 2.x'])
+            self.assertEqual([ mut['Hugo_Symbol'] for mut in mutations ], ['FGF3', 'FGF4'])
+
+            comments, mutations = self.load_mutations(portal_file)
+            self.assertEqual([ mut['Hugo_Symbol'] for mut in mutations ], ['FGF3', 'FGF4', 'SUFU'])
+
+        bad_header_file = self.write_table(self.tmpdir, filename = "sample3.muts.maf",
+            lines = self.dicts2lines(dict_list = [ { **good_row_FGF3, 'foo': 'bar' } ], comment_list = []))
+        with self.assertRaises(ValueError):
+            maf_filter.main(input_file = [ maf_file1, bad_header_file ], version_string = "2.x",
+                analyst_file = os.path.join(self.tmpdir, "analyst_file.txt"),
+                portal_file = os.path.join(self.tmpdir, "portal_file.txt"))
+
     def test_filter_maf_file_impact_false(self):
         """
         Test the maf_filter.py results with IMPACT flag not set
@@ -540,5 +632,108 @@ class TestMafFilter2Script(PlutoTestCase):
         self.assertEqual(portal_keep, [row2])
         self.assertEqual(fillout_keep, [])
 
+    def test_filter_row_diagnostics(self):
+        """
+        Test that the filter_flags are only built when requested, without changing the filter results
+        """
+        for fixture_row in [bad_row_PNISR, good_row_FGF3]:
+            expected = maf_filter.filter_row({ k:v for k,v in fixture_row.items() }, is_impact = True)
+            self.assertEqual(len(expected[7]), len(maf_filter.filter_flags_keys))
+
+            result = maf_filter.filter_row({ k:v for k,v in fixture_row.items() }, is_impact = True, diagnostics = False)
+            self.assertEqual(result[:7], expected[:7])
+            self.assertEqual(result[7], None)
+
+        # only get filter_flags for the rejected row
+        new_row, analysis_keep, portal_keep, fillout_keep, reject_row, reject_reason, reject_flag, filter_flags = maf_filter.filter_row({ k:v for k,v in bad_row_PNISR.items() }, is_impact = True, diagnostics = 'rejects')
+        self.assertEqual(reject_row, True)
+        self.assertEqual(filter_flags["pass_FILTER"], False)
+        new_row, analysis_keep, portal_keep, fillout_keep, reject_row, reject_reason, reject_flag, filter_flags = maf_filter.filter_row({ k:v for k,v in good_row_FGF3.items() }, is_impact = True, diagnostics = 'rejects')
+        self.assertEqual(reject_row, False)
+        self.assertEqual(filter_flags, None)
+
+    def test_filter_rows_batch_parity(self):
+        """
+        Test that the batch filter engine gives the same output as filter_rows for the demo rows
+        plus some variations of them that hit the other filter criteria
+        """
+        variations = [
+            {'Mutation_Status': 'None'}, # fillout row
+            {'FILTER': 'mq55;asb'}, # only ccs filters
+            {'FILTER': 'common_variant'},
+            {'Variant_Type': 'DEL'}, # use caller allele counts instead of fillout
+            {'Variant_Type': 'INS', 't_depth': '0'}, # no depth
+            {'Hugo_Symbol': 'TERT', 'Start_Position': '1295200', 'Consequence': 'upstream_gene_variant'}, # TERT promoter
+            {'Consequence': 'synonymous_variant'},
+            {'HGVSc': 'c.10+2_11+5del'}
+        ]
+        rows = [ row for row in demo_maf_rows ]
+        for row in demo_maf_rows:
+            for variation in variations:
+                rows.append({ **row, **variation })
+
+        for is_impact in [True, False]:
+            expected = maf_filter.filter_rows([ { k:v for k,v in row.items() } for row in rows ], is_impact = is_impact, keep_rejects = True)
+            # use a small chunk size so that rows are split across chunks
+            result = maf_filter.filter_rows_batch([ { k:v for k,v in row.items() } for row in rows ], is_impact = is_impact, keep_rejects = True, chunk_size = 7)
+            self.assertEqual(result, expected)
+
+    def test_get_shard_ranges(self):
+        """
+        Test that the shard byte ranges cover every table row exactly once and skip the comments and header
+        """
+        maf_lines = self.dicts2lines(dict_list = demo_maf_rows, comment_list = [['# comment 1'], ['# comment 2']])
+        input_maf_file = self.write_table(self.tmpdir, filename = "input.maf", lines = maf_lines)
+        fieldnames = list(demo_maf_rows[0].keys())
+
+        for num_shards in [1, 2, 3, len(demo_maf_rows), 100]:
+            ranges = maf_filter.get_shard_ranges(input_maf_file, num_shards = num_shards)
+            self.assertTrue(len(ranges) <= num_shards)
+            rows = []
+            for start, end in ranges:
+                lines = maf_filter.read_shard_lines(input_maf_file, start, end)
+                rows.extend(csv.DictReader(lines, delimiter = '\t', fieldnames = fieldnames))
+            self.assertEqual([ row['Hugo_Symbol'] for row in rows ], [ row['Hugo_Symbol'] for row in demo_maf_rows ])
+
+class TestMafFilterBenchmark(PlutoTestCase):
+    """
+    Throughput comparison of the row-by-row filter and the batch filter engine on a large synthetic maf
+    """
+    num_rows = 1000000
+
+    def synthetic_rows(self):
+        """
+        Generate copies of the demo rows
+        """
+        for row in islice(cycle(demo_maf_rows), self.num_rows):
+            yield({ k:v for k,v in row.items() })
+
+    @unittest.skipUnless(run_benchmarks, "set MAF_FILTER_BENCHMARKS=True to run the benchmarks")
+    def test_benchmark_filter_rows_batch(self):
+        start = time.time()
+        expected = maf_filter.filter_rows(self.synthetic_rows(), is_impact = True)
+        filter_rows_time = time.time() - start
+
+        start = time.time()
+        result = maf_filter.filter_rows_batch(self.synthetic_rows(), is_impact = True)
+        filter_rows_batch_time = time.time() - start
+
+        self.assertEqual(result, expected)
+        print("\n{} rows; filter_rows: {:.2f}s, filter_rows_batch: {:.2f}s".format(self.num_rows, filter_rows_time, filter_rows_batch_time))
+
+    @unittest.skipUnless(run_benchmarks, "set MAF_FILTER_BENCHMARKS=True to run the benchmarks")
+    def test_benchmark_filter_row_diagnostics(self):
+        """
+        Compare filter_row with the full filter_flags built for every row against only building them for rejected rows, and not at all
+        """
+        times = {}
+        for diagnostics in [True, 'rejects', False]:
+            start = time.time()
+            for row in self.synthetic_rows():
+                maf_filter.filter_row(row, is_impact = True, diagnostics = diagnostics)
+            times[diagnostics] = time.time() - start
+        print("\n{} rows; filter_row diagnostics=True: {:.2f}s, diagnostics='rejects': {:.2f}s, diagnostics=False: {:.2f}s".format(
+            self.num_rows, times[True], times['rejects'], times[False]))
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+unit tests for the maf_pipeline.py script
+"""
+import sys
+import os
+import unittest
+
+THIS_DIR = os.path.dirname(os.path.realpath(__file__))
+PARENT_DIR = os.path.dirname(THIS_DIR)
+sys.path.insert(0, PARENT_DIR)
+from pluto.tools import PlutoTestCase
+from settings import BIN_DIR
+sys.path.pop(0)
+
+script = os.path.join(BIN_DIR, 'maf_pipeline.py')
+
+class TestMafPipeline(PlutoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.maf_rows = [
+            {
+            'Hugo_Symbol': 'SUFU', 'Tumor_Sample_Barcode': 'Sample1-T', 'Start_Position': '100', 'Consequence': 'missense_variant', 'Mutation_Status': 'SOMATIC',
+            't_depth': '100', 't_ref_count': '25', 't_alt_count': '75', 'SRC': 'Sample1-T,',
+            't_FL_DP': '4', 't_FL_RD': '5', 't_FL_AD': '6', 'foo': 'bar'
+            },
+            { # fillout row that gets its counts from the t_FL_* columns
+            'Hugo_Symbol': 'GOT1', 'Tumor_Sample_Barcode': 'Sample1-T', 'Start_Position': '100', 'Consequence': 'missense_variant', 'Mutation_Status': 'SOMATIC',
+            't_depth': '', 't_ref_count': '', 't_alt_count': '', 'SRC': 'Sample2-T,',
+            't_FL_DP': '100', 't_FL_RD': '10', 't_FL_AD': '90', 'foo': 'bar'
+            },
+            { # low alt count; removed by tmb_variant_filter
+            'Hugo_Symbol': 'SOX9', 'Tumor_Sample_Barcode': 'Sample1-T', 'Start_Position': '100', 'Consequence': 'missense_variant', 'Mutation_Status': 'SOMATIC',
+            't_depth': '100', 't_ref_count': '99', 't_alt_count': '1', 'SRC': 'Sample1-T,',
+            't_FL_DP': '4', 't_FL_RD': '5', 't_FL_AD': '6', 'foo': 'bar'
+            }
+        ]
+        impact_lines = [
+            ['SUFU'],
+            ['SOX9']
+        ]
+        self.impact_file = self.write_table(tmpdir = self.tmpdir, filename = 'IMPACT.txt', lines = impact_lines)
+
+    def test_pipeline_matches_scripts(self):
+        """
+        Test that running the stages in one pass gives the same output as running each of the scripts in turn
+        """
+        maf_lines = self.dicts2lines(dict_list = self.maf_rows, comment_list = [['# comment 1']])
+        input_file = self.write_table(self.tmpdir, filename = "input.maf", lines = maf_lines)
+
+        # run each of the scripts on the output of the last one
+        tmp1 = os.path.join(self.tmpdir, "tmp1.maf")
+        tmp2 = os.path.join(self.tmpdir, "tmp2.maf")
+        tmp3 = os.path.join(self.tmpdir, "tmp3.maf")
+        tmp4 = os.path.join(self.tmpdir, "tmp4.maf")
+        expected_file = os.path.join(self.tmpdir, "expected.maf")
+        commands = [
+            [ os.path.join(BIN_DIR, 'update_fillout_maf.py'), input_file, tmp1 ],
+            [ os.path.join(BIN_DIR, 'add_af.py'), tmp1, tmp2 ],
+            [ os.path.join(BIN_DIR, 'add_is_in_impact.py'), '--input_file', tmp2, '--output_file', tmp3, '--IMPACT_file', self.impact_file ],
+            [ os.path.join(BIN_DIR, 'tmb_variant_filter.py'), tmp3, tmp4 ],
+            [ os.path.join(BIN_DIR, 'maf_col_filter.py'), tmp4, expected_file ],
+        ]
+        for command in commands:
+            returncode, proc_stdout, proc_stderr = self.run_command(command, validate = True, testcase = self)
+
+        output_file = os.path.join(self.tmpdir, "output.maf")
+        command = [ script, input_file, output_file,
+            '--stages', 'update_fillout_maf', 'add_af', 'add_is_in_impact', 'tmb_variant_filter', 'maf_col_filter',
+            '--IMPACT_file', self.impact_file ]
+        returncode, proc_stdout, proc_stderr = self.run_command(command, validate = True, testcase = self)
+
+        with open(expected_file) as f:
+            expected_lines = f.readlines()
+        with open(output_file) as f:
+            output_lines = f.readlines()
+        self.assertEqual(output_lines, expected_lines)
+
+        comments, mutations = self.load_mutations(output_file)
+        self.assertEqual(comments, [])
+        self.assertEqual([ mut['Hugo_Symbol'] for mut in mutations ], ['SUFU', 'GOT1'])
+        self.assertEqual(mutations[1]['t_depth'], '100')
+        self.assertEqual(mutations[1]['t_af'], '0.9')
+        self.assertEqual(mutations[1]['is_in_impact'], 'False')
+        self.assertTrue('foo' not in mutations[0])
+
+    def test_pipeline_keeps_comments(self):
+        """
+        Test that the input comments are kept when none of the stages drop them
+        """
+        # leave out the fillout row without allele counts
+        maf_rows = [ self.maf_rows[0], self.maf_rows[2] ]
+        maf_lines = self.dicts2lines(dict_list = maf_rows, comment_list = [['# comment 1'], ['# comment 2']])
+        input_file = self.write_table(self.tmpdir, filename = "input.maf", lines = maf_lines)
+        output_file = os.path.join(self.tmpdir, "output.maf")
+        command = [ script, input_file, output_file, '--stages', 'add_af', 'add_is_in_impact', '--IMPACT_file', self.impact_file, '--include-assay' ]
+        returncode, proc_stdout, proc_stderr = self.run_command(command, validate = True, testcase = self)
+
+        comments, mutations = self.load_mutations(output_file)
+        self.assertEqual(comments, ['# comment 1', '# comment 2'])
+        self.assertEqual([ mut['t_af'] for mut in mutations ], ['0.75', '0.01'])
+        self.assertEqual([ mut['is_in_impact'] for mut in mutations ], ['True', 'True'])
+        self.assertEqual([ mut['impact_assays'] for mut in mutations ], ['', ''])
+
+if __name__ == "__main__":
+    unittest.main()
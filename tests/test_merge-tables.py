@@ -238,6 +238,182 @@ class TestTMBVariantFilter(PlutoTestCase):
 
         self.assertEqual(comments, expected_comments)
         self.assertEqual(records, expected_records)
+    def test_merge_tables_sorted(self):
+        """
+        Test case for merging tables that are sorted on the key columns, one row at a time
+        Rows in the first table without a match in the second table get the na_str value
+        """
+        lines1 = [
+            ['# comment 1'],
+            ['SAMPLE_ID', 'PATIENT_ID', 'SAMPLE_COVERAGE'],
+            ['Sample1-N', 'Patient1', '58'],
+            ['Sample1-T', 'Patient1', '108'],
+            ['Sample2-N', 'Patient2', '56'],
+            ['Sample2-T', 'Patient2', '502'],
+        ]
+        lines2 = [
+            ['# comment 2'],
+            ['SampleID', 'TMB'],
+            ['Sample1-T', '100'],
+            ['Sample2-T', '200'],
+        ]
+        table1 = self.write_table(self.tmpdir, filename = "table1.tsv", lines = lines1)
+        table2 = self.write_table(self.tmpdir, filename = "table2.tsv", lines = lines2)
+        output_file = os.path.join(self.tmpdir, "output.txt")
+        command = [script, table1, table2, '--key1', 'SAMPLE_ID', '--key2', 'SampleID', '--output', output_file, '--sorted']
+        returncode, proc_stdout, proc_stderr = self.run_command(command, validate = True, testcase = self)
+
+        reader = TableReader(output_file)
+        comments = reader.comment_lines
+        records = [ rec for rec in reader.read() ]
+        expected_comments = ['# comment 1\n', '# comment 2\n']
+        expected_records = [
+            {'SAMPLE_ID': 'Sample1-N', 'PATIENT_ID': 'Patient1', 'SAMPLE_COVERAGE': '58', 'TMB': 'NA'},
+            {'SAMPLE_ID': 'Sample1-T', 'PATIENT_ID': 'Patient1', 'SAMPLE_COVERAGE': '108', 'TMB': '100'},
+            {'SAMPLE_ID': 'Sample2-N', 'PATIENT_ID': 'Patient2', 'SAMPLE_COVERAGE': '56', 'TMB': 'NA'},
+            {'SAMPLE_ID': 'Sample2-T', 'PATIENT_ID': 'Patient2', 'SAMPLE_COVERAGE': '502', 'TMB': '200'}
+        ]
+        self.assertEqual(comments, expected_comments)
+        self.assertEqual(records, expected_records)
+
+        # unsorted input is an error
+        lines2 = [
+            ['SampleID', 'TMB'],
+            ['Sample2-T', '200'],
+            ['Sample1-T', '100'],
+        ]
+        table2 = self.write_table(self.tmpdir, filename = "table2.unsorted.tsv", lines = lines2)
+        command = [script, table1, table2, '--key1', 'SAMPLE_ID', '--key2', 'SampleID', '--output', output_file, '--sorted']
+        returncode, proc_stdout, proc_stderr = self.run_command(command)
+        self.assertNotEqual(returncode, 0)
+
+    def test_merge_tables_sort_inputs_cBioPortal(self):
+        """
+        Test case for sorting unsorted tables before merging them, with cBioPortal output
+        """
+        lines1 = [
+            ['SAMPLE_ID', 'SAMPLE_COVERAGE'],
+            ['Sample2-T', '502'],
+            ['Sample1-N', '58'],
+            ['Sample1-T', '108'],
+        ]
+        lines2 = [
+            ['SampleID', 'CMO_TMB_SCORE'],
+            ['Sample2-T', '200'],
+            ['Sample1-T', '100'],
+        ]
+        table1 = self.write_table(self.tmpdir, filename = "table1.tsv", lines = lines1)
+        table2 = self.write_table(self.tmpdir, filename = "table2.tsv", lines = lines2)
+        output_file = os.path.join(self.tmpdir, "output.txt")
+        command = [script, table1, table2, '--key1', 'SAMPLE_ID', '--key2', 'SampleID', '--output', output_file, '--sort-inputs', '--cBioPortal']
+        returncode, proc_stdout, proc_stderr = self.run_command(command, validate = True, testcase = self)
+
+        with open(output_file) as fin:
+            lines = fin.readlines()
+        expected_lines = [
+            '#SAMPLE_ID\tSAMPLE_COVERAGE\tCMO_TMB_SCORE\n',
+            '#SAMPLE_ID\tSAMPLE_COVERAGE\tCMO_TMB_SCORE\n',
+            '#STRING\tNUMBER\tNUMBER\n',
+            '#1\t1\t1\n',
+            'SAMPLE_ID\tSAMPLE_COVERAGE\tCMO_TMB_SCORE\n',
+            'Sample1-N\t58\tNA\n',
+            'Sample1-T\t108\t100\n',
+            'Sample2-T\t502\t200\n'
+        ]
+        self.assertEqual(lines, expected_lines)
+        # the temporary sorted tables are removed
+        self.assertEqual(sorted(os.listdir(self.tmpdir)), ['output.txt', 'table1.tsv', 'table2.tsv'])
+
+    def test_merge_tables_sorted_cBioPortal_parity(self):
+        """
+        Test case for the sorted merge giving the same cBioPortal output as the default merge,
+        including the key column being moved to the front
+        """
+        lines1 = [
+            ['PATIENT_ID', 'SAMPLE_ID'],
+            ['Patient1', 'Sample1-N'],
+            ['Patient1', 'Sample1-T'],
+            ['Patient2', 'Sample2-T'],
+        ]
+        lines2 = [
+            ['SAMPLE_ID', 'CMO_TMB_SCORE'],
+            ['Sample1-T', '100'],
+            ['Sample2-T', '200'],
+        ]
+        table1 = self.write_table(self.tmpdir, filename = "table1.tsv", lines = lines1)
+        table2 = self.write_table(self.tmpdir, filename = "table2.tsv", lines = lines2)
+
+        outputs = []
+        for extra_args in [ [], ['--sorted'] ]:
+            output_file = os.path.join(self.tmpdir, "output.txt")
+            command = [script, table1, table2, '--key1', 'SAMPLE_ID', '--key2', 'SAMPLE_ID', '--output', output_file, '--cBioPortal', *extra_args]
+            returncode, proc_stdout, proc_stderr = self.run_command(command, validate = True, testcase = self)
+            with open(output_file) as fin:
+                outputs.append(fin.readlines())
+
+        self.assertEqual(outputs[1], outputs[0])
+        self.assertEqual(outputs[1][4], 'SAMPLE_ID\tPATIENT_ID\tCMO_TMB_SCORE\n')
+
+    def test_merge_multiple_tables(self):
+        """
+        Test case for merging more than two tables at once with each type of join
+        """
+        lines1 = [
+            ['# comment 1'],
+            ['SAMPLE_ID', 'PATIENT_ID'],
+            ['Sample1-T', 'Patient1'],
+            ['Sample2-T', 'Patient2'],
+            ['Sample3-T', 'Patient3'],
+        ]
+        lines2 = [
+            ['SampleID', 'CMO_TMB_SCORE'],
+            ['Sample2-T', '200'],
+            ['Sample1-T', '100'],
+            ['Sample4-T', '400'],
+        ]
+        lines3 = [
+            ['SAMPLE_ID', 'MSI_SCORE'],
+            ['Sample1-T', '1.5'],
+            ['Sample3-T', '3.5'],
+        ]
+        table1 = self.write_table(self.tmpdir, filename = "table1.tsv", lines = lines1)
+        table2 = self.write_table(self.tmpdir, filename = "table2.tsv", lines = lines2)
+        table3 = self.write_table(self.tmpdir, filename = "table3.tsv", lines = lines3)
+        output_file = os.path.join(self.tmpdir, "output.txt")
+
+        expected_records = {
+            'left': [
+                {'SAMPLE_ID': 'Sample1-T', 'PATIENT_ID': 'Patient1', 'CMO_TMB_SCORE': '100', 'MSI_SCORE': '1.5'},
+                {'SAMPLE_ID': 'Sample2-T', 'PATIENT_ID': 'Patient2', 'CMO_TMB_SCORE': '200', 'MSI_SCORE': 'NA'},
+                {'SAMPLE_ID': 'Sample3-T', 'PATIENT_ID': 'Patient3', 'CMO_TMB_SCORE': 'NA', 'MSI_SCORE': '3.5'}
+            ],
+            'inner': [
+                {'SAMPLE_ID': 'Sample1-T', 'PATIENT_ID': 'Patient1', 'CMO_TMB_SCORE': '100', 'MSI_SCORE': '1.5'}
+            ],
+            'outer': [
+                {'SAMPLE_ID': 'Sample1-T', 'PATIENT_ID': 'Patient1', 'CMO_TMB_SCORE': '100', 'MSI_SCORE': '1.5'},
+                {'SAMPLE_ID': 'Sample2-T', 'PATIENT_ID': 'Patient2', 'CMO_TMB_SCORE': '200', 'MSI_SCORE': 'NA'},
+                {'SAMPLE_ID': 'Sample3-T', 'PATIENT_ID': 'Patient3', 'CMO_TMB_SCORE': 'NA', 'MSI_SCORE': '3.5'},
+                {'SAMPLE_ID': 'Sample4-T', 'PATIENT_ID': 'NA', 'CMO_TMB_SCORE': '400', 'MSI_SCORE': 'NA'}
+            ]
+        }
+        for how in ['left', 'inner', 'outer']:
+            # the sorted merge gives the same rows since the first table is already sorted
+            for extra_args in [[], ['--sort-inputs']]:
+                command = [script, table1, table2, table3, '--keys', 'SAMPLE_ID', 'SampleID', 'SAMPLE_ID', '--how', how, '--output', output_file, *extra_args]
+                returncode, proc_stdout, proc_stderr = self.run_command(command, validate = True, testcase = self)
+
+                reader = TableReader(output_file)
+                comments = reader.comment_lines
+                records = [ rec for rec in reader.read() ]
+                self.assertEqual(comments, ['# comment 1\n'])
+                self.assertEqual(records, expected_records[how])
+
+        # a key is needed for each table
+        command = [script, table1, table2, table3, '--keys', 'SAMPLE_ID', 'SampleID', '--output', output_file]
+        returncode, proc_stdout, proc_stderr = self.run_command(command)
+        self.assertNotEqual(returncode, 0)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests cases for running the roslin_analysis_helper steps
+"""
+import os
+import sys
+import unittest
+
+THIS_DIR = os.path.dirname(os.path.realpath(__file__))
+PARENT_DIR = os.path.dirname(THIS_DIR)
+sys.path.insert(0, PARENT_DIR)
+from pluto.tools import PlutoTestCase
+from bin.roslin_analysis_helper import make_step, run_steps
+sys.path.pop(0)
+
+
+class TestRunSteps(PlutoTestCase):
+    def read_lines(self, filename):
+        with open(filename) as fin:
+            return([ line.strip() for line in fin ])
+
+    def test_run_steps_depends_order(self):
+        """
+        Test case for steps only starting after the steps they depend on have finished, even with several jobs
+        """
+        order_file = os.path.join(self.tmpdir, "order.txt")
+        steps = [
+            make_step('c', ['echo c >> ' + order_file], [], [], depends = ['a', 'b']),
+            make_step('b', ['sleep 0.2; echo b >> ' + order_file], [], [], depends = ['a']),
+            make_step('a', ['sleep 0.2; echo a >> ' + order_file], [], []),
+        ]
+        results = run_steps(steps, jobs = 3)
+        self.assertEqual(results, {'a': True, 'b': True, 'c': True})
+        self.assertEqual(self.read_lines(order_file), ['a', 'b', 'c'])
+
+    def test_run_steps_failed_depends(self):
+        """
+        Test case for skipping the steps that depend on a failed step, and removing the outputs of the failed step
+        """
+        failed_output = os.path.join(self.tmpdir, "failed.txt")
+        skipped_output = os.path.join(self.tmpdir, "skipped.txt")
+        other_output = os.path.join(self.tmpdir, "other.txt")
+        steps = [
+            make_step('failed', ['echo foo > ' + failed_output + '; false'], [], [failed_output]),
+            make_step('skipped', ['echo bar > ' + skipped_output], [], [skipped_output], depends = ['failed']),
+            make_step('other', ['echo baz > ' + other_output], [], [other_output]),
+        ]
+        results = run_steps(steps, jobs = 2)
+        self.assertEqual(results, {'failed': False, 'skipped': False, 'other': True})
+        self.assertFalse(os.path.exists(failed_output))
+        self.assertFalse(os.path.exists(skipped_output))
+        self.assertTrue(os.path.exists(other_output))
+
+    def test_run_steps_bad_depends(self):
+        """
+        Test case for circular dependencies and dependencies on unknown steps being errors
+        """
+        steps = [
+            make_step('a', ['true'], [], [], depends = ['b']),
+            make_step('b', ['true'], [], [], depends = ['a']),
+        ]
+        with self.assertRaisesRegex(Exception, 'Circular dependency'):
+            run_steps(steps)
+
+        steps = [ make_step('a', ['true'], [], [], depends = ['foo']) ]
+        with self.assertRaisesRegex(Exception, 'unknown steps: foo'):
+            run_steps(steps)
+
+    def test_run_steps_skip_up_to_date(self):
+        """
+        Test case for skipping the steps whose outputs are newer than their inputs
+        """
+        input_file = self.write_table(self.tmpdir, filename = "input.txt", lines = [['foo']])
+        output_file = os.path.join(self.tmpdir, "output.txt")
+        count_file = os.path.join(self.tmpdir, "count.txt")
+        steps = [ make_step('copy', ['echo run >> ' + count_file, 'cp ' + os.path.join(self.tmpdir, 'input*.txt') + ' ' + output_file], [os.path.join(self.tmpdir, 'input*.txt')], [output_file]) ]
+
+        run_steps(steps, skip_up_to_date = True)
+        run_steps(steps, skip_up_to_date = True)
+        self.assertEqual(self.read_lines(count_file), ['run'])
+
+        # the step runs again once the input is newer than the output
+        os.utime(input_file, (os.path.getmtime(output_file) + 10, os.path.getmtime(output_file) + 10))
+        results = run_steps(steps, skip_up_to_date = True)
+        self.assertEqual(results, {'copy': True})
+        self.assertEqual(self.read_lines(count_file), ['run', 'run'])
+
+        # without skip_up_to_date the step always runs
+        run_steps(steps)
+        self.assertEqual(self.read_lines(count_file), ['run', 'run', 'run'])
+
+if __name__ == "__main__":
+    unittest.main()
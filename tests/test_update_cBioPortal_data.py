@@ -14,6 +14,7 @@ sys.path.insert(0, PARENT_DIR)
 from pluto.tools import PlutoTestCase
 from settings import BIN_DIR
 from bin.update_cBioPortal_data import update_mutation_data
+from bin.update_cBioPortal_data import get_integer_copy_numbers
 from bin.cBioPortal_utils import MafReader
 from bin.cBioPortal_utils import MafWriter
 sys.path.pop(0)
@@ -246,6 +247,57 @@ class TestUpdateCBioMaf(PlutoTestCase):
     """
     Test case for updating the data_mutations_extended.txt maf file with columns from the Facets maf file
     """
+    def test_get_integer_copy_numbers(self):
+        """
+        Test that getting the integer copy numbers for a chunk of mutations at once gives the same values as updating them one at a time
+        """
+        facets_data = {
+        'Tumor1': { "genome_doubled": 'TRUE' },
+        'Tumor2': { "genome_doubled": 'FALSE' },
+        'Tumor3': { "genome_doubled": 'NA' }
+        }
+        copy_numbers = ['0', '1', '2', '3', '4', '6', '7', '9', '-1', '', 'NA', '2.0', ' 3', None]
+        rows = []
+        for tumor in ['Tumor1', 'Tumor2', 'Tumor3', 'Tumor4', None]:
+            for tcn in copy_numbers:
+                for lcn in copy_numbers:
+                    rows.append({'tumor': tumor, 'tcn': tcn, 'lcn': lcn, 'expected_alt_copies': '1'})
+
+        expected_values = []
+        for row in rows:
+            # update_mutation_data does not handle None values
+            if row['tcn'] is None or row['lcn'] is None:
+                expected_values.append('NA')
+            else:
+                expected_values.append(update_mutation_data(row, facets_data)['ASCN.ASCN_INTEGER_COPY_NUMBER'])
+        values = get_integer_copy_numbers(
+            sample_ids = [ row['tumor'] for row in rows ],
+            tcn_values = [ row['tcn'] for row in rows ],
+            lcn_values = [ row['lcn'] for row in rows ],
+            facets_data = facets_data)
+        self.assertEqual(values, expected_values)
+        self.assertEqual(set(values), {'-2', '-1', '0', '1', '2', 'NA'})
+
+        # run the CLI with and without batches
+        facets_lines = [
+        ['sample', 'run_type', 'purity', 'ploidy', 'facets_version', 'genome_doubled'],
+        ['Tumor1.Normal1', 'hisens', '0.3', '2.1', '0.5.14', 'TRUE'],
+        ['Tumor2.Normal2', 'hisens', '0.4', '1.9', '0.5.14', 'FALSE']
+        ]
+        maf_lines = [ ['tumor', 'tcn', 'lcn', 'expected_alt_copies'] ] + [ [ row['tumor'], row['tcn'], row['lcn'], row['expected_alt_copies'] ] for row in rows if None not in row.values() ]
+        facets_file = self.write_table(self.tmpdir, filename = "facets.txt", lines = facets_lines)
+        input_file = self.write_table(self.tmpdir, filename = "input.maf", lines = maf_lines)
+        output_lines = []
+        for args in [ [], ['--batch', '--chunk-size', '7'] ]:
+            output_file = os.path.join(self.tmpdir, "output.maf")
+            command = [ portal_script, 'mutations', '--input', input_file, '--output', output_file, '--facets-txt', facets_file, *args ]
+            returncode, proc_stdout, proc_stderr = self.run_command(command, validate = True, testcase = self)
+            with open(output_file) as fin:
+                output_lines.append(fin.readlines())
+        self.assertEqual(output_lines[0], output_lines[1])
+        self.assertEqual(len(output_lines[1]), len(maf_lines))
+        self.assertTrue(any([ line.endswith('\tFACETS\t-1\n') for line in output_lines[1] ]))
+
     def setUp(self):
         super().setUp()
         self.maf_row1 = {
@@ -388,9 +440,33 @@ class TestUpdateCBioMaf(PlutoTestCase):
         for i, mut in enumerate(mutations):
             self.assertDictEqual(dict(**mut), expected_mutations[i])
 
+    def test_merge_facets_portal_maf_partitioned(self):
+        """
+        Test that merging the mafs in partitions on disk gives the same output as merging them in memory
+        """
+        maf_rows = [ self.maf_row1, self.maf_row2, self.maf_row3 ]
+        maf_lines = self.dicts2lines(dict_list = maf_rows, comment_list = self.demo_comments)
+        facets_rows = [ self.facets_row1, self.facets_row2, self.facets_row3 ]
+        facets_lines = self.dicts2lines(dict_list = facets_rows, comment_list = self.demo_comments)
+        input_maf_file = self.write_table(self.tmpdir, filename = "input.maf", lines = maf_lines)
+        input_facets_file = self.write_table(self.tmpdir, filename = "facets.maf", lines = facets_lines)
 
+        expected_file = os.path.join(self.tmpdir, "expected.txt")
+        command = [ portal_script, 'merge_mafs', '--input', input_maf_file, '--facets-maf', input_facets_file, '--output', expected_file ]
+        returncode, proc_stdout, proc_stderr = self.run_command(command, validate = True, testcase = self)
 
+        output_file = os.path.join(self.tmpdir, "output.txt")
+        command = [ portal_script, 'merge_mafs', '--input', input_maf_file, '--facets-maf', input_facets_file, '--output', output_file, '--max-index-rows', '1' ]
+        returncode, proc_stdout, proc_stderr = self.run_command(command, validate = True, testcase = self)
 
+        with open(expected_file) as fin:
+            expected_lines = fin.readlines()
+        with open(output_file) as fin:
+            lines = fin.readlines()
+        self.assertEqual(lines, expected_lines)
+        self.assertEqual([ line.split('\t')[-1].strip() for line in lines[-3:] ], ['1', '2', '.'])
+        # the partition files should be cleaned up
+        self.assertEqual(sorted(os.listdir(self.tmpdir)), ['expected.txt', 'facets.maf', 'input.maf', 'output.txt'])
 
     def test_maf_to_portal_1(self):
         """
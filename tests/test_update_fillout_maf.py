@@ -139,6 +139,28 @@ class TestUpdateFilloutMaf(PlutoTestCase):
         self.assertEqual(comments, expected_comments)
         self.assertEqual(mutations, expected_mutations)
 
+    def test_update_maf_stdin_stdout(self):
+        """
+        Test that the script gives the same output when it is piped from stdin to stdout
+        """
+        maf_rows = [ self.maf_row1, self.maf_row2, self.maf_row3, self.maf_row4 ]
+        maf_lines = self.dicts2lines(dict_list = maf_rows, comment_list = self.comments)
+        input_file = self.write_table(self.tmpdir, filename = "input.maf", lines = maf_lines)
+        output_file = os.path.join(self.tmpdir, "output.txt")
+        piped_output_file = os.path.join(self.tmpdir, "output.piped.txt")
+        command = [script, input_file, output_file]
+        returncode, proc_stdout, proc_stderr = self.run_command(command, validate = True, testcase = self)
+
+        command = ['bash', '-c', 'cat "{}" | "{}" > "{}"'.format(input_file, script, piped_output_file)]
+        returncode, proc_stdout, proc_stderr = self.run_command(command, validate = True, testcase = self)
+
+        with open(output_file) as fin:
+            lines = fin.readlines()
+        with open(piped_output_file) as fin:
+            piped_lines = fin.readlines()
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(piped_lines, lines)
+
 
 if __name__ == "__main__":
     unittest.main()